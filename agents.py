@@ -1,48 +1,45 @@
-import re
+import hashlib
+import threading
 from dataclasses import dataclass
-from typing import Any
+from functools import lru_cache
+from typing import Any, Optional
 from pydantic import BaseModel, Field
-from pydantic_ai import Agent
 from prompts import sys_prompt, answer_sys
-from db import get_connection
+from db import explain_sql, run_in_db_thread
+from sql_cache import SQLCache
+from result_cache import cached_fetch
+from result_format import encode_result
+from sql_guard import check_sql, guard_sql
+from tracing import annotate, span, startup_stage, usage_tokens
 from get_data import calculate_total_energy, calculate_specific_yield, calculate_temperature_corrected_pr
 
 
 # Database configuration
-TABLE = get_connection()
+TABLE_NAME = "solar"
 DATE_COL = "timestamp"
 ROW_LIMIT = 50
 ANSWER_ROWS_LIMIT = 200
+# How query results are encoded for the LLM: 'auto', 'columnar', 'csv', 'markdown', 'summary' or 'records'
+ANSWER_FORMAT = "auto"
+ANSWER_TOKEN_BUDGET = 6000  # larger encodings fall back to the summary format
+TOOL_ROWS_LIMIT = 10
+STREAM_ANSWER = True  # stream the natural-language answer into the UI as it is generated
+SQL_RETRIES = 2  # times a query that DuckDB rejects is sent back to sql_agent with the error
 
 MODEL_NAME = "gpt-5-mini"
 AGENT_SPEC = f"openai:{MODEL_NAME}"
 
-FORBIDDEN_SQL_KEYWORDS = (
-    "delete","update","insert","alter","drop","truncate","create","replace","grant","revoke",
-    "attach","detach","copy","load","export","pragma","call","vacuum","set",
-)
 DESTRUCTIVE_INTENT_WORDS = (
     "delete","remove","drop","truncate","update","insert","modify","change","alter","create",
     "add column","erase",
 )
 
-def _strip_sql_comments(sql: str) -> str:
-    sql = re.sub(r"--.*?$", "", sql, flags=re.MULTILINE)
-    sql = re.sub(r"/\*.*?\*/", "", sql, flags=re.DOTALL)
-    return sql
-
 def is_user_intent_destructive(question: str) -> bool:
     q = question.lower()
     return any(w in q for w in DESTRUCTIVE_INTENT_WORDS)
 
 def is_select_only(sql: str) -> bool:
-    s = _strip_sql_comments(sql).strip().lower()
-    if ";" in s:
-        return False
-    starts_ok = s.startswith("select") or s.startswith("with ")
-    if not starts_ok:
-        return False
-    return not any(re.search(rf"\b{kw}\b", s) for kw in FORBIDDEN_SQL_KEYWORDS)
+    return check_sql(sql).ok
 
 # ======================= SQL Agent =======================
 class SQLResult(BaseModel):
@@ -50,13 +47,17 @@ class SQLResult(BaseModel):
 
 @dataclass
 class Deps:
-    conn: Any  # DatabaseConnection
+    conn: Any = None  # DatabaseConnection; tools borrow their own pooled connection when None
 
-sql_agent = Agent[Deps, SQLResult](AGENT_SPEC, output_type=SQLResult, deps_type=Deps)
+def build_sql_system_prompt() -> str:
+    """sql_agent's system prompt, with the schema catalog of the current store (catalog.py)."""
+    from catalog import schema_prompt
 
-@sql_agent.system_prompt
-async def sql_system_prompt() -> str:
-    base = sys_prompt(TABLE, DATE_COL)
+    return _sql_system_prompt(schema_prompt())
+
+@lru_cache(maxsize=2)
+def _sql_system_prompt(schema: str) -> str:
+    base = sys_prompt(TABLE_NAME, DATE_COL, schema)
     guard = (
         "\n\nCRITICAL RULES:\n"
         "- Only generate a single-statement SELECT (optionally WITH ... SELECT).\n"
@@ -66,98 +67,264 @@ async def sql_system_prompt() -> str:
     )
     return base + guard
 
-# ======================= NL Answer Agent =======================
-class AnswerOut(BaseModel):
-    final_answer: str = Field(
-        ..., description="Natural-language answer based strictly on provided rows"
+async def sql_system_prompt() -> str:
+    return build_sql_system_prompt()
+
+# ======================= SQL Cache =======================
+SQL_CACHE = SQLCache()
+
+@dataclass
+class GeneratedSQL:
+    sql: str
+    cache: Optional[str] = None  # "exact", "similar" or None when the LLM was called
+
+def sql_prompt_hash() -> str:
+    """Changes with the prompt, and so with the catalog: cached SQL from older data is not reused."""
+    return _prompt_hash(build_sql_system_prompt())
+
+@lru_cache(maxsize=2)
+def _prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+
+def generate_sql(question: str, deps: Deps) -> GeneratedSQL:
+    """
+    Translate a question to SQL, reusing a cached query when one matches.
+
+    Cached SQL is re-checked with is_select_only before it is returned; entries that
+    fail the check are dropped and the question goes to sql_agent instead.
+    """
+    cached = lookup_cached_sql(question)
+    if cached is not None:
+        return cached
+    res = get_sql_agent().run_sync(question, deps=deps)
+    annotate(**usage_tokens(res.usage))
+    return GeneratedSQL(res.output.sql_query.strip().rstrip(";"))
+
+async def generate_sql_async(question: str, deps: Deps) -> GeneratedSQL:
+    """Async variant of generate_sql; awaits sql_agent.run instead of blocking on run_sync."""
+    cached = lookup_cached_sql(question)
+    if cached is not None:
+        return cached
+    res = await get_sql_agent().run(question, deps=deps)
+    annotate(**usage_tokens(res.usage))
+    return GeneratedSQL(res.output.sql_query.strip().rstrip(";"))
+
+def is_sql_error(error: Exception) -> bool:
+    """Errors in the query itself (binder, parser, conversion, timeout), which a new query can fix."""
+    import duckdb
+
+    return isinstance(error, duckdb.Error) or isinstance(error.__cause__, duckdb.Error)
+
+def repair_prompt(question: str, sql: str, error: Exception, plan: Optional[str]) -> str:
+    prompt = (
+        f"QUESTION:\n{question}\n\n"
+        f"THIS SQL FAILED:\n{sql}\n\n"
+        f"DUCKDB ERROR:\n{type(error).__name__}: {error}\n\n"
+    )
+    if plan:
+        prompt += f"QUERY PLAN (EXPLAIN):\n{plan}\n\n"
+    return prompt + "Write a corrected query that answers the question. Use only the columns listed in the schema."
+
+async def repair_sql_async(question: str, sql: str, error: Exception, deps: Deps) -> GeneratedSQL:
+    """
+    Ask sql_agent for a corrected query, given the failed ``sql``, DuckDB's error and,
+    when the query plans (runtime errors, timeouts), its EXPLAIN output.
+    """
+    with span("sql.repair", error=type(error).__name__) as s:
+        plan = await run_in_db_thread(explain_sql, sql)
+        res = await get_sql_agent().run(repair_prompt(question, sql, error, plan), deps=deps)
+        s.set(explained=plan is not None, **usage_tokens(res.usage))
+    return GeneratedSQL(res.output.sql_query.strip().rstrip(";"))
+
+def lookup_cached_sql(question: str) -> Optional[GeneratedSQL]:
+    prompt_hash = sql_prompt_hash()
+    hit = SQL_CACHE.get(question, prompt_hash)
+    if hit is not None and is_select_only(hit.sql):
+        annotate(cache_hit=True, sql_cache=hit.kind)
+        return GeneratedSQL(hit.sql, hit.kind)
+    if hit is not None:
+        SQL_CACHE.invalidate(hit.question, prompt_hash)
+    annotate(cache_hit=False)
+    return None
+
+def remember_sql(question: str, generated: GeneratedSQL) -> None:
+    """Cache SQL that passed the safety check and executed successfully."""
+    if generated.cache is None and is_select_only(generated.sql):
+        SQL_CACHE.put(question, sql_prompt_hash(), generated.sql)
+
+def build_answer_prompt(question: str, df, rows_total: Optional[int] = None) -> str:
+    with span("encode") as s:
+        encoded = encode_result(df, ANSWER_FORMAT, ANSWER_ROWS_LIMIT, ANSWER_TOKEN_BUDGET, rows_total)
+        s.set(format=encoded.fmt, rows_included=encoded.rows_included, result_tokens=encoded.tokens)
+    columns = list(df.columns)
+    return (
+        f"QUESTION:\n{question}\n\n"
+        f"ROW_COUNT: {encoded.rows_total}\n"
+        f"ROWS_SHOWN: {encoded.rows_included}\n"
+        f"COLUMNS: {columns}\n"
+        f"{encoded.description}:\n"
+        f"{encoded.text}"
     )
 
-answer_agent = Agent[None, AnswerOut](AGENT_SPEC, output_type=AnswerOut)
+def answer_text(output: Any) -> str:
+    return output if isinstance(output, str) else str(output)
 
-@answer_agent.system_prompt
-async def sql_to_nl_prompt() -> str:
-    return answer_sys()
 # ======================= AU Tools =======================
 
-answer_agent = Agent(
-    AGENT_SPEC,
-    system_prompt=(
-        "You are a solar farms assistant. Use these tools:\n\n"
-        "- execute_sql_query(query_description): Query the database for solar farm information.\n\n"
-        "- get_total_energy(data, aggregation='default'): Calculate cumulative AC energy output.\n\n"
-        "- get_specific_yield(data, P_STC=1058.4, aggregation='default'): Calculate Specific Yield (kWh/kWp).\n\n"
-        "- get_temperature_corrected_pr(data, P_STC=1058.4, gamma=-0.004, aggregation='default'): Calculate Temperature-Corrected Performance Ratio (PR).\n\n"
-        "For queries that needs tools:\n"
-        "1. If user asks , first query the database to get details\n"
-        "2. Use the retrieved data and aggregation (if needed) and pass to tools\n"
-        "Be concise and factual."
-    ),
-    deps_type=Deps,
+ANSWER_TOOLS_PROMPT = (
+    "You are a solar farms assistant. Use these tools:\n\n"
+    "- execute_sql_query(query_description): Query the database for solar farm information.\n\n"
+    "- get_total_energy(start_date, end_date, aggregation='default', site_id=None): Calculate cumulative AC energy output.\n\n"
+    "- get_specific_yield(start_date, end_date, P_STC=None, aggregation='default', site_id=None): Calculate Specific Yield (kWh/kWp).\n\n"
+    "- get_temperature_corrected_pr(start_date, end_date, P_STC=None, gamma=-0.004, aggregation='default', site_id=None): Calculate Temperature-Corrected Performance Ratio (PR).\n\n"
+    "For queries that needs tools:\n"
+    "1. Work out the date range (inclusive, YYYY-MM-DD; omit both for all data) and aggregation from the question\n"
+    "2. Call the metric tool directly; it computes the metric in the database\n"
+    "3. Pass site_id only when the question names a site; omit it for the whole fleet, and leave P_STC unset unless the user gives a capacity\n"
+    "Be concise and factual."
 )
 
-@answer_agent.tool
-def execute_sql_query(ctx, query_description: str) -> str:
-    """Tool: Execute SQL query to get film data from database."""
-    try:
-        # Generate SQL from description
-        sql_res = sql_agent.run_sync(query_description, deps=ctx.deps)
-        sql = sql_res.output.sql_query.strip().rstrip(";")
-        
-        if not is_select_only(sql):
-            return "Error: Cannot execute non-SELECT queries"
+async def execute_sql_query(ctx, query_description: str) -> str:
+    """Tool: Execute SQL query to get solar data from database."""
+    with span("tool.execute_sql_query"):
+        try:
+            # Generate SQL from description
+            generated = await generate_sql_async(query_description, ctx.deps)
+            sql = generated.sql
         
-        # Execute query
-        df = ctx.deps.conn.execute(sql).fetchdf()
+            # Validate, rewrite and execute on a pooled connection in a worker thread, off the event loop;
+            # queries DuckDB rejects go back to sql_agent with the error, up to SQL_RETRIES times
+            for attempt in range(SQL_RETRIES + 1):
+                try:
+                    fetched = await run_in_db_thread(_guarded_fetch, sql)
+                    break
+                except Exception as e:
+                    if attempt == SQL_RETRIES or not is_sql_error(e):
+                        raise
+                    generated = await repair_sql_async(query_description, sql, e, ctx.deps)
+                    sql = generated.sql
+            if fetched is None:
+                return "Error: Cannot execute non-SELECT queries"
+            remember_sql(query_description, generated)
         
-        if len(df) == 0:
-            return "No data found for the query"
+            if fetched.total_rows == 0:
+                return "No data found for the query"
         
-        # Return as JSON string
-        return df.head(10).to_json(orient="records", date_format="iso")
-    except Exception as e:
-        return f"Error executing query: {str(e)}"
+            # Return in the configured result encoding
+            encoded = encode_result(fetched.df, ANSWER_FORMAT, TOOL_ROWS_LIMIT, ANSWER_TOKEN_BUDGET, fetched.total_rows)
+            return f"ROW_COUNT: {encoded.rows_total}\n{encoded.description}:\n{encoded.text}"
+        except Exception as e:
+            return f"Error executing query: {str(e)}"
     
-@answer_agent.tool
-def get_total_energy(data, aggregation='default') -> Any:
+def _guarded_fetch(conn, sql: str):
+    checked = guard_sql(conn, sql)
+    annotate(rewrites=",".join(checked.rewrites) or None)
+    return cached_fetch(conn, checked.sql) if checked.ok else None
+
+def _metric_output(value: Any) -> Any:
+    """Plain number, or the per-period breakdown in the configured result encoding."""
+    if isinstance(value, (int, float)):
+        return value
+    encoded = encode_result(value.reset_index(), ANSWER_FORMAT, ANSWER_ROWS_LIMIT, ANSWER_TOKEN_BUDGET)
+    return f"{encoded.description}:\n{encoded.text}"
+
+async def get_total_energy(ctx, start_date: Optional[str] = None, end_date: Optional[str] = None, aggregation: str = 'default', site_id: Optional[str] = None) -> Any:
     """
     Calculate cumulative AC energy output for the specified period.
 
     Parameters:
-        data (DataFrame): The input data containing 'timestamp' and 'Active_Power'.
+        start_date (str): First day to include (YYYY-MM-DD), or None for the start of the data.
+        end_date (str): Last day to include (YYYY-MM-DD), or None for the end of the data.
         aggregation (str): Aggregation level - 'default', 'hourly', 'daily', 'monthly', 'yearly'.
+        site_id (str): Restrict to one site, or None for all sites.
 
     Returns:
-        float or DataFrame: Total energy in kWh, with breakdown if requested.
+        float or table: Total energy in kWh, with breakdown if requested.
     """
-    return calculate_total_energy(data, aggregation)
+    with span("tool.get_total_energy"):
+        value = await run_in_db_thread(calculate_total_energy, aggregation, start_date, end_date, site_id)
+        return _metric_output(value)
 
-@answer_agent.tool
-def get_specific_yield(data, P_STC=1058.4, aggregation='default'):
+async def get_specific_yield(ctx, start_date: Optional[str] = None, end_date: Optional[str] = None, P_STC: Optional[float] = None, aggregation: str = 'default', site_id: Optional[str] = None) -> Any:
     """
     Calculate Specific Yield (kWh/kWp) for the specified period.
 
     Parameters:
-        data (DataFrame): The input data containing 'timestamp' and 'Active_Power'.
-         aggregation (str): Aggregation level - 'default', 'hourly', 'daily', 'monthly', 'yearly'.
+        start_date (str): First day to include (YYYY-MM-DD), or None for the start of the data.
+        end_date (str): Last day to include (YYYY-MM-DD), or None for the end of the data.
+        P_STC (float): Installed capacity (kWp), or None for the site's (or fleet's) capacity from site_metadata.
+        aggregation (str): Aggregation level - 'default', 'hourly', 'daily', 'monthly', 'yearly'.
+        site_id (str): Restrict to one site, or None for all sites.
 
     Returns:
-        float or DataFrame: Specific Yield (kWh/kWp) for the time period, with breakdown if requested.
+        float or table: Specific Yield (kWh/kWp) for the time period, with breakdown if requested.
     """
-    return calculate_specific_yield(data, P_STC, aggregation)
+    with span("tool.get_specific_yield"):
+        value = await run_in_db_thread(calculate_specific_yield, P_STC, aggregation, start_date, end_date, site_id)
+        return _metric_output(value)
 
-@answer_agent.tool
-def get_temperature_corrected_pr(data, P_STC=1058.4, gamma=-0.004, aggregation='default'):
+async def get_temperature_corrected_pr(ctx, start_date: Optional[str] = None, end_date: Optional[str] = None, P_STC: Optional[float] = None, gamma: float = -0.004, aggregation: str = 'default', site_id: Optional[str] = None) -> Any:
     """
     Calculate Temperature-Corrected Performance Ratio (PR) for the specified period.
 
     Parameters:
-        data (DataFrame): Must include 'timestamp', 'Active_Power',
-                          'Global_Horizontal_Radiation', and 'Weather_Temperature_Celsius'.
-        P_STC (float): Rated DC capacity at STC (kW).
+        start_date (str): First day to include (YYYY-MM-DD), or None for the start of the data.
+        end_date (str): Last day to include (YYYY-MM-DD), or None for the end of the data.
+        P_STC (float): Rated DC capacity at STC (kW), or None for the capacity from site_metadata.
         gamma (float): Temperature coefficient (-0.004/°C for poly-Si).
         aggregation (str): 'default', 'hourly', 'daily', 'monthly', or 'yearly'.
+        site_id (str): Restrict to one site, or None for all sites.
 
     Returns:
-        float or DataFrame: Temperature-corrected PR as percentage.
+        float or table: Temperature-corrected PR as percentage.
     """
-    return calculate_temperature_corrected_pr(data, P_STC, gamma, aggregation)
\ No newline at end of file
+    with span("tool.get_temperature_corrected_pr"):
+        value = await run_in_db_thread(calculate_temperature_corrected_pr, P_STC, gamma, aggregation, start_date, end_date, site_id)
+        return _metric_output(value)
+
+# ======================= Agent construction =======================
+# pydantic_ai is slow to import, so the agents are built on first use rather than at import time
+_agents = {}
+_agents_lock = threading.Lock()
+
+def _build_sql_agent():
+    from pydantic_ai import Agent
+
+    agent = Agent[Deps, SQLResult](AGENT_SPEC, output_type=SQLResult, deps_type=Deps, defer_model_check=True)
+    agent.system_prompt(sql_system_prompt)
+    return agent
+
+def _build_answer_agent():
+    from pydantic_ai import Agent
+
+    # Tool usage, then the rules for reading ROW_COUNT / ROWS_SHOWN / the result summary in build_answer_prompt
+    agent = Agent(AGENT_SPEC, system_prompt=(ANSWER_TOOLS_PROMPT, answer_sys()), deps_type=Deps, defer_model_check=True)
+    for tool in (execute_sql_query, get_total_energy, get_specific_yield, get_temperature_corrected_pr):
+        agent.tool(tool)
+    return agent
+
+def _get_agent(name: str, build):
+    agent = _agents.get(name)
+    if agent is None:
+        with _agents_lock:
+            agent = _agents.get(name)
+            if agent is None:
+                with startup_stage(name):
+                    agent = _agents[name] = build()
+    return agent
+
+def get_sql_agent():
+    """The question -> SQL agent, built on first use."""
+    return _get_agent("sql_agent", _build_sql_agent)
+
+def get_answer_agent():
+    """The answer agent with the metric tools, built on first use."""
+    return _get_agent("answer_agent", _build_answer_agent)
+
+def __getattr__(name: str):
+    # Keep ``agents.sql_agent`` / ``agents.answer_agent`` working without building them at import
+    if name == "sql_agent":
+        return get_sql_agent()
+    if name == "answer_agent":
+        return get_answer_agent()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,10 +1,17 @@
+import html
 import json
+import os
+from datetime import timedelta
 import streamlit as st
-import pandas as pd
 from pathlib import Path
 from dotenv import load_dotenv
-from db import get_connection
-import agents
+import tracing
+
+# Light imports only: pandas, duckdb and pydantic_ai load on first use, inside load_backend
+with tracing.startup_stage("imports"):
+    import agents
+    import export
+    import pipeline
 # ======================= Setup =======================
 
 load_dotenv()
@@ -18,10 +25,59 @@ def load_css(css_path: str = "styles.css"):
     st.markdown(f"<style>{p.read_text(encoding='utf-8')}</style>", unsafe_allow_html=True)
 
 load_css("styles.css")
+tracing.start_metrics_server()  # no-op unless SOLAR_METRICS_PORT is set
+
+@st.cache_resource(show_spinner="Opening the solar store and building the agents...")
+def load_backend() -> list:
+    """
+    Open the DuckDB pool and build the prompts and agents once per process; every
+    session and rerun reuses them. Returns the startup-time report.
+    """
+    import db
+
+    db.get_pool()
+    with tracing.startup_stage("prompts"):
+        agents.build_sql_system_prompt()
+    agents.get_sql_agent()
+    agents.get_answer_agent()
+    report = tracing.startup_report()
+    print("✓ Startup: " + ", ".join(f"{r['stage']} {r['ms']:.0f} ms" for r in report))
+    return report
+
+def answer_card(text: str) -> str:
+    """The answer as an HTML card; escaped, with line breaks kept (template answers span several lines)."""
+    body = html.escape(text).replace("\n", "<br>")
+    return f"<div class='card' style='color:#9333ea; font-weight:500;'>{body}</div>"
+
+@st.fragment
+def render_chart(sql: str, time_col: str, columns: list) -> None:
+    """
+    Line chart of a time-series result, downsampled inside DuckDB (downsample.py) to about
+    one point per pixel. Only this fragment reruns when the series or the time range change,
+    so zooming in re-buckets the range at a finer width, down to the raw rows.
+    """
+    import downsample
+
+    first, last, _ = downsample.chart_bounds(sql, time_col)
+    if first is None or first == last:
+        st.info("Not enough points to chart.")
+        return
+    selected = st.multiselect("Series", columns, default=columns[:1])
+    if not selected:
+        st.info("Pick a series to chart.")
+        return
+    step = timedelta(minutes=max(5, int((last - first).total_seconds() // 60 // 2000)))
+    start, end = st.slider("Time range (drag to zoom)", min_value=first, max_value=last, value=(first, last),
+                           step=step, format="YYYY-MM-DD HH:mm")
+    series = downsample.downsample_series(sql, time_col, selected, start, end)
+    st.line_chart(series.df, use_container_width=True)
+    detail = f"{series.bucket} buckets (min / avg / max)" if series.bucket else "full resolution"
+    st.caption(f"{len(series.df):,} points from {series.rows:,} rows • {detail}")
 
 # ======================= UI =======================
 st.title("☀️ Solar PV Performance Analytics Chatbot")
 st.caption("Ask about solar PV performance metrics, energy output, and more.")
+show_debug = st.sidebar.toggle("Debug", value=os.getenv("SOLAR_DEBUG", "") not in ("", "0", "false"))
 
 with st.form("ask_form", clear_on_submit=False):
     question = st.text_input(
@@ -30,116 +86,90 @@ with st.form("ask_form", clear_on_submit=False):
     )
     ask = st.form_submit_button("Ask", type="primary")
 
+# After the form, so the page is on screen while the first session warms up
+startup_report = load_backend()
+with st.sidebar.expander("Startup time"):
+    st.caption(f"{sum(r['ms'] for r in startup_report):,.0f} ms to first question")
+    st.dataframe(startup_report, use_container_width=True, hide_index=True)
+
 if ask:
     if not question.strip():
         st.warning("Please enter a question before clicking Ask.")
         st.stop()
     
-    sql = "(n/a)"
-    df = pd.DataFrame()
+    import pandas as pd
+
     predict_json = None
-    final_answer = ""
-    
-    # Create fresh connection for this request
-    conn = None
-    try:
-        conn = get_connection()
-
-        if agents.is_user_intent_destructive(question):
-            st.error("Sorry, I can't delete or modify data. This app is read-only.")
-            st.stop()
-
-        with st.spinner("Generating SQL & running..."):
-            deps = agents.Deps(conn=conn)
-            try:
-                res = agents.sql_agent.run_sync(question, deps=deps)
-                sql = res.output.sql_query.strip().rstrip(";")
-            except Exception as e:
-                st.error(f"SQL generation failed: {e}")
-                st.stop()
-
-            if not agents.is_select_only(sql):
-                st.error("Blocked a non-SELECT or potentially destructive SQL.")
-                st.subheader("Generated (blocked) SQL")
-                st.code(sql, language="sql")
-                st.stop()
-
-            try:
-                # Reconnect if connection was closed
-                if conn.is_closed():
-                    conn.reconnect()
-                
-                df = conn.execute(sql).fetchdf()
-            except Exception as e:
-                st.error(f"Query failed: {e}")
-                st.subheader("Generated SQL")
-                st.code(sql, language="sql")
-                st.stop()
-
-            rows_for_llm = json.loads(
-                df.head(agents.ANSWER_ROWS_LIMIT).to_json(orient="records", date_format="iso")
-            )
-            row_count = len(rows_for_llm)
-            columns = list(df.columns)
-            prompt = (
-                f"QUESTION:\n{question}\n\n"
-                f"ROW_COUNT: {row_count}\n"
-                f"COLUMNS: {columns}\n"
-                "SQL RESULT ROWS (JSON array of objects):\n"
-                f"{json.dumps(rows_for_llm, ensure_ascii=False)}"
-            )
-            try:
-                ans = agents.answer_agent.run_sync(prompt)
-                if isinstance(ans.output, str):
-                    final_answer = ans.output
-                else:
-                    final_answer = ans.output.final_answer
-            except Exception as e:
-                final_answer = f"Could not summarize result. Error: {e}"
-    
-    finally:
-        # Always close connection after request
-        if conn:
-            try:
-                conn.close()
-            except:
-                pass  # Ignore errors on close
+
+    with st.spinner("Generating SQL & running..."):
+        if agents.STREAM_ANSWER:
+            # Only SQL + query here; the answer streams into its tab below
+            result = pipeline.prepare_query_sync(question)
+        else:
+            result = pipeline.answer_question_sync(question)
+
+    if result.stage in ("intent", "sql"):
+        st.error(result.error)
+        st.stop()
+    if result.stage in ("guard", "query"):
+        st.error(result.error)
+        st.subheader("Generated (blocked) SQL" if result.stage == "guard" else "Generated SQL")
+        st.code(result.sql, language="sql")
+        st.stop()
+
+    sql = result.sql
+    df = result.df if result.df is not None else pd.DataFrame()
+    final_answer = result.answer
+    sql_cache_kind = result.sql_cache
+    result_cached = result.result_cached
 
     # ====== Output ======
     st.markdown(f"#### 🧠 Answer to: *{question}*")
-    tab1, tab2, tab3, tab4 = st.tabs(["🧾 Answer", "🧮 SQL", "📊 Table", "🧱 JSON"])
+    tab_names = ["🧾 Answer", "🧮 SQL", "📊 Table", "📈 Chart", "🧱 JSON"] + (["🐞 Debug"] if show_debug else [])
+    tab1, tab2, tab3, chart_tab, tab4, *debug_tab = st.tabs(tab_names)
 
     with tab1:
-        st.markdown(
-            f"<div class='card' style='color:#9333ea; font-weight:500;'>{final_answer}</div>",
-            unsafe_allow_html=True,
-        )
+        answer_box = st.empty()
+        answer_box.markdown(answer_card(final_answer), unsafe_allow_html=True)
     with tab2:
+        if result.fast_path is not None:
+            st.caption("⚡ Answered from a metric template, without the LLM")
+        if sql_cache_kind:
+            st.caption(f"⚡ SQL served from cache ({sql_cache_kind} match)")
+        if result.rewrites:
+            st.caption(f"🔧 Rewritten for speed: {', '.join(result.rewrites)}")
+        if result.attempts > 1:
+            st.caption(f"🔁 Corrected after {result.attempts - 1} failed attempt(s)")
         st.code(sql, language="sql")
     with tab3:
-        st.caption(f"{len(df)} rows • showing up to {min(len(df), agents.ROW_LIMIT)}")
+        cached_note = " • ⚡ cached result" if result_cached else ""
+        fetched_note = f" • first {len(df):,} fetched" if result.total_rows > len(df) else ""
+        st.caption(f"{result.total_rows:,} rows • showing up to {min(len(df), agents.ROW_LIMIT)}{fetched_note}{cached_note}")
         if len(df) > 0:
             st.dataframe(df.head(agents.ROW_LIMIT), use_container_width=True)
-            c1, c2 = st.columns(2)
-            with c1:
-                st.download_button(
-                    "Download CSV",
-                    df.to_csv(index=False).encode("utf-8"),
-                    file_name="query_result.csv",
-                    mime="text/csv",
-                    use_container_width=True,
-                )
-            with c2:
-                st.download_button(
-                    "Download JSON",
-                    df.to_json(orient="records", date_format="iso"),
-                    file_name="query_result.json",
-                    mime="application/json",
-                    use_container_width=True,
-                )
+            # Files are written by DuckDB only when a button is clicked, with every row of the query
+            for col, (fmt, (_, ext, mime, label)) in zip(st.columns(len(export.EXPORT_FORMATS)), export.EXPORT_FORMATS.items()):
+                with col:
+                    st.download_button(
+                        f"Download {label}",
+                        export.export_loader(sql, fmt),
+                        file_name=f"query_result.{ext}",
+                        mime=mime,
+                        on_click="ignore",
+                        use_container_width=True,
+                    )
         else:
             st.info("No table data for this query type.")
 
+    with chart_tab:
+        import downsample
+
+        time_series = downsample.time_series_columns(df) if len(df) > 0 else None
+        if time_series is None:
+            st.info("No time series to chart for this query.")
+        else:
+            render_chart(sql, *time_series)
+
     with tab4:
         # Show API response JSON for predictions, otherwise show dataframe JSON
         if predict_json is not None:
@@ -148,4 +178,23 @@ if ask:
             preview_json = df.head(agents.ROW_LIMIT).to_json(orient="records", date_format="iso", indent=2)
         else:
             preview_json = "{}"
-        st.code(preview_json, language="json")
\ No newline at end of file
+        st.code(preview_json, language="json")
+
+    if agents.STREAM_ANSWER:
+        # Rendered last so the SQL, Table and JSON tabs are already on screen
+        partial = ""
+        for delta in pipeline.iter_answer_sync(result):
+            partial += delta
+            answer_box.markdown(answer_card(partial + "▌"), unsafe_allow_html=True)
+        answer_box.markdown(answer_card(result.answer), unsafe_allow_html=True)
+
+    if debug_tab:
+        # Rendered after the answer so the trace includes the answer stage
+        with debug_tab[0]:
+            trace = result.trace.to_dict() if result.trace is not None else {"spans": []}
+            st.caption(f"Trace {trace.get('trace_id', '-')} • {trace.get('duration_ms', 0):.1f} ms")
+            st.dataframe(pd.DataFrame(trace["spans"]), use_container_width=True)
+            st.markdown("**Stage latency (this process)**")
+            st.dataframe(pd.DataFrame(tracing.REGISTRY.summary()), use_container_width=True)
+            with st.expander("Prometheus metrics"):
+                st.code(tracing.REGISTRY.prometheus_text(), language="text")
@@ -0,0 +1,243 @@
+import asyncio
+import csv
+import json
+import os
+import re
+import time
+from contextlib import ExitStack, asynccontextmanager
+from dataclasses import asdict, dataclass
+from typing import Iterable, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BATCH_CONCURRENCY = int(os.getenv("SOLAR_BATCH_CONCURRENCY", "8"))
+# LLM requests per minute and in flight across the whole batch (0 = unlimited)
+BATCH_LLM_RPM = float(os.getenv("SOLAR_BATCH_LLM_RPM", "0"))
+BATCH_LLM_CONCURRENCY = int(os.getenv("SOLAR_BATCH_LLM_CONCURRENCY", "4"))
+BATCH_RESULT_ROWS = 20  # query rows written with each result
+
+@dataclass
+class BatchReport:
+    questions: int  # input rows
+    unique: int  # distinct questions after normalization
+    skipped: int  # already in the output file from an earlier run
+    ok: int
+    failed: int
+    llm_requests: int
+    seconds: float
+
+def question_key(question: str) -> str:
+    """Dedupe/checkpoint key: case- and whitespace-insensitive."""
+    return " ".join(question.split()).casefold()
+
+def read_questions(path: str) -> list:
+    """
+    [(id, question), ...] from a JSONL file (objects with "question" and optional "id",
+    or bare strings), a CSV with a "question" column (and optional "id"), or plain text
+    with one question per line. Rows without an id are numbered from 1.
+    """
+    rows = []
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.endswith(".csv"):
+            reader = csv.DictReader(f)
+            if "question" not in (reader.fieldnames or ()):
+                raise ValueError(f"{path} has no 'question' column")
+            for record in reader:
+                rows.append((record.get("id"), record["question"]))
+        else:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                if path.endswith(".jsonl"):
+                    record = json.loads(line)
+                    rows.append((record.get("id"), record["question"]) if isinstance(record, dict) else (None, record))
+                else:
+                    rows.append((None, line))
+    return [(str(qid) if qid not in (None, "") else str(i), q.strip()) for i, (qid, q) in enumerate(rows, 1) if q and q.strip()]
+
+def read_checkpoint(output_path: str, retry_failed: bool = False) -> set:
+    """
+    Keys already answered in ``output_path``. A line cut off by a crash is dropped from
+    the file so appending resumes cleanly; failed questions count as done unless
+    ``retry_failed``.
+    """
+    if not os.path.exists(output_path):
+        return set()
+    done, kept = set(), []
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if retry_failed and not record.get("ok"):
+                continue
+            done.add(record["key"])
+            kept.append(line if line.endswith("\n") else line + "\n")
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.writelines(kept)
+    return done
+
+class RateLimiter:
+    """At most ``rpm`` acquisitions per minute (0 = no limit) and ``concurrency`` holders at once."""
+
+    def __init__(self, rpm: float = BATCH_LLM_RPM, concurrency: int = BATCH_LLM_CONCURRENCY):
+        self.interval = 60.0 / rpm if rpm else 0.0
+        self.concurrency = concurrency
+        self.requests = 0
+        self._next = 0.0
+        self._lock = None
+        self._slots = None
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._lock is None:
+            # Created on first use, inside the batch's event loop
+            self._lock = asyncio.Lock()
+            self._slots = asyncio.Semaphore(self.concurrency) if self.concurrency else None
+        if self._slots is not None:
+            await self._slots.acquire()
+        try:
+            async with self._lock:
+                now = time.monotonic()
+                wait = self._next - now
+                self._next = max(now, self._next) + self.interval
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self.requests += 1
+            yield
+        finally:
+            if self._slots is not None:
+                self._slots.release()
+
+def rate_limited_model(model, limiter: RateLimiter):
+    """``model`` (a pydantic_ai Model or model name) with every request going through ``limiter``."""
+    from pydantic_ai.models.wrapper import WrapperModel
+
+    class RateLimitedModel(WrapperModel):
+        async def request(self, *args, **kwargs):
+            async with limiter.slot():
+                return await super().request(*args, **kwargs)
+
+        @asynccontextmanager
+        async def request_stream(self, *args, **kwargs):
+            async with limiter.slot():
+                async with super().request_stream(*args, **kwargs) as stream:
+                    yield stream
+
+    return RateLimitedModel(model)
+
+def result_record(key: str, ids: list, result, rows: int = BATCH_RESULT_ROWS) -> dict:
+    """One output line: the pipeline result with per-stage timings in ms and the first ``rows`` rows."""
+    records = []
+    if result.df is not None and len(result.df) and rows:
+        records = json.loads(result.df.head(rows).to_json(orient="records", date_format="iso"))
+    return {
+        "key": key,
+        "ids": ids,
+        "question": result.question,
+        "ok": result.ok,
+        "stage": result.stage,
+        "error": result.error,
+        "sql": result.sql,
+        "answer": result.answer,
+        "total_rows": result.total_rows,
+        "rows": records,
+        "fast_path": result.fast_path.metric if result.fast_path is not None else None,
+        "sql_cache": result.sql_cache,
+        "result_cached": result.result_cached,
+        "attempts": result.attempts,
+        "rewrites": list(result.rewrites),
+        "timings_ms": {stage: round(seconds * 1000, 3) for stage, seconds in result.timings.items()},
+        "trace_id": result.trace.trace_id if result.trace is not None else None,
+    }
+
+async def run_batch_async(questions: Iterable, output_path: str, concurrency: int = BATCH_CONCURRENCY,
+                          limiter: Optional[RateLimiter] = None, retry_failed: bool = False,
+                          rows: int = BATCH_RESULT_ROWS) -> BatchReport:
+    """
+    Answer ``questions`` ([(id, question), ...]) through pipeline.answer_question and
+    append one JSON line per distinct question to ``output_path``.
+
+    Identical questions (see question_key) run once and list every input id. Each line
+    is written and flushed as soon as its question finishes, so the output file is the
+    checkpoint: a rerun skips the keys already in it. All questions share the process's
+    DuckDB pool; ``concurrency`` bounds the questions in flight and ``limiter`` the LLM
+    requests among them.
+    """
+    import pipeline
+    from db import get_pool
+
+    start = time.perf_counter()
+    get_pool()  # open the store up front, not inside the first questions' timings
+    questions = list(questions)
+    unique = {}
+    for qid, question in questions:
+        unique.setdefault(question_key(question), (question, []))[1].append(qid)
+    done = read_checkpoint(output_path, retry_failed)
+    pending = [(key, question, ids) for key, (question, ids) in unique.items() if key not in done]
+    semaphore = asyncio.Semaphore(concurrency)
+    counts = {"ok": 0, "failed": 0}
+
+    async def run_one(key: str, question: str, ids: list, out) -> None:
+        async with semaphore:
+            result = await pipeline.answer_question(question)
+        out.write(json.dumps(result_record(key, ids, result, rows), ensure_ascii=False, default=str) + "\n")
+        out.flush()
+        counts["ok" if result.ok else "failed"] += 1
+
+    with open(output_path, "a", encoding="utf-8") as out:
+        await asyncio.gather(*(run_one(key, question, ids, out) for key, question, ids in pending))
+    return BatchReport(
+        questions=len(questions),
+        unique=len(unique),
+        skipped=len(unique) - len(pending),
+        ok=counts["ok"],
+        failed=counts["failed"],
+        llm_requests=limiter.requests if limiter is not None else 0,
+        seconds=round(time.perf_counter() - start, 3),
+    )
+
+def run_batch(input_path: str, output_path: str, concurrency: int = BATCH_CONCURRENCY,
+              rpm: float = BATCH_LLM_RPM, llm_concurrency: int = BATCH_LLM_CONCURRENCY,
+              retry_failed: bool = False, offline: bool = False, rows: int = BATCH_RESULT_ROWS) -> BatchReport:
+    """
+    Blocking entry point: read ``input_path`` (see read_questions), rate-limit both
+    agents' models and run the batch. ``offline`` uses the local stand-in models.
+    """
+    import agents
+
+    questions = read_questions(input_path)
+    limiter = RateLimiter(rpm, llm_concurrency)
+    with ExitStack() as stack:
+        sql_agent, answer_agent = agents.get_sql_agent(), agents.get_answer_agent()
+        sql_model, answer_model = sql_agent.model, answer_agent.model
+        if offline:
+            from local_models import answer_function_model, sql_function_model
+
+            sql_model, answer_model = sql_function_model(), answer_function_model()
+        stack.enter_context(sql_agent.override(model=rate_limited_model(sql_model, limiter)))
+        stack.enter_context(answer_agent.override(model=rate_limited_model(answer_model, limiter)))
+        return asyncio.run(run_batch_async(questions, output_path, concurrency, limiter, retry_failed, rows))
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Answer a file of questions headlessly and write JSONL results.")
+    parser.add_argument("input", help="Questions: .jsonl ({\"id\", \"question\"} or strings), .csv (question column) or text")
+    parser.add_argument("-o", "--output", help="Results JSONL, also the checkpoint (default: <input>.results.jsonl)")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="Questions in flight")
+    parser.add_argument("--rpm", type=float, default=BATCH_LLM_RPM, help="LLM requests per minute (0 = unlimited)")
+    parser.add_argument("--llm-concurrency", type=int, default=BATCH_LLM_CONCURRENCY, help="LLM requests in flight")
+    parser.add_argument("--rows", type=int, default=BATCH_RESULT_ROWS, help="Query rows kept per result")
+    parser.add_argument("--retry-failed", action="store_true", help="Rerun questions that failed in an earlier run")
+    parser.add_argument("--offline", action="store_true", help="Use the local stand-in models (no API key needed)")
+    args = parser.parse_args()
+
+    output = args.output or re.sub(r"(\.[^./\\]+)?$", ".results.jsonl", args.input, count=1)
+    report = run_batch(args.input, output, args.concurrency, args.rpm, args.llm_concurrency,
+                       args.retry_failed, args.offline, args.rows)
+    print(json.dumps(asdict(report)))
+    print(f"✓ {report.ok} answered, {report.failed} failed, {report.skipped} already done → {output}")
@@ -0,0 +1,287 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+# Columns of the DKA Solar Centre 5-minute exports
+DKA_COLUMNS = (
+    "timestamp", "Active_Energy_Delivered_Received", "Current_Phase_Average", "Active_Power",
+    "Wind_Speed", "Weather_Temperature_Celsius", "Weather_Relative_Humidity",
+    "Global_Horizontal_Radiation", "Diffuse_Horizontal_Radiation", "Wind_Direction",
+    "Weather_Daily_Rainfall", "Radiation_Global_Tilted", "Radiation_Diffuse_Tilted",
+    "Pyranometer_1", "Temperature_Probe_1", "Temperature_Probe_2", "Hail_Accumulation",
+)
+DEFAULT_YEARS = (1, 5, 20)
+BENCH_QUESTIONS = (
+    "What is the peak power in March 2025?",
+    "Show the daily energy production",
+    "Total energy produced this year",
+    "What is the average temperature?",
+    "How many readings are there?",
+)
+
+def generate_synthetic_csv(path: str, years: float, start: str = "2010-01-01", seed: int = 0,
+                           p_stc: float = 1058.4) -> int:
+    """
+    Write a DKA-style 5-minute CSV covering ``years`` of data and return its row count.
+
+    Irradiance follows a clear-sky day/season curve with cloud noise, power tracks
+    irradiance with a temperature derate, and a small share of rows carry the defects
+    the cleaning rules remove (NaNs, negative power, duplicate timestamps, outliers).
+    Written one month at a time so memory stays flat for multi-year files.
+    """
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    begin = pd.Timestamp(start)
+    end = begin + pd.DateOffset(days=round(365.25 * years))
+    rows = 0
+    header = True
+    for month_start in pd.date_range(begin, end, freq="MS", inclusive="left"):
+        month_end = min(month_start + pd.DateOffset(months=1), end)
+        ts = pd.date_range(month_start, month_end, freq="5min", inclusive="left")
+        n = len(ts)
+        hour = ts.hour.to_numpy() + ts.minute.to_numpy() / 60
+        season = 1 + 0.25 * np.cos(2 * np.pi * (ts.dayofyear.to_numpy() - 15) / 365.25)  # southern summer
+        sun = np.clip(np.sin((hour - 6) / 13 * np.pi), 0, None) * season
+        clouds = np.clip(1 - rng.gamma(0.6, 0.15, n), 0.1, 1)
+        ghi = np.clip(1000 * sun * clouds + rng.normal(0, 3, n), 0, None)
+        ambient = 18 + 10 * season + 8 * sun + rng.normal(0, 2, n)
+        module = ambient + 0.03 * ghi
+        power = np.clip(p_stc * ghi / 1000 * (1 - 0.004 * (module - 25)) * 0.85 + rng.normal(0, 2, n), -2, None)
+        frame = pd.DataFrame({
+            "timestamp": ts.strftime("%Y-%m-%d %H:%M:%S"),
+            "Active_Energy_Delivered_Received": np.cumsum(np.clip(power, 0, None)) / 12,
+            "Current_Phase_Average": power / 0.4 / 3,
+            "Active_Power": power,
+            "Wind_Speed": rng.gamma(2, 1.5, n),
+            "Weather_Temperature_Celsius": ambient,
+            "Weather_Relative_Humidity": np.clip(rng.normal(30, 10, n), 2, 100),
+            "Global_Horizontal_Radiation": ghi,
+            "Diffuse_Horizontal_Radiation": ghi * rng.uniform(0.1, 0.3, n),
+            "Wind_Direction": rng.integers(0, 360, n),
+            "Weather_Daily_Rainfall": np.where(rng.random(n) < 0.01, rng.gamma(1, 2, n), 0.0),
+            "Radiation_Global_Tilted": ghi * 1.1,
+            "Radiation_Diffuse_Tilted": ghi * rng.uniform(0.1, 0.3, n),
+            "Pyranometer_1": ghi * 1.08 + rng.normal(0, 2, n),
+            "Temperature_Probe_1": module,
+            "Temperature_Probe_2": module + rng.normal(0, 0.5, n),
+            "Hail_Accumulation": 0.0,
+        }, columns=list(DKA_COLUMNS))
+        defects = rng.random(n)
+        frame.loc[defects < 0.01, "Weather_Relative_Humidity"] = np.nan
+        frame.loc[(defects >= 0.01) & (defects < 0.012), "Active_Power"] = -1.0
+        frame.loc[(defects >= 0.012) & (defects < 0.013), "Weather_Temperature_Celsius"] = 60.0
+        duplicates = frame[defects > 0.999]
+        frame = pd.concat([frame, duplicates]).sort_index(kind="stable")
+        frame.to_csv(path, mode="w" if header else "a", header=header, index=False)
+        header = False
+        rows += len(frame)
+    return rows
+
+def _peak_rss_mb() -> float:
+    try:
+        import resource
+    except ImportError:
+        return float("nan")
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+def _percentiles(samples: list) -> dict:
+    import numpy as np
+
+    if not samples:
+        return {}
+    ms = np.array(samples) * 1000
+    return {
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p90_ms": float(np.percentile(ms, 90)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+    }
+
+def _configure(workdir: str, csv_path: str, cache: bool) -> None:
+    """Point the app's modules at the benchmark files; must run before they are imported."""
+    os.environ["SOLAR_CSV_PATH"] = csv_path
+    os.environ["SOLAR_DB_PATH"] = os.path.join(workdir, "data.duckdb")
+    os.environ["SOLAR_CACHE_DIR"] = os.path.join(workdir, ".cache")
+    # Keep every synthetic year instead of the production trim window
+    os.environ["SOLAR_TRIM_START"] = "1900-01-01"
+    os.environ["SOLAR_TRIM_END"] = "2100-12-31"
+    os.environ.setdefault("PYDANTIC_AI_NO_BANNER", "1")
+    if not cache:
+        os.environ["SOLAR_SQL_CACHE_MAX_ENTRIES"] = "0"
+        os.environ["SOLAR_RESULT_CACHE_MEMORY_MB"] = "0"
+        os.environ["SOLAR_RESULT_CACHE_DISK_MB"] = "0"
+
+# Each stage runs in a fresh spawned process so its peak RSS is its own.
+def _stage_preprocess(workdir: str, csv_path: str, cache: bool, chunksize: int) -> dict:
+    _configure(workdir, csv_path, cache)
+    import get_data
+
+    start = time.perf_counter()
+    rows = len(get_data.preprocess_data(csv_path, chunksize=chunksize or None))
+    return {"seconds": time.perf_counter() - start, "rows": rows, "peak_rss_mb": _peak_rss_mb()}
+
+def _stage_ingest(workdir: str, csv_path: str, cache: bool) -> dict:
+    _configure(workdir, csv_path, cache)
+    import db
+
+    start = time.perf_counter()
+    db.ensure_store(rebuild=True)
+    return {"seconds": time.perf_counter() - start, "peak_rss_mb": _peak_rss_mb()}
+
+def _stage_queries(workdir: str, csv_path: str, cache: bool, repeat: int, concurrency: int, latency: float) -> dict:
+    _configure(workdir, csv_path, cache)
+    import asyncio
+    import db
+    import get_data
+
+    start = time.perf_counter()
+    pool = db.get_pool()
+    startup = time.perf_counter() - start
+
+    metrics = {
+        "total_energy": lambda c: get_data.calculate_total_energy(c),
+        "total_energy_monthly": lambda c: get_data.calculate_total_energy(c, "monthly"),
+        "specific_yield_range": lambda c: get_data.calculate_specific_yield(c, start="2011-03-05", end="2011-06-17"),
+        "pr_yearly": lambda c: get_data.calculate_temperature_corrected_pr(c, aggregation="yearly"),
+        "peak_power_daily": lambda c: get_data.calculate_peak_power(c, "daily", "2011-01-01", "2011-12-31"),
+        "raw_scan": lambda c: c.execute("SELECT avg(Active_Power), max(Weather_Temperature_Celsius) FROM solar").fetchall(),
+    }
+    metric_latency = {}
+    with db.get_connection() as conn:
+        for name, fn in metrics.items():
+            samples = []
+            for _ in range(repeat):
+                t = time.perf_counter()
+                fn(conn)
+                samples.append(time.perf_counter() - t)
+            metric_latency[name] = _percentiles(samples)
+
+    import pipeline
+    from local_models import offline_agents
+
+    questions = list(BENCH_QUESTIONS) * repeat
+    with offline_agents(latency=latency):
+        t = time.perf_counter()
+        results = asyncio.run(pipeline.answer_many(questions, concurrency))
+        elapsed = time.perf_counter() - t
+    return {
+        "startup_ms": startup * 1000,
+        "metrics": metric_latency,
+        "pipeline": {
+            "questions": len(results),
+            "failed": sum(not r.ok for r in results),
+            "fast_path": sum(r.fast_path is not None for r in results),
+            "questions_per_sec": len(results) / elapsed,
+            "latency": _percentiles([r.timings["total"] for r in results]),
+        },
+        "pool": pool.metrics(),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+def _in_subprocess(fn, *args) -> dict:
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+        return executor.submit(fn, *args).result()
+
+def run_benchmark(years_list=DEFAULT_YEARS, workdir=None, repeat=20, concurrency=8,
+                  latency=0.0, cache=False, chunksize=250_000) -> dict:
+    report = {"config": {"repeat": repeat, "concurrency": concurrency, "llm_latency_s": latency,
+                         "cache": cache, "chunksize": chunksize}, "sizes": {}}
+    root = workdir or tempfile.mkdtemp(prefix="solar-bench-")
+    for years in years_list:
+        size_dir = os.path.join(root, f"{years}y")
+        os.makedirs(size_dir, exist_ok=True)
+        csv_path = os.path.join(size_dir, "synthetic.csv")
+        if not os.path.exists(csv_path):
+            print(f"Generating {years} year(s) of synthetic data...", flush=True)
+            generate_synthetic_csv(csv_path, years)
+        size = {"csv_mb": os.path.getsize(csv_path) / (1 << 20)}
+        print(f"[{years}y] preprocess_data (in memory)", flush=True)
+        size["preprocess_in_memory"] = _in_subprocess(_stage_preprocess, size_dir, csv_path, cache, 0)
+        print(f"[{years}y] preprocess_data (streaming)", flush=True)
+        size["preprocess_streaming"] = _in_subprocess(_stage_preprocess, size_dir, csv_path, cache, chunksize)
+        print(f"[{years}y] ingestion", flush=True)
+        size["ingest"] = _in_subprocess(_stage_ingest, size_dir, csv_path, cache)
+        print(f"[{years}y] queries and pipeline", flush=True)
+        size["queries"] = _in_subprocess(_stage_queries, size_dir, csv_path, cache, repeat, concurrency, latency)
+        report["sizes"][f"{years}y"] = size
+    return report
+
+def _flatten(report: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in report.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name))
+        elif isinstance(value, (int, float)):
+            flat[name] = value
+    return flat
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """Names of timing/memory figures that got worse than ``baseline`` by more than ``tolerance``."""
+    current, previous = _flatten(report["sizes"]), _flatten(baseline["sizes"])
+    regressions = []
+    for name, old in previous.items():
+        new = current.get(name)
+        if new is None or old <= 0 or ".pool." in name:
+            continue
+        higher_is_better = name.endswith("questions_per_sec")
+        lower_is_better = name.endswith(("_ms", "seconds", "_mb")) and not name.endswith("csv_mb")
+        if higher_is_better and new < old * (1 - tolerance):
+            regressions.append(f"{name}: {old:.2f} -> {new:.2f}")
+        elif lower_is_better and new > old * (1 + tolerance):
+            regressions.append(f"{name}: {old:.2f} -> {new:.2f}")
+    return regressions
+
+def _print_summary(report: dict) -> None:
+    for size, r in report["sizes"].items():
+        q = r["queries"]
+        print(
+            f"{size:>4}: csv {r['csv_mb']:.0f} MB | "
+            f"preprocess {r['preprocess_in_memory']['seconds']:.1f}s/{r['preprocess_in_memory']['peak_rss_mb']:.0f} MB, "
+            f"streaming {r['preprocess_streaming']['seconds']:.1f}s/{r['preprocess_streaming']['peak_rss_mb']:.0f} MB | "
+            f"ingest {r['ingest']['seconds']:.1f}s/{r['ingest']['peak_rss_mb']:.0f} MB | "
+            f"startup {q['startup_ms']:.0f} ms | "
+            f"pipeline p50 {q['pipeline']['latency'].get('p50_ms', 0):.1f} ms, "
+            f"p99 {q['pipeline']['latency'].get('p99_ms', 0):.1f} ms, "
+            f"{q['pipeline']['questions_per_sec']:.1f} q/s"
+        )
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmark with synthetic solar data and stubbed LLM agents.")
+    parser.add_argument("--years", type=float, nargs="+", default=list(DEFAULT_YEARS))
+    parser.add_argument("--workdir", help="Reuse generated CSVs from this directory")
+    parser.add_argument("--repeat", type=int, default=20, help="Repetitions per metric query / question")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated LLM latency per call (s)")
+    parser.add_argument("--chunksize", type=int, default=250_000)
+    parser.add_argument("--cache", action="store_true", help="Keep the SQL/result caches enabled")
+    parser.add_argument("--output", help="Write the JSON report here")
+    parser.add_argument("--baseline", help="Previous JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression")
+    args = parser.parse_args(argv)
+
+    years = [int(y) if float(y).is_integer() else y for y in args.years]
+    report = run_benchmark(years, args.workdir, args.repeat, args.concurrency,
+                           args.latency, args.cache, args.chunksize)
+    _print_summary(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
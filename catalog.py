@@ -0,0 +1,144 @@
+import threading
+from db import get_pool, has_table
+
+# Tables described to sql_agent; the rollups have a fixed schema spelled out in prompts.py
+CATALOG_TABLES = ("solar", "solar_extra", "site_metadata")
+CATALOG_TABLE = "schema_catalog"
+CATALOG_SAMPLES = 5  # distinct values listed for text columns
+
+CATALOG_DDL = f"""
+CREATE OR REPLACE TABLE {CATALOG_TABLE} (
+    table_name  VARCHAR,
+    column_name VARCHAR,
+    column_pos  INTEGER,
+    data_type   VARCHAR,
+    unit        VARCHAR,
+    min_value   VARCHAR,
+    max_value   VARCHAR,
+    samples     VARCHAR[]
+)
+"""
+
+COLUMN_UNITS = {
+    "Active_Power": "kW",
+    "Energy_kWh": "kWh per 5-min reading",
+    "Active_Energy_Delivered_Received": "kWh, meter counter",
+    "Current_Phase_Average": "A",
+    "Pyranometer_1": "W/m², plane of array",
+    "Global_Horizontal_Radiation": "W/m²",
+    "Diffuse_Horizontal_Radiation": "W/m²",
+    "Radiation_Global_Tilted": "W/m²",
+    "Radiation_Diffuse_Tilted": "W/m²",
+    "Weather_Temperature_Celsius": "°C, ambient",
+    "Temperature_Probe_1": "°C, module",
+    "Temperature_Probe_2": "°C, module",
+    "Weather_Relative_Humidity": "%",
+    "Weather_Daily_Rainfall": "mm",
+    "Wind_Speed": "m/s",
+    "Wind_Direction": "°",
+    "p_stc_kw": "kW",
+}
+
+_RANGE_TYPES = ("TIMESTAMP", "DATE", "DOUBLE", "FLOAT", "REAL", "DECIMAL", "BIGINT", "INTEGER", "SMALLINT", "TINYINT", "HUGEINT")
+
+def _quote(column: str) -> str:
+    return '"' + column.replace('"', '""') + '"'
+
+def build_catalog(conn) -> None:
+    """
+    (Re)write the schema_catalog table: one row per column of CATALOG_TABLES with its
+    type, unit, min/max (numbers and timestamps) or a few distinct values (text).
+
+    Called at the end of ingestion, inside the caller's transaction if there is one.
+    """
+    columns = conn.execute(
+        "SELECT table_name, column_name, column_index, data_type FROM duckdb_columns() "
+        f"WHERE table_name IN ({', '.join(repr(t) for t in CATALOG_TABLES)}) ORDER BY table_name, column_index"
+    ).fetchall()
+    rows = []
+    for table in CATALOG_TABLES:
+        table_columns = [c for c in columns if c[0] == table]
+        if not table_columns:
+            continue
+        ranged = [c for c in table_columns if c[3].startswith(_RANGE_TYPES)]
+        stats = []
+        if ranged:
+            stats = conn.execute("SELECT " + ", ".join(
+                f"min({_quote(c[1])})::VARCHAR, max({_quote(c[1])})::VARCHAR" for c in ranged
+            ) + f" FROM {table}").fetchone()
+        ranges = {c[1]: (stats[2 * i], stats[2 * i + 1]) for i, c in enumerate(ranged)}
+        for _, column, position, data_type in table_columns:
+            samples = None
+            if data_type == "VARCHAR":
+                samples = [r[0] for r in conn.execute(
+                    f"SELECT DISTINCT {_quote(column)} FROM {table} WHERE {_quote(column)} IS NOT NULL "
+                    f"ORDER BY 1 LIMIT {CATALOG_SAMPLES}"
+                ).fetchall()]
+            low, high = ranges.get(column, (None, None))
+            rows.append((table, column, position, data_type, COLUMN_UNITS.get(column), low, high, samples))
+    conn.execute(CATALOG_DDL)
+    if rows:
+        conn.executemany(f"INSERT INTO {CATALOG_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+def _format_value(value: str) -> str:
+    try:
+        return f"{float(value):.6g}"
+    except ValueError:
+        return value
+
+def format_catalog(rows: list) -> str:
+    """
+    One compact line per table, e.g.
+    ``- solar: timestamp TIMESTAMP [2024-01-01 06:00:00..2025-06-30 18:55:00], Active_Power FLOAT (kW) [0..908.3], ...``
+    """
+    tables = {}
+    for table, column, data_type, unit, low, high, samples in rows:
+        text = f"{column} {data_type}"
+        if unit:
+            text += f" ({unit})"
+        if low is not None:
+            text += f" [{_format_value(low)}..{_format_value(high)}]"
+        if samples:
+            text += " e.g. " + "/".join(f"'{s}'" for s in samples)
+        tables.setdefault(table, []).append(text)
+    return "\n".join(f"- {table}: {', '.join(columns)}" for table, columns in tables.items())
+
+def read_catalog(conn) -> str:
+    """format_catalog of the stored catalog, or "" for a store built before it existed."""
+    if not has_table(conn, CATALOG_TABLE):
+        return ""
+    return format_catalog(conn.execute(
+        f"SELECT table_name, column_name, data_type, unit, min_value, max_value, samples FROM {CATALOG_TABLE} "
+        "ORDER BY table_name = 'site_metadata', table_name, column_pos"
+    ).fetchall())
+
+_prompts = {}
+_prompt_lock = threading.Lock()
+
+def schema_prompt() -> str:
+    """read_catalog for the pooled store, read once per data version."""
+    pool = get_pool()
+    version = pool.data_version
+    with _prompt_lock:
+        if version in _prompts:
+            return _prompts[version]
+    with pool.connection() as cursor:
+        text = read_catalog(cursor)
+    with _prompt_lock:
+        _prompts.clear()
+        _prompts[version] = text
+    return text
+
+if __name__ == "__main__":
+    import argparse
+    import duckdb
+    from db import DB_PATH
+
+    parser = argparse.ArgumentParser(description="Print (or rebuild) the schema catalog injected into the SQL prompt.")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--rebuild", action="store_true")
+    args = parser.parse_args()
+    with duckdb.connect(args.db, read_only=not args.rebuild) as conn:
+        if args.rebuild:
+            build_catalog(conn)
+        print(read_catalog(conn))
@@ -1,55 +1,621 @@
-from typing import Any
+import asyncio
+import contextvars
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Callable, Optional
 from dotenv import load_dotenv
-from get_data import preprocess_data
+from get_data import (
+    CHUNK_ROWS, DATA_FILE, ROLLUP_GRAINS, ROLLUP_TABLES,
+    sql_literals, clean_data, iter_clean_chunks, read_appended_rows, rollup_select_sql, scan_csv,
+)
+from tracing import REGISTRY, TRACE_ROWS_SCANNED, span, startup_stage
 
 load_dotenv()
 
+DB_PATH = os.getenv("SOLAR_DB_PATH", "data.duckdb")
+CSV_PATH = os.getenv("SOLAR_CSV_PATH", DATA_FILE)
+# Directory of per-site CSVs; when set the store is built by sites.py instead of from CSV_PATH
+SITES_DIR = os.getenv("SOLAR_SITES_DIR", "")
+HASH_BLOCK_SIZE = 1 << 20
+POOL_SIZE = int(os.getenv("SOLAR_DB_POOL_SIZE", "8"))
+POOL_TIMEOUT = float(os.getenv("SOLAR_DB_POOL_TIMEOUT", "30"))
+# Per-query wall-clock limit in seconds (0 = none) and DuckDB's memory cap for the shared store
+QUERY_TIMEOUT = float(os.getenv("SOLAR_QUERY_TIMEOUT", "30"))
+MEMORY_LIMIT = os.getenv("SOLAR_DB_MEMORY_LIMIT", "2GB")
+# Most rows fetched for a generated query; larger results are truncated and counted
+MAX_RESULT_ROWS = int(os.getenv("SOLAR_MAX_RESULT_ROWS", "10000"))
+FETCH_BATCH_ROWS = 2048
+EXPLAIN_MAX_CHARS = 2000
+_PLAN_BOX = "┌┐└┘│─┬┴├┤ "
+
+MANIFEST_DDL = """
+CREATE TABLE IF NOT EXISTS ingest_manifest (
+    source      VARCHAR PRIMARY KEY,
+    size        BIGINT,
+    mtime       DOUBLE,
+    sha256      VARCHAR,
+    row_count   BIGINT,
+    temp_lower  DOUBLE,
+    temp_upper  DOUBLE,
+    ingested_at TIMESTAMP
+)
+"""
+
+def file_digest(path: str, limit: Optional[int] = None, hasher=None):
+    """
+    Hash ``path`` in blocks, optionally only its first ``limit`` bytes.
+
+    Returns the hasher so the caller can keep feeding it (used to verify an
+    appended file's old prefix and obtain the new full digest in one pass).
+    """
+    hasher = hasher or hashlib.sha256()
+    remaining = limit
+    with open(path, "rb") as f:
+        while remaining is None or remaining > 0:
+            size = HASH_BLOCK_SIZE if remaining is None else min(HASH_BLOCK_SIZE, remaining)
+            block = f.read(size)
+            if not block:
+                break
+            hasher.update(block)
+            if remaining is not None:
+                remaining -= len(block)
+    return hasher
+
+def has_table(conn, name: str) -> bool:
+    return conn.execute(
+        "SELECT count(*) FROM duckdb_tables() WHERE table_name = ?", [name]
+    ).fetchone()[0] > 0
+
+def read_manifest(conn, source: str) -> Optional[dict]:
+    if not has_table(conn, "ingest_manifest"):
+        return None
+    row = conn.execute(
+        "SELECT size, mtime, sha256, row_count, temp_lower, temp_upper "
+        "FROM ingest_manifest WHERE source = ?",
+        [source],
+    ).fetchone()
+    if row is None:
+        return None
+    keys = ("size", "mtime", "sha256", "row_count", "temp_lower", "temp_upper")
+    return dict(zip(keys, row))
+
+def manifest_is_current(manifest: Optional[dict], csv_path: str) -> bool:
+    if manifest is None or not os.path.exists(csv_path):
+        return manifest is not None
+    st = os.stat(csv_path)
+    return manifest["size"] == st.st_size and manifest["mtime"] == st.st_mtime
+
+def write_manifest(conn, source: str, st, sha256: str, temp_bounds, row_count: Optional[int] = None) -> None:
+    if row_count is None:
+        row_count = conn.execute("SELECT count(*) FROM solar").fetchone()[0]
+    conn.execute(MANIFEST_DDL)
+    conn.execute("DELETE FROM ingest_manifest WHERE source = ?", [source])
+    conn.execute(
+        "INSERT INTO ingest_manifest VALUES (?, ?, ?, ?, ?, ?, ?, now()::TIMESTAMP)",
+        [source, st.st_size, st.st_mtime, sha256, row_count, temp_bounds[0], temp_bounds[1]],
+    )
+
+def read_data_version(conn) -> str:
+    """Token that changes whenever ingestion changes the solar table (derived from the manifest)."""
+    if not has_table(conn, "ingest_manifest"):
+        return "unversioned"
+    rows = conn.execute(
+        "SELECT source, sha256, row_count FROM ingest_manifest ORDER BY source"
+    ).fetchall()
+    if has_table(conn, "site_metadata"):
+        # Capacities change metric results without changing any rows
+        rows += conn.execute("SELECT site_id, p_stc_kw FROM site_metadata ORDER BY site_id").fetchall()
+    return hashlib.sha256(repr(rows).encode("utf-8")).hexdigest()[:16]
+
+def build_rollups(conn, since=None, by_site: bool = False, sites=None) -> None:
+    """
+    (Re)build the solar_hourly/daily/monthly/yearly rollups.
+
+    With ``since`` only buckets at or after that timestamp are recomputed, which is
+    all an append can touch. Multi-site stores keep one row per site and bucket
+    (``by_site``) and recompute only the listed ``sites``. Levels are built finest
+    first since each coarser level is aggregated from the one below it.
+    """
+    for aggregation in ROLLUP_GRAINS:
+        table = ROLLUP_TABLES[aggregation]
+        if (since is None and sites is None) or not has_table(conn, table):
+            conn.execute(
+                f"CREATE OR REPLACE TABLE {table} AS {rollup_select_sql(aggregation, by_site=by_site)} ORDER BY bucket"
+            )
+            continue
+        if sites is not None:
+            conn.execute(f"DELETE FROM {table} WHERE site_id IN ({sql_literals(sites)})")
+            if sites:
+                conn.execute(f"INSERT INTO {table} {rollup_select_sql(aggregation, by_site=True, sites=sites)} ORDER BY bucket")
+            continue
+        grain = ROLLUP_GRAINS[aggregation]
+        conn.execute(
+            f"DELETE FROM {table} WHERE bucket >= date_trunc('{grain}', ?::TIMESTAMP)", [since]
+        )
+        conn.execute(f"INSERT INTO {table} {rollup_select_sql(aggregation, since)} ORDER BY bucket")
+
+def _full_build(conn, csv_path: str) -> None:
+    from catalog import build_catalog
+    from layout import optimize_layout
+
+    st = os.stat(csv_path)
+    sha256 = file_digest(csv_path).hexdigest()
+    # Stream the CSV in two passes so peak memory stays around one chunk
+    temp_bounds, dtypes = scan_csv(csv_path, CHUNK_ROWS)
+    rows = 0
+    conn.execute("BEGIN TRANSACTION")
+    conn.execute("DROP TABLE IF EXISTS solar")
+    conn.execute("DROP TABLE IF EXISTS solar_extra")
+    for df in iter_clean_chunks(csv_path, temp_bounds, dtypes, CHUNK_ROWS):
+        if not has_table(conn, "solar"):
+            conn.execute("CREATE TABLE solar AS SELECT * FROM df")
+        else:
+            conn.execute("INSERT INTO solar SELECT * FROM df")
+        rows += len(df)
+    write_manifest(conn, csv_path, st, sha256, temp_bounds)
+    conn.execute("COMMIT")
+    print(f"✓ Built solar table from {csv_path} ({rows} rows)")
+    # Sort and narrow before the rollups are computed from it; a crash in between is
+    # repaired by ensure_store, which checks both
+    optimize_layout(conn)
+    build_rollups(conn)
+    build_catalog(conn)
+
+def _incremental_build(conn, csv_path: str, manifest: dict) -> bool:
+    """Ingest rows appended since the manifest was written. Returns False if a full rebuild is needed."""
+    from catalog import build_catalog
+    from layout import append_rows, rows_fit_layout
+
+    st = os.stat(csv_path)
+    if st.st_size < manifest["size"]:
+        return False
+
+    hasher = file_digest(csv_path, limit=manifest["size"])
+    if hasher.hexdigest() != manifest["sha256"]:
+        return False
+    if st.st_size == manifest["size"]:
+        # Touched but unchanged: just refresh the mtime so the fast check passes next time
+        conn.execute("UPDATE ingest_manifest SET mtime = ? WHERE source = ?", [st.st_mtime, csv_path])
+        return True
+
+    tail = read_appended_rows(csv_path, manifest["size"])
+    if tail is None:
+        return False
+    # Continue the prefix hash over the appended bytes to get the new full digest
+    with open(csv_path, "rb") as f:
+        f.seek(manifest["size"])
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            hasher.update(block)
+
+    temp_bounds = (manifest["temp_lower"], manifest["temp_upper"])
+    df, _ = clean_data(tail, temp_bounds)
+    if len(df) and not rows_fit_layout(conn, df):
+        return False  # new columns or values the narrowed types cannot hold
+    conn.execute("BEGIN TRANSACTION")
+    if len(df):
+        append_rows(conn, df)
+        build_rollups(conn, since=df["timestamp"].min())
+        build_catalog(conn)
+    write_manifest(conn, csv_path, st, hasher.hexdigest(), temp_bounds)
+    conn.execute("COMMIT")
+    print(f"✓ Appended {len(df)} new rows from {csv_path}")
+    return True
+
+def ensure_store(db_path: str = DB_PATH, csv_path: str = CSV_PATH, rebuild: bool = False) -> None:
+    """
+    Make sure ``db_path`` holds an up-to-date ``solar`` table for ``csv_path``.
+
+    The manifest's size/mtime are compared first so an unchanged source costs a
+    single stat() call. Appended rows are ingested incrementally; any other change
+    (truncation, rewrite) triggers a full rebuild. With SOLAR_SITES_DIR set, the store
+    is built from that directory of site CSVs instead (see sites.py).
+    """
+    import duckdb
+
+    if SITES_DIR:
+        from sites import ensure_site_store
+
+        ensure_site_store(db_path, SITES_DIR, rebuild=rebuild)
+        return
+
+    from catalog import CATALOG_TABLE, build_catalog
+    from layout import layout_is_current, optimize_layout
+
+    rollups_ready = layout_ready = catalog_ready = False
+    if not rebuild and os.path.exists(db_path):
+        try:
+            with duckdb.connect(db_path, read_only=True) as ro:
+                manifest = read_manifest(ro, csv_path)
+                rollups_ready = all(has_table(ro, table) for table in ROLLUP_TABLES.values())
+                layout_ready = layout_is_current(ro)
+                catalog_ready = has_table(ro, CATALOG_TABLE)
+        except duckdb.Error:
+            manifest = None
+        if manifest_is_current(manifest, csv_path):
+            if not (rollups_ready and layout_ready and catalog_ready):
+                # Store predates the rollups, the storage layout or the catalog: add them without re-reading the CSV
+                with duckdb.connect(db_path) as conn:
+                    if not layout_ready:
+                        optimize_layout(conn)
+                    if not (rollups_ready and layout_ready):
+                        build_rollups(conn)
+                    build_catalog(conn)
+            return
+    else:
+        manifest = None
+
+    if not os.path.exists(csv_path):
+        raise FileNotFoundError(f"Source data not found: {csv_path}")
+
+    conn = duckdb.connect(db_path)
+    try:
+        if rebuild:
+            manifest = None
+        if manifest is None or not _incremental_build(conn, csv_path, manifest):
+            _full_build(conn, csv_path)
+    finally:
+        conn.close()
+
+class ConnectionPool:
+    """
+    Process-wide pool of read-only DuckDB cursors.
+
+    All cursors come from one ``duckdb.connect(db_path, read_only=True)`` instance, so
+    borrowing one costs no file I/O. Streamlit sessions and agent tools borrow a cursor
+    for the duration of a request and hand it back on ``release()``.
+    """
+
+    def __init__(self, db_path: str = DB_PATH, csv_path: str = CSV_PATH, size: int = POOL_SIZE):
+        self.db_path = db_path
+        self.csv_path = csv_path
+        self.size = size
+        self.generation = 0
+        self.data_version = None
+        self._base = None
+        self._idle = queue.LifoQueue()
+        self._generations = {}
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._acquired = 0
+        self._waited = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self.open()
+
+    def open(self):
+        import duckdb
+
+        start = time.perf_counter()
+        try:
+            ensure_store(self.db_path, self.csv_path)
+        except duckdb.Error as e:
+            # Another process holds the store open; serve the existing data and
+            # pick the changes up on the next refresh.
+            print(f"⚠️  Could not refresh {self.db_path}: {e}")
+        with self._lock:
+            self._base = duckdb.connect(self.db_path, read_only=True, config={"memory_limit": MEMORY_LIMIT})
+            self.data_version = read_data_version(self._base)
+            self.generation += 1
+        print(f"✓ Opened {self.db_path} in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    def acquire(self, timeout: float = POOL_TIMEOUT):
+        """Borrow a cursor, waiting up to ``timeout`` seconds when all ``size`` cursors are in use."""
+        start = time.perf_counter()
+        cursor = None
+        with self._lock:
+            if self._base is None:
+                raise RuntimeError("Connection pool is closed")
+            try:
+                cursor = self._idle.get_nowait()
+            except queue.Empty:
+                if self._created < self.size:
+                    cursor = self._base.cursor()
+                    if TRACE_ROWS_SCANNED:
+                        _enable_profiling(cursor)
+                    self._generations[id(cursor)] = self.generation
+                    self._created += 1
+        if cursor is None:
+            try:
+                cursor = self._idle.get(timeout=timeout)
+            except queue.Empty:
+                with self._lock:
+                    self._timeouts += 1
+                raise TimeoutError(f"No database connection available after {timeout:.1f}s")
+        waited = time.perf_counter() - start
+        with self._lock:
+            self._in_use += 1
+            self._acquired += 1
+            if waited > 0.001:
+                self._waited += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        REGISTRY.observe("solar_db_pool_wait_seconds", waited)
+        return cursor
+
+    def release(self, cursor) -> None:
+        with self._lock:
+            self._in_use -= 1
+            if self.is_current(cursor):
+                self._idle.put(cursor)
+                return
+            # Borrowed before a refresh: its database instance is gone
+            self._generations.pop(id(cursor), None)
+            self._created -= 1
+        cursor.close()
+
+    def is_current(self, cursor) -> bool:
+        return self._base is not None and self._generations.get(id(cursor)) == self.generation
+
+    @contextmanager
+    def connection(self):
+        cursor = self.acquire()
+        try:
+            yield cursor
+        finally:
+            self.release(cursor)
+
+    def refresh(self) -> None:
+        """Re-check the source CSV and reopen the store, e.g. after new rows were appended."""
+        self.close()
+        self.open()
+
+    def close(self) -> None:
+        with self._lock:
+            base, self._base = self._base, None
+            while True:
+                try:
+                    cursor = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                self._generations.pop(id(cursor), None)
+                self._created -= 1
+                cursor.close()
+        if base is not None:
+            base.close()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "size": self.size,
+                "created": self._created,
+                "in_use": self._in_use,
+                "idle": self._idle.qsize(),
+                "acquired": self._acquired,
+                "waited": self._waited,
+                "timeouts": self._timeouts,
+                "wait_avg_ms": (self._wait_total / self._acquired * 1000) if self._acquired else 0.0,
+                "wait_max_ms": self._wait_max * 1000,
+            }
+
+def _enable_profiling(cursor) -> None:
+    """Have DuckDB count scanned rows per query without printing a profile."""
+    import duckdb
+
+    try:
+        cursor.execute("PRAGMA enable_profiling = 'no_output'")
+        cursor.execute(
+            "SET custom_profiling_settings = "
+            "'{\"CUMULATIVE_ROWS_SCANNED\": \"true\"}'"
+        )
+    except duckdb.Error:
+        pass  # older DuckDB without custom profiling settings
+
+def rows_scanned(cursor) -> Optional[int]:
+    """Rows scanned by the last query on ``cursor``, when profiling is enabled."""
+    try:
+        info = json.loads(cursor.get_profiling_information(format="json"))
+    except Exception:
+        return None
+    return info.get("cumulative_rows_scanned")
+
+def explain_sql(conn, sql: str) -> Optional[str]:
+    """DuckDB's physical plan for ``sql`` (cut to EXPLAIN_MAX_CHARS), or None when it does not plan."""
+    import duckdb
+
+    try:
+        rows = conn.execute(f"EXPLAIN {sql}").fetchall()
+    except duckdb.Error:
+        return None
+    # Drop the box drawing; the operator names and their details are what matter
+    lines = (" ".join(line.strip(_PLAN_BOX).split()) for row in rows for line in row[-1].splitlines())
+    plan = "\n".join(line for line in lines if line)
+    return plan if len(plan) <= EXPLAIN_MAX_CHARS else plan[:EXPLAIN_MAX_CHARS] + "\n..."
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+def _pool_gauges() -> list:
+    if _pool is None:
+        return []
+    return [(f"solar_db_pool_{k}", {}, v) for k, v in _pool.metrics().items() if k in ("size", "created", "in_use", "idle")]
+
+REGISTRY.add_collector(_pool_gauges)
+REGISTRY.describe("solar_db_pool_wait_seconds", "Time spent waiting for a pooled DuckDB cursor")
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                with startup_stage("store"):
+                    _pool = ConnectionPool()
+    return _pool
+
+def bounded_sql(sql: str, limit: int) -> str:
+    """``sql`` wrapped so at most ``limit + 1`` rows come back (the extra row flags truncation)."""
+    return f"SELECT * FROM (\n{sql}\n) AS bounded LIMIT {int(limit) + 1}"
+
+@dataclass
+class BoundedResult:
+    table: Any  # pyarrow.Table with at most ``limit`` rows
+    total_rows: int  # rows the unbounded query returns
+    truncated: bool
+
 class DatabaseConnection:
-    def __init__(self):
+    def __init__(self, pool: Optional[ConnectionPool] = None):
+        self.pool = pool or get_pool()
         self.conn = None
         self._connect()
-    
+
     def _connect(self):
-        import duckdb
-        
-        df = preprocess_data()
-        self.conn = duckdb.connect("data.duckdb") 
-        self.conn.execute("CREATE OR REPLACE TABLE solar AS SELECT * FROM df")
+        self.conn = self.pool.acquire()
 
     def is_closed(self) -> bool:
-        return True
-    
+        return self.conn is None or not self.pool.is_current(self.conn)
+
+    @property
+    def data_version(self) -> str:
+        return self.pool.data_version
+
     def reconnect(self):
         if self.is_closed():
             print(f"⚠️  Connection closed. Reconnecting to database")
+            if self.conn is not None:
+                self.pool.release(self.conn)
             self._connect()
-    
+
     def execute(self, query: str) -> Any:
         """
         Execute a SQL query and return results.
-        
+
         Args:
             query: SQL query string
-            
+
         Returns:
             Query results with a fetchdf() method for pandas DataFrame
         """
         # Check and reconnect if necessary
         if self.is_closed():
             self.reconnect()
-        
-        return self.conn.execute(query)
-    
+
+        with span("db.execute"):
+            return self.conn.execute(query)
+
+    def fetch_bounded(self, query: str, limit: int = MAX_RESULT_ROWS) -> BoundedResult:
+        """
+        Run ``query`` and fetch at most ``limit`` rows as an Arrow table.
+
+        The query is wrapped in a LIMIT so DuckDB stops producing rows early, and the
+        result is streamed in record batches rather than materialized at once. The total
+        row count is only computed (with a separate count query) when the result was cut.
+
+        Args:
+            query: SELECT statement
+            limit: Most rows to fetch
+
+        Returns:
+            BoundedResult with the rows, the total row count and whether rows were cut
+        """
+        import pyarrow as pa
+
+        with span("db.execute") as s:
+            if self.is_closed():
+                self.reconnect()
+            reader = self.conn.execute(bounded_sql(query, limit)).to_arrow_reader(FETCH_BATCH_ROWS)
+            batches = list(reader)
+            table = pa.Table.from_batches(batches, schema=reader.schema)
+            truncated = table.num_rows > limit
+            if truncated:
+                table = table.slice(0, limit)
+                total = self.conn.execute(f"SELECT count(*) FROM (\n{query}\n) AS bounded").fetchone()[0]
+            else:
+                total = table.num_rows
+            s.set(truncated=truncated)
+        return BoundedResult(table, total, truncated)
+
+    @contextmanager
+    def deadline(self, timeout: float = QUERY_TIMEOUT):
+        """
+        Interrupt whatever runs on this connection once ``timeout`` seconds have passed,
+        raising TimeoutError in the caller. No limit when ``timeout`` is 0.
+        """
+        import duckdb
+
+        if not timeout:
+            yield
+            return
+        if self.is_closed():
+            self.reconnect()
+        cursor = self.conn
+        fired = threading.Event()
+
+        def interrupt():
+            fired.set()
+            cursor.interrupt()
+
+        timer = threading.Timer(timeout, interrupt)
+        timer.daemon = True
+        timer.start()
+        try:
+            yield
+        except duckdb.Error as e:
+            if fired.is_set():
+                REGISTRY.inc("solar_query_timeouts_total")
+                raise TimeoutError(f"Query cancelled after {timeout:g}s") from e
+            raise
+        finally:
+            timer.cancel()
+
+    def rows_scanned(self) -> Optional[int]:
+        """Rows DuckDB scanned for the last query, once its result has been fetched."""
+        if not TRACE_ROWS_SCANNED or self.conn is None:
+            return None
+        return rows_scanned(self.conn)
+
     def close(self):
-        if self.conn:
-            self.conn.close()
-            print(f"✓ Closed database connection")
-    
+        """Return the borrowed cursor to the pool."""
+        if self.conn is not None:
+            self.pool.release(self.conn)
+            self.conn = None
+
     def __enter__(self):
         return self
-    
+
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.close()
 
 def get_connection() -> DatabaseConnection:
-    return DatabaseConnection()
\ No newline at end of file
+    return DatabaseConnection()
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+def get_db_executor() -> ThreadPoolExecutor:
+    """Worker threads for DuckDB calls from async code, one per pooled cursor."""
+    global _executor
+    if _executor is None:
+        with _pool_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix="duckdb")
+    return _executor
+
+def run_with_connection(fn: Callable, *args, **kwargs) -> Any:
+    """Call ``fn(conn, *args, **kwargs)`` with a connection borrowed from the pool, under QUERY_TIMEOUT."""
+    with get_connection() as conn, conn.deadline():
+        return fn(conn, *args, **kwargs)
+
+async def run_in_db_thread(fn: Callable, *args, **kwargs) -> Any:
+    """Async wrapper around run_with_connection that keeps DuckDB work off the event loop."""
+    loop = asyncio.get_running_loop()
+    # Run under a copy of the caller's context so tracing spans attach to its trace
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        get_db_executor(), partial(context.run, run_with_connection, fn, *args, **kwargs)
+    )
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build or refresh the DuckDB solar store.")
+    parser.add_argument("--rebuild", action="store_true", help="Ignore the manifest and rebuild from scratch")
+    args = parser.parse_args()
+    ensure_store(rebuild=args.rebuild)
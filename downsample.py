@@ -0,0 +1,101 @@
+import os
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Any, Optional
+from dotenv import load_dotenv
+from db import get_pool, run_with_connection
+
+load_dotenv()
+
+# Points per series sent to the browser: about one per horizontal pixel of the chart
+CHART_POINTS = int(os.getenv("SOLAR_CHART_POINTS", "800"))
+DOWNSAMPLE_CACHE_SIZE = 64
+# Bucket widths in seconds; the smallest one giving at most CHART_POINTS buckets is used,
+# so buckets start on round times and zoom levels repeat (and hit the cache)
+BUCKET_SECONDS = (
+    60, 300, 900, 1800, 3600, 3 * 3600, 6 * 3600, 12 * 3600,
+    86400, 2 * 86400, 7 * 86400, 14 * 86400, 28 * 86400, 91 * 86400, 364 * 86400,
+)
+
+@dataclass
+class Series:
+    df: Any  # pandas DataFrame indexed by time: "<col>" when raw, else "<col> min/avg/max"
+    rows: int  # source rows in the range
+    bucket: Optional[timedelta] = None  # bucket width, None when the rows are shown as they are
+
+def _quote(column: str) -> str:
+    return '"' + column.replace('"', '""') + '"'
+
+def time_series_columns(df) -> Optional[tuple]:
+    """(time column, [numeric columns]) of a query result that can be charted over time, else None."""
+    import pandas as pd
+
+    times = [c for c in df.columns if pd.api.types.is_datetime64_any_dtype(df[c])]
+    values = [c for c in df.columns if c not in times and pd.api.types.is_numeric_dtype(df[c])
+              and not pd.api.types.is_bool_dtype(df[c])]
+    if not times or not values:
+        return None
+    return times[0], values
+
+def _source(sql: str, time_col: str, columns, start=None, end=None) -> str:
+    where = []
+    if start is not None:
+        where.append(f"t >= TIMESTAMP '{start}'")
+    if end is not None:
+        where.append(f"t <= TIMESTAMP '{end}'")
+    cols = ", ".join(_quote(c) for c in columns)
+    return (
+        f"SELECT * FROM (SELECT {_quote(time_col)}::TIMESTAMP AS t, {cols} FROM (\n{sql}\n) AS q) AS s"
+        + (f" WHERE {' AND '.join(where)}" if where else "")
+    )
+
+def series_bounds(conn, sql: str, time_col: str) -> tuple:
+    """(first, last, rows) of ``time_col`` over the whole result of ``sql``."""
+    return tuple(conn.execute(
+        f"SELECT min({_quote(time_col)})::TIMESTAMP, max({_quote(time_col)})::TIMESTAMP, count({_quote(time_col)}) "
+        f"FROM (\n{sql}\n) AS q"
+    ).fetchone())
+
+def downsample(conn, sql: str, time_col: str, columns, start=None, end=None, points: int = CHART_POINTS) -> Series:
+    """
+    ``columns`` of ``sql``'s result over [start, end], reduced inside DuckDB to about
+    ``points`` time buckets.
+
+    Each bucket keeps the min, mean and max of every column, so spikes survive at any
+    zoom level; ranges with no more than ``points`` rows come back unchanged. Narrowing
+    [start, end] shrinks the buckets, so zooming in refines the series down to the raw rows.
+    """
+    source = _source(sql, time_col, columns, start, end)
+    rows, first, last = conn.execute(f"SELECT count(*), min(t), max(t) FROM ({source}) AS r").fetchone()
+    if rows <= points or first is None or first == last:
+        df = conn.execute(f"SELECT * FROM ({source}) AS r ORDER BY t").fetchdf()
+        return Series(df.set_index("t").rename_axis(time_col), rows)
+    needed = (last - first).total_seconds() / points
+    step = next((s for s in BUCKET_SECONDS if s >= needed), int(needed) + 1)
+    aggregates = ", ".join(
+        f"min({_quote(c)}) AS {_quote(c + ' min')}, avg({_quote(c)}) AS {_quote(c + ' avg')}, "
+        f"max({_quote(c)}) AS {_quote(c + ' max')}" for c in columns
+    )
+    df = conn.execute(
+        f"SELECT time_bucket(INTERVAL '{step} seconds', t) AS t, {aggregates} "
+        f"FROM ({source}) AS r GROUP BY 1 ORDER BY 1"
+    ).fetchdf()
+    return Series(df.set_index("t").rename_axis(time_col), rows, timedelta(seconds=step))
+
+@lru_cache(maxsize=DOWNSAMPLE_CACHE_SIZE)
+def _bounds_cached(version: str, sql: str, time_col: str) -> tuple:
+    return run_with_connection(series_bounds, sql, time_col)
+
+def chart_bounds(sql: str, time_col: str) -> tuple:
+    """series_bounds on a pooled connection, cached per data version."""
+    return _bounds_cached(get_pool().data_version, sql, time_col)
+
+@lru_cache(maxsize=DOWNSAMPLE_CACHE_SIZE)
+def _downsample_cached(version: str, sql: str, time_col: str, columns: tuple, start, end, points: int) -> Series:
+    return run_with_connection(downsample, sql, time_col, list(columns), start, end, points)
+
+def downsample_series(sql: str, time_col: str, columns, start: Optional[datetime] = None,
+                      end: Optional[datetime] = None, points: int = CHART_POINTS) -> Series:
+    """downsample on a pooled connection, cached per data version so revisited zoom levels are instant."""
+    return _downsample_cached(get_pool().data_version, sql, time_col, tuple(columns), start, end, points)
@@ -0,0 +1,95 @@
+import hashlib
+import os
+from typing import Callable
+from dotenv import load_dotenv
+from db import get_connection
+from result_cache import normalize_sql
+from sql_cache import CACHE_DIR
+
+load_dotenv()
+
+EXPORT_DIR = os.path.join(CACHE_DIR, "exports")
+EXPORT_TIMEOUT = float(os.getenv("SOLAR_EXPORT_TIMEOUT", "300"))
+EXPORT_KEEP_FILES = int(os.getenv("SOLAR_EXPORT_KEEP_FILES", "20"))
+
+# format -> (COPY options, file extension, MIME type, label)
+EXPORT_FORMATS = {
+    "csv": ("FORMAT CSV, HEADER", "csv", "text/csv", "CSV"),
+    "json": ("FORMAT JSON, ARRAY true", "json", "application/json", "JSON"),
+    "parquet": ("FORMAT PARQUET, COMPRESSION ZSTD", "parquet", "application/vnd.apache.parquet", "Parquet"),
+}
+
+def _sql_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+def export_path(sql: str, fmt: str, version: str) -> str:
+    digest = hashlib.sha256(normalize_sql(sql).encode("utf-8")).hexdigest()[:32]
+    return os.path.join(EXPORT_DIR, f"{version}-{digest}.{EXPORT_FORMATS[fmt][1]}")
+
+def export_query(conn, sql: str, fmt: str = "csv") -> str:
+    """
+    Write the full result of ``sql`` to a file with DuckDB's COPY and return its path.
+
+    Rows go straight from DuckDB to disk, so nothing is materialized in pandas. Files
+    are keyed by the data version and the canonical SQL, so a repeated download of the
+    same result reuses the file.
+
+    Parameters:
+        conn (DatabaseConnection): Connection to run the COPY on.
+        sql (str): SELECT statement that passed the safety check.
+        fmt (str): One of EXPORT_FORMATS.
+
+    Returns:
+        str: Path of the exported file.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}; expected one of {tuple(EXPORT_FORMATS)}")
+    path = export_path(sql, fmt, conn.data_version)
+    if os.path.exists(path):
+        os.utime(path)
+        return path
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    options = EXPORT_FORMATS[fmt][0]
+    try:
+        conn.execute(f"COPY (\n{sql}\n) TO {_sql_literal(tmp)} ({options})")
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    _trim_exports()
+    return path
+
+def export_file(sql: str, fmt: str = "csv") -> str:
+    """export_query on a pooled connection, interrupted after EXPORT_TIMEOUT seconds."""
+    with get_connection() as conn, conn.deadline(EXPORT_TIMEOUT):
+        return export_query(conn, sql, fmt)
+
+def export_loader(sql: str, fmt: str = "csv") -> Callable[[], bytes]:
+    """
+    Zero-argument callable producing the exported file's bytes, for st.download_button:
+    the export only runs when the user actually clicks download.
+    """
+
+    def load() -> bytes:
+        with open(export_file(sql, fmt), "rb") as f:
+            return f.read()
+
+    return load
+
+def _trim_exports() -> None:
+    """Keep only the EXPORT_KEEP_FILES most recently used exports."""
+    files = []
+    for name in os.listdir(EXPORT_DIR):
+        path = os.path.join(EXPORT_DIR, name)
+        if name.endswith(".tmp"):
+            continue
+        try:
+            files.append((os.stat(path).st_mtime, path))
+        except OSError:
+            continue
+    for _, path in sorted(files, reverse=True)[EXPORT_KEEP_FILES:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,293 @@
+import os
+import re
+from dataclasses import dataclass, replace
+from datetime import date, timedelta
+from typing import Optional
+from dotenv import load_dotenv
+from get_data import DEFAULT_P_STC, ROLLUP_TABLES, choose_rollup, metric_sql, site_capacity
+
+load_dotenv()
+
+# Answer recognized metric questions from a SQL template instead of the LLM agents
+FAST_PATH = os.getenv("SOLAR_FAST_PATH", "1") not in ("", "0", "false")
+GAMMA = -0.004  # temperature coefficient, as in calculate_temperature_corrected_pr
+LIST_PERIODS = 12  # periods spelled out in a breakdown answer
+
+# metric -> (answer title, result column, unit)
+METRICS = {
+    "energy": ("Total energy", "energy_kwh", "kWh"),
+    "specific_yield": ("Specific yield", "specific_yield_kwh_kwp", "kWh/kWp"),
+    "pr": ("Temperature-corrected PR", "pr_percent", "%"),
+    "peak_power": ("Peak power", "peak_power_kw", "kW"),
+}
+# Metrics whose breakdowns add up to a total
+SUMMED_METRICS = ("energy", "specific_yield")
+# (metric, pattern) in matching order; a question naming two metrics goes to the LLM
+METRIC_PATTERNS = (
+    ("pr", r"\b(?:temperature[- ]corrected\s+)?(?:performance\s+ratio|pr)\b"),
+    ("specific_yield", r"\bspecific\s+(?:energy\s+)?yield\b|\bkwh\s*/\s*kwp\b"),
+    ("peak_power", r"\b(?:peak|max(?:imum)?|highest)\s+(?:active\s+|ac\s+)?(?:power|output)\b"),
+    ("energy", r"\b(?:ac\s+)?(?:energy(?:\s+(?:output|production|generation))?|production|generation|kwh)\b"),
+)
+AGGREGATION_PATTERNS = (
+    ("hourly", r"\b(?:hourly|(?:by|per|each|every)\s+hour)\b"),
+    ("daily", r"\b(?:daily|(?:by|per|each|every)\s+day)\b"),
+    ("monthly", r"\b(?:monthly|month\s+by\s+month|(?:by|per|each|every)\s+month)\b"),
+    ("yearly", r"\b(?:yearly|annual(?:ly)?|(?:by|per|each|every)\s+year)\b"),
+)
+PERIOD_FORMATS = {"hourly": "%Y-%m-%d %H:00", "daily": "%Y-%m-%d", "monthly": "%Y-%m", "yearly": "%Y"}
+PERIOD_NAMES = {"hourly": "hour", "daily": "day", "monthly": "month", "yearly": "year"}
+# Words that may remain once the metric, breakdown, dates and site are taken out; anything
+# else ("average", "when", "compare", "last", a month without a year...) means the question
+# asks for more than the template computes
+FILLER_WORDS = frozenset("""
+    what what's whats is was were are the of for in on at during a an me us show give tell get find
+    calculate compute please total overall our my entire whole all plant farm system solar pv site sites
+    fleet combined how much many did do does we it produce produced generate generated deliver delivered
+    from between value output kw broken down breakdown
+""".split())
+RANGE_WORDS = ("to", "until", "till", "through", "-", "–")
+
+MONTHS = {
+    name: number
+    for number, names in enumerate((
+        ("january", "jan"), ("february", "feb"), ("march", "mar"), ("april", "apr"), ("may",),
+        ("june", "jun"), ("july", "jul"), ("august", "aug"), ("september", "sept", "sep"),
+        ("october", "oct"), ("november", "nov"), ("december", "dec"),
+    ), start=1)
+    for name in names
+}
+_MONTH = "|".join(sorted(MONTHS, key=len, reverse=True))
+_ORDINAL = "(?:st|nd|rd|th)?"
+DATE_RE = re.compile(
+    rf"\b(?:(?P<iso_day>\d{{4}}-\d{{2}}-\d{{2}})"
+    rf"|(?P<dmy_d>\d{{1,2}}){_ORDINAL}\s+(?P<dmy_m>{_MONTH})\s*,?\s+(?P<dmy_y>\d{{4}})"
+    rf"|(?P<mdy_m>{_MONTH})\s+(?P<mdy_d>\d{{1,2}}){_ORDINAL}\s*,?\s+(?P<mdy_y>\d{{4}})"
+    rf"|(?P<my_m>{_MONTH})\s*,?\s+(?P<my_y>\d{{4}})"
+    rf"|(?P<iso_month>\d{{4}}-\d{{2}})(?!-\d)"
+    rf"|q(?P<quarter>[1-4])\s+(?P<quarter_y>\d{{4}})"
+    rf"|(?P<year>(?:19|20)\d{{2}}))\b",
+    re.IGNORECASE,
+)
+
+@dataclass(frozen=True)
+class MetricQuery:
+    """A question the templates can answer, and (once built) the SQL that answers it."""
+    metric: str  # key of METRICS
+    aggregation: str = "default"  # 'default' or a ROLLUP_GRAINS level
+    start: Optional[str] = None  # inclusive YYYY-MM-DD, None for the start of the data
+    end: Optional[str] = None
+    label: str = "across all data"  # the date range in words, for the answer
+    site_id: Optional[str] = None
+    p_stc: Optional[float] = None  # capacity used for specific yield and PR
+    reporting: Optional[tuple] = None  # fleet yield/PR on a multi-site store: (sites with readings, sites, their kWp)
+    sql: Optional[str] = None
+
+def _month_end(year: int, month: int) -> date:
+    return (date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1))
+
+def _parse_date(m) -> tuple:
+    """(first day, last day, words) for one DATE_RE match; ValueError for impossible dates."""
+    g = m.groupdict()
+    if g["iso_day"]:
+        day = date.fromisoformat(g["iso_day"])
+        return day, day, day.isoformat()
+    for kind in ("dmy", "mdy"):
+        if g[f"{kind}_d"]:
+            day = date(int(g[f"{kind}_y"]), MONTHS[g[f"{kind}_m"].lower()], int(g[f"{kind}_d"]))
+            return day, day, day.isoformat()
+    if g["my_m"] or g["iso_month"]:
+        if g["my_m"]:
+            year, month = int(g["my_y"]), MONTHS[g["my_m"].lower()]
+        else:
+            year, month = map(int, g["iso_month"].split("-"))
+        first = date(year, month, 1)
+        return first, _month_end(year, month), first.strftime("%B %Y")
+    if g["quarter"]:
+        quarter, year = int(g["quarter"]), int(g["quarter_y"])
+        first = date(year, 3 * quarter - 2, 1)
+        return first, _month_end(year, 3 * quarter), f"Q{quarter} {year}"
+    year = int(g["year"])
+    return date(year, 1, 1), date(year, 12, 31), str(year)
+
+def _take(pattern: str, text: str):
+    """(matches of ``pattern``, ``text`` with them blanked out)."""
+    found = list(re.finditer(pattern, text))
+    return found, re.sub(pattern, " ", text)
+
+def parse_dates(text: str):
+    """
+    (start, end, label, remaining text) for the one date or date range in ``text``, or
+    None when there are more dates than that or one does not exist.
+    """
+    matches = list(DATE_RE.finditer(text))
+    try:
+        dates = [_parse_date(m) for m in matches]
+    except ValueError:
+        return None
+    if not dates:
+        return None, None, "across all data", text
+    if len(dates) == 1:
+        (first, last, words), m = dates[0], matches[0]
+        prefix = "on" if first == last else "in"
+        return first.isoformat(), last.isoformat(), f"{prefix} {words}", text[:m.start()] + " " + text[m.end():]
+    if len(dates) > 2:
+        return None
+    between = text[matches[0].end():matches[1].start()].strip()
+    if not (between in RANGE_WORDS or (between == "and" and re.search(r"\bbetween\s*$", text[:matches[0].start()]))):
+        return None
+    (first, _, start_words), (_, last, end_words) = dates
+    if last < first:
+        return None
+    rest = text[:matches[0].start()] + " " + text[matches[1].end():]
+    return first.isoformat(), last.isoformat(), f"from {start_words} to {end_words}", rest
+
+def parse_question(question: str, sites=()) -> Optional[MetricQuery]:
+    """
+    MetricQuery for a question the templates answer exactly, e.g. "total energy in June
+    2024", "specific yield for 2025 by month" or "peak power in March 2025", else None.
+
+    Conservative by design: one metric, at most one breakdown and one date or date range,
+    an optional known site, and nothing but FILLER_WORDS around them.
+    """
+    text = question.lower()
+    metrics = set()
+    for metric, pattern in METRIC_PATTERNS:
+        found, text = _take(pattern, text)
+        if found:
+            metrics.add(metric)
+    aggregations = set()
+    for aggregation, pattern in AGGREGATION_PATTERNS:
+        found, text = _take(pattern, text)
+        if found:
+            aggregations.add(aggregation)
+    if len(metrics) != 1 or len(aggregations) > 1:
+        return None
+    site_id = None
+    if sites:
+        by_name = {s.lower(): s for s in sites}
+        found, text = _take(r"\b(?:" + "|".join(re.escape(s) for s in sorted(by_name, key=len, reverse=True)) + r")\b", text)
+        named = {by_name[m.group(0)] for m in found}
+        if len(named) > 1:
+            return None
+        site_id = next(iter(named), None)
+    dates = parse_dates(text)
+    if dates is None:
+        return None
+    start, end, label, text = dates
+    if any(word not in FILLER_WORDS for word in re.findall(r"[\w']+", text)):
+        return None
+    return MetricQuery(metrics.pop(), next(iter(aggregations), "default"), start, end, label, site_id)
+
+def reporting_sites(conn, start: Optional[str] = None, end: Optional[str] = None) -> tuple:
+    """(sites with readings in [start, end], sites in site_metadata, kWp of the former) on a multi-site store."""
+    level = choose_rollup(conn, "default", start, end)
+    source, time_col = (ROLLUP_TABLES[level], "bucket") if level is not None else ("solar", "timestamp")
+    where = []
+    if start is not None:
+        where.append(f"{time_col} >= DATE '{start}'")
+    if end is not None:
+        where.append(f"{time_col} < DATE '{end}' + INTERVAL 1 DAY")
+    where_sql = f" WHERE {' AND '.join(where)}" if where else ""
+    reporting, sites, kwp = conn.execute(
+        "SELECT count(*) FILTER (WHERE reporting), count(*), coalesce(sum(p_stc_kw) FILTER (WHERE reporting), 0) "
+        f"FROM (SELECT p_stc_kw, site_id IN (SELECT DISTINCT site_id FROM {source}{where_sql}) AS reporting "
+        "FROM site_metadata) AS m"
+    ).fetchone()
+    return reporting, sites, float(kwp)
+
+def metric_query_sql(conn, query: MetricQuery) -> MetricQuery:
+    """
+    ``query`` with its SQL: the metric computed in DuckDB over the best rollup (see
+    get_data.metric_sql), rounded like the calculate_* functions. Periods, or the whole
+    range, without readings return no row. Energy and yield breakdowns also carry
+    ``total_<column>``, the sum of the unrounded per-period values rounded once.
+    """
+    measures = {
+        "energy": ["energy_kwh"],
+        "specific_yield": ["energy_kwh"],
+        "pr": ["energy_kwh", "pr_irradiance", "pr_irradiance_temp"],
+        "peak_power": ["peak_power_kw"],
+    }[query.metric]
+    p_stc = reporting = None
+    if query.metric in ("specific_yield", "pr"):
+        fleet = site_capacity(conn) if query.site_id is None else None
+        p_stc = site_capacity(conn, query.site_id) or DEFAULT_P_STC
+        if fleet is not None:
+            # Sites without readings in the range still count in the fleet's P_STC (as in
+            # calculate_specific_yield) but not in the PR weighting; the answer says which
+            reporting = reporting_sites(conn, query.start, query.end)
+        if query.metric == "pr" and fleet is not None:
+            # Multi-site fleet: each site's irradiance weighted by its own capacity
+            measures = ["energy_kwh", "rated_irradiance", "rated_irradiance_temp"]
+    inner = metric_sql(conn, ["samples", *measures], query.aggregation, query.start, query.end, query.site_id)
+    column = METRICS[query.metric][1]
+    value = {
+        "energy": "energy_kwh",
+        "specific_yield": f"energy_kwh / {p_stc!r}",
+        "pr": (
+            f"100 * energy_kwh / NULLIF(rated_irradiance + {GAMMA!r} * rated_irradiance_temp, 0)"
+            if "rated_irradiance" in measures else
+            f"100 * energy_kwh / NULLIF({p_stc!r} * (pr_irradiance + {GAMMA!r} * pr_irradiance_temp), 0)"
+        ),
+        "peak_power": "peak_power_kw",
+    }[query.metric]
+    period = "timestamp AS period, " if query.aggregation != "default" else ""
+    order = " ORDER BY period" if period else ""
+    total = f", round(sum({value}) OVER (), 2) AS total_{column}" if period and query.metric in SUMMED_METRICS else ""
+    sql = f"SELECT {period}round({value}, 2) AS {column}{total} FROM ({inner}) AS m WHERE samples > 0{order}"
+    return replace(query, sql=sql, p_stc=p_stc, reporting=reporting)
+
+def known_sites(conn) -> list:
+    exists = conn.execute(
+        "SELECT count(*) FROM duckdb_tables() WHERE table_name = 'site_metadata'"
+    ).fetchone()[0]
+    return [row[0] for row in conn.execute("SELECT site_id FROM site_metadata").fetchall()] if exists else []
+
+def match_question(conn, question: str) -> Optional[MetricQuery]:
+    """parse_question against the sites in the store, with the SQL built; None to use the LLM."""
+    if not FAST_PATH:
+        return None
+    query = parse_question(question, known_sites(conn))
+    return metric_query_sql(conn, query) if query is not None else None
+
+def _number(value, unit: str) -> str:
+    import pandas as pd
+
+    if value is None or pd.isna(value):
+        return "n/a"
+    return f"{value:,.2f} {unit}" if unit != "%" else f"{value:,.2f}%"
+
+def format_answer(query: MetricQuery, df) -> str:
+    """The natural-language answer for a fast-path result, in place of answer_agent's."""
+    title, column, unit = METRICS[query.metric]
+    where = f" at {query.site_id}" if query.site_id else ""
+    basis = ""
+    gamma = f", γ {GAMMA}/°C" if query.metric == "pr" else ""
+    if query.reporting is not None:
+        reporting, sites, kwp = query.reporting
+        coverage = f"all {sites} sites" if reporting == sites else f"the {reporting} of {sites} sites with readings"
+        if query.metric == "pr":
+            basis = f" (capacity-weighted over {coverage}, {kwp:,.1f} kWp{gamma})"
+        else:
+            basis = f" (fleet-wide P_STC {query.p_stc:,.1f} kWp" + (
+                f"; only {reporting} of {sites} sites have readings)" if reporting < sites else ")")
+    elif query.p_stc is not None:
+        basis = f" (P_STC {query.p_stc:,.1f} kWp{gamma})"
+    if df is None or len(df) == 0:
+        return f"No readings {query.label}{where}."
+    if query.aggregation == "default":
+        return f"{title} {query.label}{where}: {_number(df[column].iloc[0], unit)}{basis}."
+    values = df.set_index("period")[column]
+    fmt = PERIOD_FORMATS[query.aggregation]
+    lines = [f"{title} by {PERIOD_NAMES[query.aggregation]} {query.label}{where}{basis}, {len(values)} periods."]
+    if len(values) <= LIST_PERIODS:
+        lines += [f"- {period:{fmt}}: {_number(value, unit)}" for period, value in values.items()]
+    if query.metric in SUMMED_METRICS:
+        lines.append(f"Total: {_number(df[f'total_{column}'].iloc[0], unit)}.")
+    if values.notna().any():
+        lines.append(
+            f"Highest: {values.idxmax():{fmt}} ({_number(values.max(), unit)}); "
+            f"lowest: {values.idxmin():{fmt}} ({_number(values.min(), unit)})."
+        )
+    return "\n".join(lines)
@@ -1,9 +1,52 @@
-import pandas as pd
-import numpy as np
+import os
 
-def preprocess_data():
-    data = pd.read_csv('5-Site_DG-PV1-DB-DG-M1A.csv')
+DATA_FILE = '5-Site_DG-PV1-DB-DG-M1A.csv'
+CHUNK_ROWS = int(os.getenv('SOLAR_INGEST_CHUNK_ROWS', '250000'))
+# Rows outside this window are dropped during cleaning
+TRIM_START = os.getenv('SOLAR_TRIM_START', '2024-01-01')
+TRIM_END = os.getenv('SOLAR_TRIM_END', '2025-08-31')
+# Capacity used when neither the caller nor the site_metadata table provides one
+DEFAULT_P_STC = float(os.getenv('SOLAR_DEFAULT_P_STC', '1058.4'))
 
+def preprocess_data(path=DATA_FILE, chunksize=None):
+    """
+    Load and clean a site CSV.
+
+    With ``chunksize`` the file is streamed through iter_clean_chunks; the result is
+    identical to the in-memory path but peak memory stays around one chunk.
+    """
+    import pandas as pd
+
+    if chunksize:
+        temp_bounds, dtypes = scan_csv(path, chunksize)
+        return pd.concat(list(iter_clean_chunks(path, temp_bounds, dtypes, chunksize)))
+    data = pd.read_csv(path)
+    data, _ = clean_data(data)
+    return data
+
+def clean_data(data, temp_bounds=None):
+    """
+    Apply the cleaning rules to raw sensor rows.
+
+    Parameters:
+        data (DataFrame): Raw rows as read from the site CSV.
+        temp_bounds (tuple): (lower, upper) ambient temperature thresholds. When None they are
+                             computed from the 1st/99th percentiles of ``data``; pass the stored
+                             thresholds to clean appended rows consistently with the original build.
+
+    Returns:
+        tuple: (cleaned DataFrame, (lower, upper) thresholds used).
+    """
+    data = _drop_invalid_readings(data)
+
+    # Step 4: Remove duplicate timestamps
+    data = data.drop_duplicates(subset=['timestamp'])
+
+    if temp_bounds is None:
+        temp_bounds = temperature_bounds(data)
+    return _drop_outliers(data, temp_bounds), temp_bounds
+
+def _drop_invalid_readings(data):
     # Step 1: Remove negative power values
     data = data[data['Active_Power'] >= 0]
 
@@ -11,17 +54,13 @@ def preprocess_data():
     data = data[data['Global_Horizontal_Radiation'] >= 10]
     data = data[data['Pyranometer_1'] >= 10]
     # Step 3: Handle missing values (50k missing, < 5% total, fine!)
-    data.dropna(inplace=True)
+    return data.dropna()
 
-    # Step 4: Remove duplicate timestamps
-    data = data.drop_duplicates(subset=['timestamp'])
+def _drop_outliers(data, temp_bounds):
+    import pandas as pd
 
     # Step 5: Remove temperature outliers
-    lower_percentile = 1
-    upper_percentile = 99
-
-    lower_threshold = np.percentile(data['Weather_Temperature_Celsius'].dropna(), lower_percentile)
-    upper_threshold = np.percentile(data['Weather_Temperature_Celsius'].dropna(), upper_percentile)
+    lower_threshold, upper_threshold = temp_bounds
 
     data = data[(data['Weather_Temperature_Celsius'] >= lower_threshold) &
                 (data['Weather_Temperature_Celsius'] <= upper_threshold)]
@@ -34,82 +73,436 @@ def preprocess_data():
     # ensure timestamp is in datetime format
     data['timestamp'] = pd.to_datetime(data['timestamp'])
     # data = data.set_index('timestamp')
-    # # Trim data to only include rows from 2024-01-01 to 2025-08-31
-    data = data[(data['timestamp'] >= '2024-01-01') & (data['timestamp'] <= '2025-08-31')]
+    # # Trim data to only include rows from 2024-01-01 to 2025-08-31 (TRIM_START/TRIM_END)
+    data = data[(data['timestamp'] >= TRIM_START) & (data['timestamp'] <= TRIM_END)]
     # Energy = Power * Time (5 minutes = 5/60 hours)
     data['Energy_kWh'] = data['Active_Power'] * (5 / 60)
     return data
 
+def temperature_bounds(data, lower_percentile=1, upper_percentile=99):
+    temps = data['Weather_Temperature_Celsius'].dropna()
+    return _percentile_bounds(temps, lower_percentile, upper_percentile)
+
+def _percentile_bounds(temps, lower_percentile=1, upper_percentile=99):
+    import numpy as np
+
+    lower_threshold = np.percentile(temps, lower_percentile)
+    upper_threshold = np.percentile(temps, upper_percentile)
+    return float(lower_threshold), float(upper_threshold)
+
+class _SeenTimestamps:
+    """
+    Timestamps already kept, stored as a sorted array of 64-bit hashes of the raw strings
+    (8 bytes per row instead of a Python set of strings).
+    """
+
+    def __init__(self):
+        import numpy as np
+
+        self.hashes = np.empty(0, dtype=np.uint64)
+
+    def first_occurrences(self, chunk):
+        """Rows of ``chunk`` whose timestamp has not been seen before (first one wins, as drop_duplicates)."""
+        import numpy as np
+        import pandas as pd
+
+        hashes = pd.util.hash_pandas_object(chunk['timestamp'], index=False).to_numpy()
+        keep = ~pd.Series(hashes).duplicated().to_numpy() & ~np.isin(hashes, self.hashes)
+        self.hashes = np.union1d(self.hashes, hashes[keep])
+        return chunk[keep]
+
+def _read_chunks(path, chunksize, dtypes=None):
+    import pandas as pd
+
+    return pd.read_csv(path, chunksize=chunksize, dtype=dtypes)
+
+def scan_csv(path=DATA_FILE, chunksize=CHUNK_ROWS):
+    """
+    First pass of the streaming pipeline.
+
+    Computes the exact 1st/99th temperature percentiles over the rows that survive
+    steps 1-4 (only that one column is kept, 8 bytes per row) and the dtype each numeric
+    column would get from a single whole-file read, so every chunk is parsed alike.
+
+    Returns:
+        tuple: ((lower, upper) thresholds, {column: dtype} for numeric columns).
+    """
+    import numpy as np
+    import pandas as pd
+
+    seen = _SeenTimestamps()
+    temps = []
+    column_dtypes = {}
+    for chunk in _read_chunks(path, chunksize):
+        for column, dtype in chunk.dtypes.items():
+            column_dtypes.setdefault(column, []).append(dtype)
+        chunk = seen.first_occurrences(_drop_invalid_readings(chunk))
+        temps.append(chunk['Weather_Temperature_Celsius'].dropna().to_numpy())
+
+    dtypes = {}
+    for column, seen_dtypes in column_dtypes.items():
+        if all(pd.api.types.is_numeric_dtype(d) and not pd.api.types.is_bool_dtype(d) for d in seen_dtypes):
+            dtypes[column] = np.result_type(*seen_dtypes)
+    all_temps = np.concatenate(temps) if temps else np.empty(0)
+    return _percentile_bounds(all_temps), dtypes
+
+def iter_clean_chunks(path=DATA_FILE, temp_bounds=None, dtypes=None, chunksize=CHUNK_ROWS):
+    """
+    Second pass of the streaming pipeline: yield cleaned DataFrame chunks.
+
+    Applies the same rules, in the same order, as clean_data; concatenating the chunks
+    gives exactly what preprocess_data() returns for the whole file.
+    """
+    if temp_bounds is None:
+        temp_bounds, dtypes = scan_csv(path, chunksize)
+    seen = _SeenTimestamps()
+    for chunk in _read_chunks(path, chunksize, dtypes):
+        chunk = seen.first_occurrences(_drop_invalid_readings(chunk))
+        yield _drop_outliers(chunk, temp_bounds)
+
+def read_appended_rows(path, offset):
+    """
+    Read only the rows appended to a CSV after ``offset`` bytes.
+
+    The header line is re-attached so the tail parses with the same columns as the full file.
+    Returns None when ``offset`` does not fall on a line boundary (the file was rewritten, not appended).
+    """
+    import io
+    import pandas as pd
+
+    with open(path, 'rb') as f:
+        header = f.readline()
+        if offset < len(header):
+            return None
+        f.seek(offset - 1)
+        if f.read(1) != b'\n':
+            return None
+        tail = f.read()
+    if not tail.strip():
+        return pd.DataFrame(columns=pd.read_csv(io.BytesIO(header)).columns)
+    return pd.read_csv(io.BytesIO(header + tail))
+
+# pandas frequency of each period start, used to fill periods without readings
 freq_map = {
         'hourly': 'h',
         'daily': 'D',
-        'monthly': 'M',
-        'yearly': 'Y'
+        'monthly': 'MS',
+        'yearly': 'YS'
+    }
+
+# Pre-aggregated rollups built at ingestion time (see db.build_rollups)
+ROLLUP_GRAINS = {
+    'hourly': 'hour',
+    'daily': 'day',
+    'monthly': 'month',
+    'yearly': 'year',
+}
+ROLLUP_TABLES = {aggregation: f'solar_{aggregation}' for aggregation in ROLLUP_GRAINS}
+
+# measure -> (expression over a rollup table, expression over raw solar rows)
+# The PR denominator is P_STC * (pr_irradiance + gamma * pr_irradiance_temp), which keeps
+# the rollups independent of the capacity and temperature coefficient.
+MEASURES = {
+    'samples': ('sum(samples)', 'count(*)'),
+    'energy_kwh': ('sum(energy_kwh)', 'sum(Energy_kWh)'),
+    'pr_irradiance': ('sum(pr_irradiance)', 'sum(Pyranometer_1 / 1000)'),
+    'pr_irradiance_temp': ('sum(pr_irradiance_temp)', 'sum(Pyranometer_1 / 1000 * (Temperature_Probe_1 - 25))'),
+    'peak_power_kw': ('max(peak_power_kw)', 'max(Active_Power)'),
+    # Capacity-weighted PR denominators for multi-site stores (p_stc_kw joined from site_metadata)
+    'rated_irradiance': ('sum(pr_irradiance * p_stc_kw)', 'sum(Pyranometer_1 / 1000 * p_stc_kw)'),
+    'rated_irradiance_temp': ('sum(pr_irradiance_temp * p_stc_kw)', 'sum(Pyranometer_1 / 1000 * (Temperature_Probe_1 - 25) * p_stc_kw)'),
+}
+CAPACITY_MEASURES = {'rated_irradiance', 'rated_irradiance_temp'}
+
+def sql_literals(values):
+    return ', '.join("'" + str(v).replace("'", "''") + "'" for v in values)
+
+def rollup_select_sql(aggregation, since=None, by_site=False, sites=None):
+    """
+    SELECT that builds one rollup level.
+
+    Hourly buckets come from the raw rows; each coarser level is re-aggregated from the
+    next finer rollup, so temperature means are carried as sums and divided at the end.
+    With ``by_site`` the buckets are kept per site_id (multi-site stores), optionally only
+    for the given ``sites``.
+    """
+    import pandas as pd
+
+    grain = ROLLUP_GRAINS[aggregation]
+    levels = list(ROLLUP_GRAINS)
+    time_col = 'timestamp' if aggregation == 'hourly' else 'bucket'
+    conditions = []
+    if since is not None:
+        conditions.append(f"{time_col} >= date_trunc('{grain}', TIMESTAMP '{pd.Timestamp(since)}')")
+    if sites is not None:
+        conditions.append(f"site_id IN ({sql_literals(sites)})")
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    site_col = 'site_id, ' if by_site else ''
+    group = 'GROUP BY site_id, bucket' if by_site else 'GROUP BY 1'
+    if aggregation == 'hourly':
+        return f"""
+            SELECT {site_col}date_trunc('hour', timestamp) AS bucket,
+                   count(*) AS samples,
+                   sum(Energy_kWh) AS energy_kwh,
+                   max(Active_Power) AS peak_power_kw,
+                   sum(Pyranometer_1 / 1000) AS pr_irradiance,
+                   sum(Pyranometer_1 / 1000 * (Temperature_Probe_1 - 25)) AS pr_irradiance_temp,
+                   sum(Weather_Temperature_Celsius) AS weather_temp_sum,
+                   sum(Temperature_Probe_1) AS module_temp_sum,
+                   avg(Weather_Temperature_Celsius) AS avg_weather_temp_c,
+                   avg(Temperature_Probe_1) AS avg_module_temp_c
+            FROM solar {where}
+            {group}
+        """
+    source = ROLLUP_TABLES[levels[levels.index(aggregation) - 1]]
+    return f"""
+        SELECT {site_col}date_trunc('{grain}', bucket) AS bucket,
+               sum(samples)::BIGINT AS samples,
+               sum(energy_kwh) AS energy_kwh,
+               max(peak_power_kw) AS peak_power_kw,
+               sum(pr_irradiance) AS pr_irradiance,
+               sum(pr_irradiance_temp) AS pr_irradiance_temp,
+               sum(weather_temp_sum) AS weather_temp_sum,
+               sum(module_temp_sum) AS module_temp_sum,
+               sum(weather_temp_sum) / sum(samples) AS avg_weather_temp_c,
+               sum(module_temp_sum) / sum(samples) AS avg_module_temp_c
+        FROM {source} {where}
+        {group}
+    """
+
+def _date_bounds(start=None, end=None):
+    """Inclusive start/end dates -> (start, exclusive stop) timestamps."""
+    import pandas as pd
+
+    lo = pd.Timestamp(start).normalize() if start is not None else None
+    hi = pd.Timestamp(end).normalize() + pd.Timedelta(days=1) if end is not None else None
+    return lo, hi
+
+def _is_aligned(ts, aggregation):
+    if ts is None:
+        return True
+    if aggregation == 'monthly':
+        return ts.day == 1
+    if aggregation == 'yearly':
+        return ts.day == 1 and ts.month == 1
+    return True
+
+def choose_rollup(conn, aggregation='default', start=None, end=None):
+    """
+    Pick the coarsest rollup table that can answer a query at ``aggregation`` over
+    [start, end], or None when the rollups are missing and raw rows must be scanned.
+    """
+    existing = {
+        row[0] for row in conn.execute(
+            "SELECT table_name FROM duckdb_tables() WHERE table_name LIKE 'solar_%'"
+        ).fetchall()
     }
+    lo, hi = _date_bounds(start, end)
+    levels = list(ROLLUP_GRAINS)
+    finest_allowed = len(levels) if aggregation == 'default' else levels.index(aggregation) + 1
+    for level in reversed(levels[:finest_allowed]):
+        if ROLLUP_TABLES[level] in existing and _is_aligned(lo, level) and _is_aligned(hi, level):
+            return level
+    return None
 
-def calculate_total_energy(data, aggregation='default'):
+def metric_sql(conn, measures, aggregation='default', start=None, end=None, site_id=None):
+    """
+    Build the SQL computing ``measures`` (keys of MEASURES) over [start, end],
+    grouped into ``aggregation`` periods, routed to the best rollup table.
+    ``site_id`` restricts a multi-site store to one site (pruning the other partitions).
+    """
+    level = choose_rollup(conn, aggregation, start, end)
+    if level is None:
+        source, time_col, pick = 'solar', 'timestamp', 1
+    else:
+        source, time_col, pick = ROLLUP_TABLES[level], 'bucket', 0
+    if CAPACITY_MEASURES.intersection(measures):
+        source = f"(SELECT s.*, m.p_stc_kw FROM {source} s JOIN site_metadata m USING (site_id)) AS s"
+
+    select = [f"coalesce({MEASURES[m][pick]}, 0) AS {m}" if m != 'peak_power_kw'
+              else f"{MEASURES[m][pick]} AS {m}" for m in measures]
+    group = ''
+    if aggregation != 'default':
+        select.insert(0, f"date_trunc('{ROLLUP_GRAINS[aggregation]}', {time_col}) AS timestamp")
+        group = ' GROUP BY 1 ORDER BY 1'
+
+    lo, hi = _date_bounds(start, end)
+    where = []
+    if lo is not None:
+        where.append(f"{time_col} >= TIMESTAMP '{lo}'")
+    if hi is not None:
+        where.append(f"{time_col} < TIMESTAMP '{hi}'")
+    if site_id is not None:
+        where.append(f"site_id = {sql_literals([site_id])}")
+    where_sql = f" WHERE {' AND '.join(where)}" if where else ''
+    return f"SELECT {', '.join(select)} FROM {source}{where_sql}{group}"
+
+def query_metrics(data, measures, aggregation='default', start=None, end=None, site_id=None):
+    """
+    Compute ``measures`` as a pushed-down DuckDB aggregate.
+
+    ``data`` is either a database connection (read from the rollups or the solar table)
+    or a DataFrame, which is scanned in place through an in-memory DuckDB view instead
+    of adding intermediate columns to it. Aggregated results cover every period between
+    the first and last one, with empty periods summing to 0 like pandas resample().
+    """
+    import numpy as np
+    import pandas as pd
+
+    if _is_dataframe(data):
+        conn = _frame_connection(data)
+        try:
+            return query_metrics(conn, measures, aggregation, start, end, site_id)
+        finally:
+            conn.close()
+
+    df = data.execute(metric_sql(data, measures, aggregation, start, end, site_id)).fetchdf()
+    if aggregation == 'default':
+        return df
+    df = df.set_index('timestamp')
+    if len(df):
+        periods = pd.date_range(df.index.min(), df.index.max(), freq=freq_map[aggregation], name='timestamp')
+        fill = {m: (np.nan if m == 'peak_power_kw' else 0.0) for m in measures}
+        df = df.reindex(periods).fillna(fill)
+    return df
+
+def _frame_connection(data):
+    """In-memory DuckDB connection exposing ``data`` as the solar table (no copy of the columns)."""
+    import duckdb
+
+    if 'timestamp' not in data.columns:
+        data = data.reset_index()
+    conn = duckdb.connect()
+    conn.register('solar', data)
+    return conn
+
+def _is_dataframe(data):
+    import pandas as pd
+
+    return isinstance(data, pd.DataFrame)
+
+def site_capacity(data, site_id=None):
+    """
+    Installed capacity (kWp) from the site_metadata table of a multi-site store: the
+    site's own, or the whole fleet's when ``site_id`` is None. None when there is no
+    metadata (single-site stores and DataFrames).
+    """
+    if _is_dataframe(data):
+        return None
+    exists = data.execute(
+        "SELECT count(*) FROM duckdb_tables() WHERE table_name = 'site_metadata'"
+    ).fetchone()[0]
+    if not exists:
+        return None
+    if site_id is None:
+        row = data.execute("SELECT sum(p_stc_kw) FROM site_metadata").fetchone()
+    else:
+        row = data.execute(f"SELECT p_stc_kw FROM site_metadata WHERE site_id = {sql_literals([site_id])}").fetchone()
+        if row is None:
+            raise ValueError(f"Unknown site_id {site_id!r}")
+    return float(row[0]) if row and row[0] is not None else None
+
+def calculate_total_energy(data, aggregation='default', start=None, end=None, site_id=None):
     """
     Calculate cumulative AC energy output for the specified period.
 
     Parameters:
-        data (DataFrame): The input data containing 'timestamp' and 'Active_Power'.
+        data (DataFrame or connection): The input data containing 'timestamp' and 'Energy_kWh',
+                                        or a database connection to read the rollup tables from.
         aggregation (str): Aggregation level - 'default', 'hourly', 'daily', 'monthly', 'yearly'.
+        start, end (str): Optional inclusive date range (YYYY-MM-DD).
+        site_id (str): Restrict a multi-site store to one site; None for the whole fleet.
 
     Returns:
-        float or DataFrame: Total energy in kWh, with breakdown if requested.
+        float or Series: Total energy in kWh, with breakdown (indexed by period start) if requested.
     """
+    df = query_metrics(data, ['energy_kwh'], aggregation, start, end, site_id)
     if aggregation == 'default':
-        total_energy = data['Energy_kWh'].sum()
-        return round(total_energy, 2)
-    freq = freq_map[aggregation]
-    return data['Energy_kWh'].resample(freq).sum().round(2)
+        return round(float(df['energy_kwh'].iloc[0]), 2)
+    return df['energy_kwh'].rename('Energy_kWh').round(2)
 
-def calculate_specific_yield(data, P_STC=1058.4, aggregation='default'):
+def calculate_specific_yield(data, P_STC=None, aggregation='default', start=None, end=None, site_id=None):
     """
     Calculate Specific Yield (kWh/kWp) for the specified period.
 
     Parameters:
-        data (DataFrame): The input data containing 'timestamp' and 'Active_Power'.
-        installed_capacity_kWp (float): The installed capacity of the system in kWp.
+        data (DataFrame or connection): The input data containing 'timestamp' and 'Energy_kWh',
+                                        or a database connection to read the rollup tables from.
+        P_STC (float): The installed capacity of the system in kWp. When None, the site's (or
+                       the fleet's) capacity from site_metadata, else DEFAULT_P_STC.
         aggregation (str): Aggregation level - 'default', 'hourly', 'daily', 'monthly', 'yearly'.
+        start, end (str): Optional inclusive date range (YYYY-MM-DD).
+        site_id (str): Restrict a multi-site store to one site; None for the whole fleet.
 
     Returns:
-        float or DataFrame: Specific Yield (kWh/kWp) for the time period, with breakdown if requested.
+        float or Series: Specific Yield (kWh/kWp) for the time period, with breakdown if requested.
     """
-    result = calculate_total_energy(data, aggregation) / P_STC
+    if P_STC is None:
+        P_STC = site_capacity(data, site_id) or DEFAULT_P_STC
+    result = calculate_total_energy(data, aggregation, start, end, site_id) / P_STC
     if isinstance(result, (float, int)):
         return round(result, 2)
     elif hasattr(result, 'round'):
         return result.round(2)
     return result
 
-def calculate_temperature_corrected_pr(data, P_STC=1058.4, gamma=-0.004, aggregation='default'):
+def calculate_temperature_corrected_pr(data, P_STC=None, gamma=-0.004, aggregation='default', start=None, end=None, site_id=None):
     """
     Calculate Temperature-Corrected Performance Ratio (PR) for the specified period.
 
+    PR = sum(Energy_kWh) / sum(P_STC * Pyranometer_1 / 1000 * (1 + gamma * (Temperature_Probe_1 - 25))) * 100,
+    evaluated as P_STC * (sum(Pyranometer_1 / 1000) + gamma * sum(Pyranometer_1 / 1000 * (Temperature_Probe_1 - 25)))
+    so no per-row columns are materialized. Across several sites of a multi-site store each
+    site's irradiance is weighted by its own capacity from site_metadata.
+
     Parameters:
-        data (DataFrame): Must include 'timestamp', 'Active_Power',
-                          'Global_Horizontal_Radiation', and 'Weather_Temperature_Celsius'.
-        P_STC (float): Rated DC capacity at STC (kW).
+        data (DataFrame or connection): Must include 'timestamp', 'Energy_kWh', 'Pyranometer_1'
+                          and 'Temperature_Probe_1', or be a database connection.
+        P_STC (float): Rated DC capacity at STC (kW). When None, taken from site_metadata,
+                       else DEFAULT_P_STC.
         gamma (float): Temperature coefficient (-0.004/°C for poly-Si).
         aggregation (str): 'default', 'hourly', 'daily', 'monthly', or 'yearly'.
+        start, end (str): Optional inclusive date range (YYYY-MM-DD).
+        site_id (str): Restrict a multi-site store to one site; None for the whole fleet.
 
     Returns:
-        float or DataFrame: Temperature-corrected PR as percentage.
+        float or Series: Temperature-corrected PR as percentage.
     """
-    data['Temp_Correction'] = 1 + gamma * (data['Temperature_Probe_1'] - 25)
-    data['PR_Denominator'] = 1058.4 * (data['Pyranometer_1'] / 1000) * data['Temp_Correction']
-    data['PR'] = (data['Energy_kWh'] / data['PR_Denominator']) * 100
+    import numpy as np
 
+    if P_STC is None and site_id is None and site_capacity(data) is not None:
+        df = query_metrics(data, ['energy_kwh', 'rated_irradiance', 'rated_irradiance_temp'], aggregation, start, end)
+        denominator = df['rated_irradiance'] + gamma * df['rated_irradiance_temp']
+    else:
+        if P_STC is None:
+            P_STC = site_capacity(data, site_id) or DEFAULT_P_STC
+        df = query_metrics(data, ['energy_kwh', 'pr_irradiance', 'pr_irradiance_temp'], aggregation, start, end, site_id)
+        denominator = P_STC * (df['pr_irradiance'] + gamma * df['pr_irradiance_temp'])
     if aggregation == 'default':
-        total_energy = data['Energy_kWh'].sum()
-        total_denominator = data['PR_Denominator'].sum()
+        total_energy = float(df['energy_kwh'].iloc[0])
+        total_denominator = float(denominator.iloc[0])
         pr = (total_energy / total_denominator) * 100 if total_denominator > 0 else np.nan
         return round(pr, 2)
-    
-    freq = freq_map.get(aggregation, 'D')
+    return ((df['energy_kwh'] / denominator) * 100).rename('PR').round(2)
+
+def calculate_peak_power(data, aggregation='default', start=None, end=None, site_id=None):
+    """
+    Maximum recorded AC output (kW) for the specified period.
 
-    energy_agg = data['Energy_kWh'].resample(freq).sum()
-    denom_agg = data['PR_Denominator'].resample(freq).sum()
-    pr_series = (energy_agg / denom_agg) * 100
-    return pr_series.round(2)
\ No newline at end of file
+    Parameters:
+        data (DataFrame or connection): Must include 'timestamp' and 'Active_Power', or be a database connection.
+        aggregation (str): 'default', 'hourly', 'daily', 'monthly', or 'yearly'.
+        start, end (str): Optional inclusive date range (YYYY-MM-DD).
+        site_id (str): Restrict a multi-site store to one site; None for the largest single-site reading.
+
+    Returns:
+        float or Series: Peak power in kW.
+    """
+    import numpy as np
+    import pandas as pd
+
+    df = query_metrics(data, ['peak_power_kw'], aggregation, start, end, site_id)
+    if aggregation == 'default':
+        value = df['peak_power_kw'].iloc[0]
+        return round(float(value), 2) if pd.notna(value) else np.nan
+    return df['peak_power_kw'].rename('Active_Power').round(2)
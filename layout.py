@@ -0,0 +1,202 @@
+import os
+import time
+from typing import Optional
+from dotenv import load_dotenv
+from db import _enable_profiling, has_table, rows_scanned
+
+load_dotenv()
+
+# Table comment marking a solar table that went through optimize_layout
+LAYOUT_VERSION = "layout:v1"
+# Largest absolute rounding error accepted when a DOUBLE column is stored as FLOAT
+LAYOUT_TOLERANCE = float(os.getenv("SOLAR_LAYOUT_TOLERANCE", "0.001"))
+# Columns the prompts, metric tools and rollups read; the rest move to EXTRA_TABLE
+HOT_COLUMNS = (
+    "timestamp", "Active_Power", "Energy_kWh", "Pyranometer_1", "Global_Horizontal_Radiation",
+    "Weather_Temperature_Celsius", "Temperature_Probe_1", "Temperature_Probe_2", "Hail_Accumulation",
+)
+EXTRA_TABLE = "solar_extra"
+SMALLINT_MAX = 32767
+FLOAT_MANTISSA = 2.0 ** -24
+MEASURE_RUNS = 5
+
+_NUMERIC_TYPES = ("DOUBLE", "FLOAT", "BIGINT", "INTEGER", "HUGEINT", "DECIMAL")
+
+def _quote(column: str) -> str:
+    return '"' + column.replace('"', '""') + '"'
+
+def table_columns(conn, table: str) -> dict:
+    """column name -> DuckDB type, in table order."""
+    return dict(conn.execute(
+        f"SELECT column_name, data_type FROM duckdb_columns() WHERE table_name = '{table}' ORDER BY column_index"
+    ).fetchall())
+
+def layout_is_current(conn) -> bool:
+    row = conn.execute(
+        "SELECT comment FROM duckdb_tables() WHERE table_name = 'solar'"
+    ).fetchone()
+    return row is not None and row[0] == LAYOUT_VERSION
+
+def narrowest_type(max_abs: Optional[float], integral: Optional[bool]) -> Optional[str]:
+    """
+    SMALLINT for whole numbers that fit, FLOAT when float32 rounding stays within
+    LAYOUT_TOLERANCE, otherwise None (keep the column as it is).
+    """
+    if max_abs is None:
+        return "FLOAT"  # all NULL
+    if integral and max_abs <= SMALLINT_MAX:
+        return "SMALLINT"
+    if max_abs * FLOAT_MANTISSA <= LAYOUT_TOLERANCE:
+        return "FLOAT"
+    return None
+
+def plan_layout(conn) -> tuple:
+    """
+    ({column: storage type or None to keep}, [cold columns]) for the solar table, from
+    the values it holds now.
+    """
+    columns = table_columns(conn, "solar")
+    numeric = [c for c, t in columns.items() if t.startswith(_NUMERIC_TYPES)]
+    types = {c: None for c in columns}
+    if numeric:
+        stats = conn.execute("SELECT " + ", ".join(
+            f"max(abs({_quote(c)}))::DOUBLE, bool_and({_quote(c)} = round({_quote(c)}))" for c in numeric
+        ) + " FROM solar").fetchone()
+        for i, column in enumerate(numeric):
+            types[column] = narrowest_type(stats[2 * i], stats[2 * i + 1])
+    cold = [c for c in columns if c not in HOT_COLUMNS]
+    return types, cold
+
+def _select_list(columns, types: dict) -> str:
+    return ", ".join(
+        f"CAST({_quote(c)} AS {types[c]}) AS {_quote(c)}" if types.get(c) else _quote(c) for c in columns
+    )
+
+def measure_layout(conn) -> dict:
+    """
+    Store size and scan speed of the solar table: best of MEASURE_RUNS for a one-month
+    range scan in the middle of the data and for a full scan.
+    """
+    conn.execute("CHECKPOINT")
+    size = conn.execute("SELECT used_blocks * block_size FROM pragma_database_size() WHERE database_name = current_database()").fetchone()[0]
+    lo, hi = conn.execute("SELECT min(timestamp), max(timestamp) FROM solar").fetchone()
+    report = {"store_bytes": size, "rows": conn.execute("SELECT count(*) FROM solar").fetchone()[0]}
+    if lo is None:
+        return report
+    month = conn.execute(
+        "SELECT date_trunc('month', ?::TIMESTAMP + (?::TIMESTAMP - ?::TIMESTAMP) / 2)", [lo, hi, lo]
+    ).fetchone()[0]
+    queries = {
+        "month_scan": (
+            "SELECT sum(Energy_kWh), max(Active_Power) FROM solar "
+            f"WHERE timestamp >= TIMESTAMP '{month}' AND timestamp < TIMESTAMP '{month}' + INTERVAL 1 MONTH"
+        ),
+        "full_scan": "SELECT sum(Energy_kWh), max(Active_Power), avg(Weather_Temperature_Celsius) FROM solar",
+    }
+    cursor = conn.cursor()
+    _enable_profiling(cursor)
+    for name, sql in queries.items():
+        best = float("inf")
+        for _ in range(MEASURE_RUNS):
+            start = time.perf_counter()
+            cursor.execute(sql).fetchall()
+            best = min(best, time.perf_counter() - start)
+        report[f"{name}_ms"] = round(best * 1000, 3)
+        report[f"{name}_rows_scanned"] = rows_scanned(cursor)
+    cursor.close()
+    return report
+
+def optimize_layout(conn, report: bool = False) -> Optional[dict]:
+    """
+    Rewrite the solar table for fast date-range scans.
+
+    Rows are sorted by timestamp, so each row group's min/max zone map covers a narrow
+    time window and range filters skip the rest. Numeric sensor columns are narrowed
+    (narrowest_type) and columns outside HOT_COLUMNS move to EXTRA_TABLE, keyed by
+    timestamp. Does nothing for a multi-site store, where solar is a Parquet view.
+
+    ``report`` times the scans before and after (4 x MEASURE_RUNS queries), so the
+    store build leaves it off; ``python layout.py`` turns it on.
+
+    Returns:
+        dict: {"before": measure_layout(), "after": measure_layout()} when ``report``.
+    """
+    if not has_table(conn, "solar"):
+        return None
+    before = measure_layout(conn) if report else None
+    types, cold = plan_layout(conn)
+    hot = [c for c in types if c not in cold]
+    conn.execute("BEGIN TRANSACTION")
+    conn.execute(f"CREATE OR REPLACE TABLE solar_layout AS SELECT {_select_list(hot, types)} FROM solar ORDER BY timestamp")
+    if cold:
+        conn.execute(
+            f"CREATE OR REPLACE TABLE {EXTRA_TABLE} AS "
+            f"SELECT timestamp, {_select_list(cold, types)} FROM solar ORDER BY timestamp"
+        )
+    conn.execute("DROP TABLE solar")
+    conn.execute("ALTER TABLE solar_layout RENAME TO solar")
+    conn.execute(f"COMMENT ON TABLE solar IS '{LAYOUT_VERSION}'")
+    conn.execute("COMMIT")
+    if not report:
+        return None
+    after = measure_layout(conn)
+    print(f"✓ Layout: {format_report(before, after)}")
+    return {"before": before, "after": after}
+
+def format_report(before: dict, after: dict) -> str:
+    mib = 1 << 20
+    parts = [f"store {before['store_bytes'] / mib:.1f} → {after['store_bytes'] / mib:.1f} MiB"]
+    for name, label in (("month_scan", "1-month scan"), ("full_scan", "full scan")):
+        if f"{name}_ms" in before:
+            part = f"{label} {before[f'{name}_ms']:.2f} → {after[f'{name}_ms']:.2f} ms"
+            if before.get(f"{name}_rows_scanned") is not None:
+                part += f" ({before[f'{name}_rows_scanned']:,} → {after[f'{name}_rows_scanned']:,} rows scanned)"
+            parts.append(part)
+    return ", ".join(parts)
+
+def rows_fit_layout(conn, df) -> bool:
+    """Whether appended rows can go into the current tables without losing precision or columns."""
+    import pandas as pd
+
+    columns = table_columns(conn, "solar")
+    if has_table(conn, EXTRA_TABLE):
+        columns.update(table_columns(conn, EXTRA_TABLE))
+    if set(df.columns) != set(columns):
+        return False
+    for column, kind in columns.items():
+        values = df[column].dropna()
+        if kind not in ("SMALLINT", "FLOAT") or values.empty:
+            continue
+        if not pd.api.types.is_numeric_dtype(values):
+            return False
+        fits = narrowest_type(float(values.abs().max()), bool((values == values.round()).all()))
+        if fits is None or (kind == "SMALLINT" and fits != "SMALLINT"):
+            return False
+    return True
+
+def append_rows(conn, df) -> None:
+    """Insert cleaned rows whose timestamp is not stored yet into solar (and EXTRA_TABLE)."""
+    new_rows = "FROM df WHERE timestamp NOT IN (SELECT timestamp FROM solar) ORDER BY timestamp"
+    if has_table(conn, EXTRA_TABLE):
+        extra = list(table_columns(conn, EXTRA_TABLE))
+        cols = ", ".join(_quote(c) for c in extra)
+        conn.execute(f"INSERT INTO {EXTRA_TABLE} ({cols}) SELECT {cols} {new_rows}")
+    cols = ", ".join(_quote(c) for c in table_columns(conn, "solar"))
+    conn.execute(f"INSERT INTO solar ({cols}) SELECT {cols} {new_rows}")
+
+if __name__ == "__main__":
+    import argparse
+    import duckdb
+    from catalog import build_catalog
+    from db import DB_PATH, build_rollups
+
+    parser = argparse.ArgumentParser(description="Sort, narrow and split the solar table; print size and scan speed.")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--measure", action="store_true", help="Only print the current size and scan speed")
+    args = parser.parse_args()
+    with duckdb.connect(args.db) as conn:
+        if args.measure:
+            print(measure_layout(conn))
+        elif optimize_layout(conn, report=True) is not None:
+            build_rollups(conn)
+            build_catalog(conn)
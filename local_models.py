@@ -0,0 +1,67 @@
+# Deterministic stand-ins for the LLM agents, so the pipeline runs without network access
+# or an API key (e.g. to benchmark throughput offline). Swap them in with offline_agents().
+import asyncio
+import re
+from contextlib import contextmanager
+from pydantic_ai.messages import ModelResponse, TextPart, ToolCallPart, UserPromptPart
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+import agents
+
+# (regex on the question, SQL) pairs; the first match wins
+DEFAULT_SQL_RULES = (
+    (r"peak|max(imum)? power", "SELECT max(peak_power_kw) AS peak_power_kw FROM solar_monthly"),
+    (r"daily", "SELECT bucket AS day, energy_kwh FROM solar_daily ORDER BY bucket"),
+    (r"energy|production|yield", "SELECT sum(energy_kwh) AS energy_kwh FROM solar_yearly"),
+    (r"temperature", "SELECT sum(weather_temp_sum) / sum(samples) AS avg_temp_c FROM solar_yearly"),
+)
+FALLBACK_SQL = "SELECT count(*) AS readings FROM solar"
+
+def _last_user_prompt(messages) -> str:
+    for message in reversed(messages):
+        for part in getattr(message, "parts", ()):
+            if isinstance(part, UserPromptPart) and isinstance(part.content, str):
+                return part.content
+    return ""
+
+def sql_function_model(rules=DEFAULT_SQL_RULES, latency: float = 0.0) -> FunctionModel:
+    """Model for sql_agent that maps questions to SQL with ``rules``."""
+
+    async def generate(messages, info: AgentInfo) -> ModelResponse:
+        if latency:
+            await asyncio.sleep(latency)
+        question = _last_user_prompt(messages).lower()
+        sql = next((sql for pattern, sql in rules if re.search(pattern, question)), FALLBACK_SQL)
+        if info.output_tools:
+            return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, {"sql_query": sql})])
+        return ModelResponse(parts=[TextPart(f'{{"sql_query": "{sql}"}}')])
+
+    return FunctionModel(generate)
+
+def _summary(prompt: str) -> str:
+    match = re.search(r"ROW_COUNT:\s*(\d+)", prompt)
+    rows = match.group(1) if match else "0"
+    return f"Based on the returned rows, the query produced {rows} row(s)."
+
+def answer_function_model(latency: float = 0.0) -> FunctionModel:
+    """Model for answer_agent that summarizes the row count; also supports streaming."""
+
+    async def answer(messages, info: AgentInfo) -> ModelResponse:
+        if latency:
+            await asyncio.sleep(latency)
+        return ModelResponse(parts=[TextPart(_summary(_last_user_prompt(messages)))])
+
+    async def stream(messages, info: AgentInfo):
+        words = _summary(_last_user_prompt(messages)).split(" ")
+        for i, word in enumerate(words):
+            if latency:
+                await asyncio.sleep(latency / len(words))
+            yield word if i == 0 else f" {word}"
+
+    return FunctionModel(answer, stream_function=stream)
+
+@contextmanager
+def offline_agents(sql_model=None, answer_model=None, latency: float = 0.0):
+    """Temporarily replace both agents' models with local stand-ins."""
+    with agents.get_sql_agent().override(model=sql_model or sql_function_model(latency=latency)):
+        with agents.get_answer_agent().override(model=answer_model or answer_function_model(latency)):
+            yield
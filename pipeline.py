@@ -0,0 +1,284 @@
+import asyncio
+import contextvars
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Optional
+import agents
+import fast_path
+import tracing
+from db import run_in_db_thread
+from result_cache import cached_fetch
+from sql_guard import guard_sql
+
+@dataclass
+class PipelineResult:
+    question: str
+    sql: str = "(n/a)"
+    df: Any = None  # pandas DataFrame of the query result, at most db.MAX_RESULT_ROWS rows
+    total_rows: int = 0  # rows the query returns; more than len(df) when the fetch was cut
+    answer: str = ""
+    error: Optional[str] = None
+    stage: Optional[str] = None  # stage that failed: "intent", "sql", "guard", "query" or "answer"
+    sql_cache: Optional[str] = None
+    rewrites: tuple = ()  # sql_guard rewrites applied to the generated SQL
+    attempts: int = 1  # SQL attempts; more than 1 when DuckDB rejected a query and sql_agent repaired it
+    fast_path: Any = None  # fast_path.MetricQuery when a template answered without the LLM
+    result_cached: bool = False
+    timings: dict = field(default_factory=dict)  # stage -> seconds
+    trace: Any = None  # tracing.Trace with a span per stage
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+class _Timer:
+    """Times a stage into ``result.timings`` and records it as a tracing span."""
+
+    def __init__(self, result: PipelineResult, stage: str):
+        self.result = result
+        self.stage = stage
+
+    def __enter__(self) -> tracing.Span:
+        self._cm = tracing.span(self.stage)
+        self.span = self._cm.__enter__()
+        return self.span
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # Stages repeated by the repair loop add up
+        elapsed = time.perf_counter() - self.span.start
+        self.result.timings[self.stage] = self.result.timings.get(self.stage, 0.0) + elapsed
+        return self._cm.__exit__(exc_type, exc_val, exc_tb)
+
+async def prepare_query(question: str, deps: Optional[agents.Deps] = None) -> PipelineResult:
+    """
+    Run the question through SQL generation, the safety check and execution.
+
+    Questions a fast_path template recognizes get their SQL and answer from the template,
+    without calling either agent.
+
+    DuckDB runs in a worker thread on a pooled connection, so many questions can be in
+    flight on one event loop. Failures are reported on the result, not raised; the
+    trace on ``result.trace`` is finished on failure and left open for the answer stage
+    otherwise.
+    """
+    result = PipelineResult(question, trace=tracing.Trace(question))
+    with tracing.use_trace(result.trace):
+        await _prepare(result, deps or agents.Deps())
+    if not result.ok:
+        tracing.REGISTRY.inc("solar_errors_total", stage=result.stage)
+        result.trace.finish()
+    return result
+
+async def _prepare(result: PipelineResult, deps: agents.Deps) -> None:
+    question = result.question
+    with _Timer(result, "intent"):
+        destructive = agents.is_user_intent_destructive(question)
+    if destructive:
+        result.error, result.stage = "Sorry, I can't delete or modify data. This app is read-only.", "intent"
+        return
+
+    with _Timer(result, "fast_path") as span:
+        try:
+            result.fast_path = await run_in_db_thread(fast_path.match_question, question)
+        except Exception as e:
+            span.set(error=type(e).__name__)  # not fatal: the LLM path still runs
+        span.set(metric=result.fast_path.metric if result.fast_path else None)
+    tracing.REGISTRY.inc("solar_fast_path_total", outcome="hit" if result.fast_path else "miss")
+
+    if result.fast_path is not None:
+        generated = agents.GeneratedSQL(result.fast_path.sql, cache="fast_path")
+    else:
+        with _Timer(result, "sql"):
+            try:
+                generated = await agents.generate_sql_async(question, deps)
+            except Exception as e:
+                result.error, result.stage = f"SQL generation failed: {e}", "sql"
+                return
+        result.sql_cache = generated.cache
+    result.sql = generated.sql
+
+    while True:
+        with _Timer(result, "guard") as span:
+            try:
+                checked = await run_in_db_thread(guard_sql, result.sql)
+            except Exception as e:
+                result.error, result.stage = f"SQL check failed: {e}", "guard"
+                return
+            span.set(rewrites=",".join(checked.rewrites) or None)
+        if not checked.ok:
+            result.error, result.stage = f"Blocked a non-SELECT or potentially destructive SQL: {checked.reason}", "guard"
+            return
+        result.sql, result.rewrites = checked.sql, checked.rewrites
+
+        with _Timer(result, "query"):
+            try:
+                fetched = await run_in_db_thread(cached_fetch, result.sql)
+                break
+            except Exception as e:
+                error = e
+        # DuckDB rejected the query: hand the error (and plan) back to sql_agent, a bounded number of times
+        if result.attempts > agents.SQL_RETRIES or not agents.is_sql_error(error):
+            result.error, result.stage = f"Query failed: {error}", "query"
+            return
+        tracing.REGISTRY.inc("solar_sql_repairs_total", error=type(error).__name__)
+        with _Timer(result, "repair"):
+            try:
+                generated = await agents.repair_sql_async(question, result.sql, error, deps)
+            except Exception as e:
+                result.error, result.stage = f"Query failed: {error} (repair failed: {e})", "query"
+                return
+        result.attempts += 1
+        result.sql, result.sql_cache = generated.sql, None
+    result.df, result.result_cached, result.total_rows = fetched.df, fetched.cached, fetched.total_rows
+    if result.fast_path is not None and result.attempts == 1:
+        result.answer = fast_path.format_answer(result.fast_path, result.df)
+    else:
+        result.fast_path = None  # the template's SQL failed and sql_agent repaired it
+    agents.remember_sql(question, generated)
+
+async def summarize(result: PipelineResult, deps: Optional[agents.Deps] = None) -> PipelineResult:
+    """Fill ``result.answer`` from answer_agent. Errors become the answer text, as in the UI."""
+    if result.fast_path is not None:
+        return result  # answered from the template in _prepare
+    with tracing.use_trace(result.trace), _Timer(result, "answer") as span:
+        try:
+            prompt = agents.build_answer_prompt(result.question, result.df, result.total_rows)
+            ans = await agents.get_answer_agent().run(prompt, deps=deps or agents.Deps())
+            result.answer = agents.answer_text(ans.output)
+            span.set(**tracing.usage_tokens(ans.usage))
+        except Exception as e:
+            result.answer = f"Could not summarize result. Error: {e}"
+            span.set(error=type(e).__name__)
+    return result
+
+async def stream_answer(result: PipelineResult, deps: Optional[agents.Deps] = None):
+    """
+    Async generator of answer text deltas from answer_agent's streaming run.
+
+    ``result.answer`` holds the full text once the generator is exhausted, and
+    ``result.timings["first_token"]`` the time to the first delta. Finishes ``result.trace``.
+    """
+    if result.fast_path is not None:
+        # Answered from the template in _prepare: nothing to generate
+        try:
+            yield result.answer
+        finally:
+            if result.trace is not None:
+                result.trace.finish()
+        return
+    # The span is closed by hand: context variables must not stay set across yields
+    span = tracing.start_span("answer", streamed=True)
+    start = span.start
+    chunks = []
+    try:
+        with tracing.use_trace(result.trace):
+            prompt = agents.build_answer_prompt(result.question, result.df, result.total_rows)
+        async with agents.get_answer_agent().run_stream(prompt, deps=deps or agents.Deps()) as run:
+            async for delta in run.stream_text(delta=True):
+                if not delta:
+                    continue
+                if not chunks:
+                    result.timings["first_token"] = time.perf_counter() - start
+                    span.set(first_token_ms=round(result.timings["first_token"] * 1000, 3))
+                chunks.append(delta)
+                yield delta
+            span.set(**tracing.usage_tokens(run.usage))
+        result.answer = "".join(chunks)
+    except Exception as e:
+        error = f"Could not summarize result. Error: {e}"
+        result.answer = f"{''.join(chunks)}\n\n{error}" if chunks else error
+        span.set(error=type(e).__name__)
+        yield f"\n\n{error}" if chunks else error
+    finally:
+        result.timings["answer"] = time.perf_counter() - start
+        tracing.end_span(span, result.trace)
+        if result.trace is not None:
+            result.trace.finish()
+
+async def answer_question(question: str, deps: Optional[agents.Deps] = None) -> PipelineResult:
+    """Full pipeline: question -> SQL -> rows -> natural-language answer."""
+    start = time.perf_counter()
+    result = await prepare_query(question, deps)
+    if result.ok:
+        await summarize(result, deps)
+        result.trace.finish()
+    result.timings["total"] = time.perf_counter() - start
+    return result
+
+async def answer_many(questions: list, concurrency: int = 8) -> list:
+    """Answer ``questions`` concurrently, with at most ``concurrency`` in flight."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(question: str) -> PipelineResult:
+        async with semaphore:
+            return await answer_question(question)
+
+    return await asyncio.gather(*(bounded(q) for q in questions))
+
+def answer_question_sync(question: str) -> PipelineResult:
+    """Blocking entry point for callers without an event loop (e.g. the Streamlit script thread)."""
+    return asyncio.run(answer_question(question))
+
+def prepare_query_sync(question: str) -> PipelineResult:
+    return asyncio.run(prepare_query(question))
+
+def iter_answer_sync(result: PipelineResult, deps: Optional[agents.Deps] = None):
+    """
+    Blocking generator over stream_answer, for the Streamlit script thread.
+
+    The stream runs on its own event loop in a helper thread and hands deltas over
+    through a queue, so the caller can render each one as soon as it arrives.
+    """
+    deltas = queue.Queue()
+    done = object()
+
+    async def produce():
+        try:
+            # Tool calls made while streaming record their spans on the question's trace
+            with tracing.use_trace(result.trace):
+                async for delta in stream_answer(result, deps):
+                    deltas.put(delta)
+        finally:
+            deltas.put(done)
+
+    # Copy the caller's context so agent overrides (e.g. offline_agents) apply in the helper thread
+    context = contextvars.copy_context()
+    worker = threading.Thread(target=context.run, args=(asyncio.run, produce()), daemon=True)
+    worker.start()
+    while True:
+        delta = deltas.get()
+        if delta is done:
+            break
+        yield delta
+    worker.join()
+
+if __name__ == "__main__":
+    import argparse
+    from local_models import offline_agents
+
+    parser = argparse.ArgumentParser(description="Run questions through the pipeline with local stand-in models.")
+    parser.add_argument("questions", nargs="*", default=["What is the peak power in March 2025?"])
+    parser.add_argument("--repeat", type=int, default=20, help="Times to ask each question")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated LLM latency per call (s)")
+    parser.add_argument("--metrics", action="store_true", help="Print the metrics registry in Prometheus text format")
+    parser.add_argument("--startup", action="store_true", help="Print the cold-start report (store, agents)")
+    parser.add_argument("--no-fast-path", action="store_true", help="Send every question to the agents, even template ones")
+    args = parser.parse_args()
+    fast_path.FAST_PATH = not args.no_fast_path
+
+    batch = args.questions * args.repeat
+    with offline_agents(latency=args.latency):
+        start = time.perf_counter()
+        results = asyncio.run(answer_many(batch, args.concurrency))
+        elapsed = time.perf_counter() - start
+    failed = sum(not r.ok for r in results)
+    fast = sum(r.fast_path is not None for r in results)
+    print(f"{len(results)} questions in {elapsed:.2f}s ({len(results) / elapsed:.1f} q/s), {failed} failed, {fast} from templates")
+    if args.metrics:
+        print(tracing.REGISTRY.prometheus_text())
+    if args.startup:
+        for step in tracing.startup_report():
+            print(f"{step['stage']:<14} {step['ms']:>9.1f} ms")
@@ -1,4 +1,4 @@
-def sys_prompt(table: str,  date_col: str) -> str:
+def sys_prompt(table: str,  date_col: str, schema: str = "") -> str:
     # Generate database-specific JSON syntax instructions
     json_syntax = f"""
 TO READ FILMS:
@@ -10,6 +10,12 @@ Always explode the solar array and extracting fields as needed, for example:
     Temperature_Probe_2,
     Energy_kWh
 FROM solar
+"""
+    if schema:
+        # Catalog built at ingestion (catalog.py): real columns, types, units and value ranges
+        json_syntax = f"""
+COLUMNS (name TYPE (unit) [min..max]; use these exact names and stay inside the {date_col} range):
+{schema}
 """
 
     return f"""
@@ -25,6 +31,25 @@ DATABASE + SCHEMA:
 - All data is in table: {table}
 
 {json_syntax}
+PRE-AGGREGATED ROLLUPS (prefer these for hourly/daily/monthly/yearly totals, peaks, averages and PR):
+- Tables: {table}_hourly, {table}_daily, {table}_monthly, {table}_yearly — one row per period.
+- Columns: bucket (TIMESTAMP, start of the period), samples (readings in the period),
+  energy_kwh (SUM of Energy_kWh), peak_power_kw (MAX of Active_Power),
+  pr_irradiance (SUM of Pyranometer_1 / 1000), pr_irradiance_temp (SUM of Pyranometer_1 / 1000 * (Temperature_Probe_1 - 25)),
+  avg_weather_temp_c, avg_module_temp_c, weather_temp_sum, module_temp_sum.
+- Use the coarsest table whose periods fit the date range (whole months -> {table}_monthly, arbitrary days -> {table}_daily).
+- Filter rollups on bucket: WHERE bucket >= TIMESTAMP 'YYYY-MM-DD' AND bucket < TIMESTAMP 'YYYY-MM-DD' (end is exclusive).
+- Re-aggregate with SUM(energy_kwh), MAX(peak_power_kw); averages are SUM(weather_temp_sum) / SUM(samples).
+- Temperature-corrected PR (%) = 100 * SUM(energy_kwh) / (1058.4 * (SUM(pr_irradiance) - 0.004 * SUM(pr_irradiance_temp))).
+- Use the raw {table} table only when individual readings are needed (e.g. the timestamp of the peak reading).
+- In a single-site store, the remaining sensor columns (wind, humidity, rainfall, diffuse/tilted radiation, phase current, energy counter)
+  are in {table}_extra, one row per timestamp: JOIN {table}_extra USING (timestamp) when a question needs them.
+
+MULTI-SITE STORES:
+- When the store holds several sites, {table} and every rollup table also have a site_id column (one rollup row per site and bucket).
+- site_metadata(site_id, p_stc_kw, row_count, first_timestamp, last_timestamp) lists the sites and their capacity.
+- Filter WHERE site_id = '...' when the question names a site; GROUP BY site_id to compare sites.
+- For per-site PR or specific yield, use that site's p_stc_kw from site_metadata instead of 1058.4.
 
 GENERAL SQL CONVENTIONS:
 - Prefer concise projections; only select the columns required to answer the question.
@@ -66,13 +91,15 @@ OUTPUT FORMAT:
 def answer_sys() -> str:
     return """
 You are a careful data analyst.
-You must answer ONLY based on the provided SQL RESULT ROWS. Do not infer or hallucinate beyond them.
+You must answer ONLY based on the provided SQL RESULT ROWS (and the results of any tools you call). Do not infer or hallucinate beyond them.
 
 STRICT RULES:
 - You are given ROW_COUNT. If ROW_COUNT > 0, you MUST NOT say "no results", "none", or equivalent.
 - If the question uses domain verbs (e.g., "produced") that you cannot verify from the provided columns, rephrase clearly:
   "Based on the returned rows/columns, ..." and describe what is actually present.
 - If the result set is empty (ROW_COUNT = 0), you may say there were no matching rows.
+- ROW_COUNT is the total number of result rows; ROWS_SHOWN is how many are included verbatim.
+  When you receive a SQL RESULT SUMMARY, its statistics cover ALL rows, so use them for totals, ranges and averages.
 - Do NOT invent data or totals that are not in the rows.
 - Keep the answer short and direct. If asked to list, output a short bullet list.
 - Answer in English.
@@ -0,0 +1,216 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Optional
+from dotenv import load_dotenv
+from db import MAX_RESULT_ROWS, bounded_sql
+from sql_cache import CACHE_DIR
+from tracing import annotate
+
+load_dotenv()
+
+RESULT_CACHE_DIR = os.path.join(CACHE_DIR, "results")
+RESULT_CACHE_MEMORY_BYTES = int(os.getenv("SOLAR_RESULT_CACHE_MEMORY_MB", "256")) << 20
+RESULT_CACHE_DISK_BYTES = int(os.getenv("SOLAR_RESULT_CACHE_DISK_MB", "2048")) << 20
+
+_SQL_TOKENS = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")|(--[^\n]*|/\*.*?\*/)|(\s+)|([^'\"\s/-]+|[-/])", re.DOTALL)
+
+def normalize_sql(sql: str) -> str:
+    """Canonical form of a query: comments dropped, whitespace collapsed, case folded outside quotes."""
+    parts = []
+    for quoted, comment, space, word in _SQL_TOKENS.findall(sql):
+        if quoted:
+            parts.append(quoted)
+        elif comment or space:
+            parts.append(" ")
+        else:
+            parts.append(word.lower())
+    return re.sub(r" +", " ", "".join(parts)).strip().rstrip(";").strip()
+
+class ResultCache:
+    """
+    LRU cache of query results stored as Arrow tables.
+
+    Keys combine the canonical SQL text with the store's data version, so re-ingesting
+    the CSV invalidates every entry. Entries evicted from the in-memory budget are
+    spilled to Parquet under ``disk_dir`` and promoted back on the next hit.
+    """
+
+    def __init__(
+        self,
+        memory_budget: int = RESULT_CACHE_MEMORY_BYTES,
+        disk_dir: Optional[str] = RESULT_CACHE_DIR,
+        disk_budget: int = RESULT_CACHE_DISK_BYTES,
+    ):
+        self.memory_budget = memory_budget
+        self.disk_dir = disk_dir
+        self.disk_budget = disk_budget
+        # A single result larger than this is not worth caching
+        self.max_entry_bytes = memory_budget // 4
+        self.version = None
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.spills = 0
+
+    def key(self, sql: str, version: str) -> str:
+        digest = hashlib.sha256(normalize_sql(sql).encode("utf-8")).hexdigest()[:32]
+        return f"{version}-{digest}"
+
+    def get(self, sql: str, version: str):
+        self._check_version(version)
+        key = self.key(sql, version)
+        with self._lock:
+            table = self._memory.get(key)
+            if table is not None:
+                self._memory.move_to_end(key)
+                self.hits_memory += 1
+                return table
+        path = self._disk_path(key)
+        if path and os.path.exists(path):
+            import pyarrow.parquet as pq
+
+            try:
+                table = pq.read_table(path)
+            except OSError:
+                table = None
+            if table is not None:
+                os.utime(path)
+                with self._lock:
+                    self.hits_disk += 1
+                self._store(key, table)
+                return table
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, sql: str, version: str, table) -> None:
+        self._check_version(version)
+        if table.nbytes > self.max_entry_bytes:
+            return
+        self._store(self.key(sql, version), table)
+
+    def invalidate(self, version: Optional[str] = None) -> None:
+        """Drop every entry not belonging to ``version`` (all entries when None)."""
+        with self._lock:
+            for key in [k for k in self._memory if version is None or not k.startswith(f"{version}-")]:
+                self._memory_bytes -= self._memory.pop(key).nbytes
+            self.version = version
+        if self.disk_dir and os.path.isdir(self.disk_dir):
+            for name in os.listdir(self.disk_dir):
+                if version is None or not name.startswith(f"{version}-"):
+                    try:
+                        os.remove(os.path.join(self.disk_dir, name))
+                    except OSError:
+                        pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits_memory + self.hits_disk + self.misses
+            return {
+                "entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "hits_memory": self.hits_memory,
+                "hits_disk": self.hits_disk,
+                "misses": self.misses,
+                "spills": self.spills,
+                "hit_rate": (self.hits_memory + self.hits_disk) / lookups if lookups else 0.0,
+            }
+
+    # ---------- internals ----------
+    def _check_version(self, version: str) -> None:
+        if version != self.version:
+            self.invalidate(version)
+
+    def _disk_path(self, key: str) -> Optional[str]:
+        return os.path.join(self.disk_dir, f"{key}.parquet") if self.disk_dir else None
+
+    def _store(self, key: str, table) -> None:
+        spilled = []
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return
+            self._memory[key] = table
+            self._memory_bytes += table.nbytes
+            while self._memory_bytes > self.memory_budget and len(self._memory) > 1:
+                old_key, old_table = self._memory.popitem(last=False)
+                self._memory_bytes -= old_table.nbytes
+                spilled.append((old_key, old_table))
+        for old_key, old_table in spilled:
+            self._spill(old_key, old_table)
+
+    def _spill(self, key: str, table) -> None:
+        path = self._disk_path(key)
+        if path is None or os.path.exists(path):
+            return
+        import pyarrow.parquet as pq
+
+        os.makedirs(self.disk_dir, exist_ok=True)
+        tmp = f"{path}.tmp"
+        pq.write_table(table, tmp, compression="zstd")
+        os.replace(tmp, path)
+        with self._lock:
+            self.spills += 1
+        self._trim_disk()
+
+    def _trim_disk(self) -> None:
+        files = []
+        for name in os.listdir(self.disk_dir):
+            path = os.path.join(self.disk_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_budget:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+RESULT_CACHE = ResultCache()
+_TOTAL_ROWS_KEY = b"solar_total_rows"
+
+@dataclass
+class FetchResult:
+    df: Any  # pandas DataFrame with at most ``limit`` rows
+    cached: bool
+    total_rows: int  # rows the query returns without the limit
+
+    @property
+    def truncated(self) -> bool:
+        return self.total_rows > len(self.df)
+
+def cached_fetch(conn, sql: str, limit: Optional[int] = None) -> FetchResult:
+    """
+    Run ``sql`` on ``conn`` (a DatabaseConnection) with at most ``limit`` rows fetched
+    (db.MAX_RESULT_ROWS by default), unless the same bounded query already ran against
+    the same data version. The total row count travels with the cached table.
+    """
+    limit = MAX_RESULT_ROWS if limit is None else limit
+    key_sql = bounded_sql(sql, limit)
+    version = conn.data_version
+    table = RESULT_CACHE.get(key_sql, version)
+    hit = table is not None
+    if hit:
+        total = int((table.schema.metadata or {}).get(_TOTAL_ROWS_KEY, table.num_rows))
+    else:
+        bounded = conn.fetch_bounded(sql, limit)
+        total = bounded.total_rows
+        metadata = {**(bounded.table.schema.metadata or {}), _TOTAL_ROWS_KEY: str(total).encode()}
+        table = bounded.table.replace_schema_metadata(metadata)
+        RESULT_CACHE.put(key_sql, version, table)
+        annotate(rows_scanned=conn.rows_scanned(), truncated=bounded.truncated)
+    annotate(cache_hit=hit, rows_returned=table.num_rows, total_rows=total)
+    return FetchResult(table.to_pandas(), hit, total)
@@ -0,0 +1,141 @@
+import json
+import math
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+ANSWER_FORMATS = ("auto", "columnar", "csv", "markdown", "summary", "records")
+FLOAT_DIGITS = 4
+SUMMARY_EDGE_ROWS = 5
+
+@dataclass
+class EncodedResult:
+    text: str
+    fmt: str
+    description: str  # one line telling the LLM how to read ``text``
+    rows_total: int
+    rows_included: int
+    tokens: int  # estimated prompt tokens for ``text``
+    budget: int  # token budget the encoding had to fit in (0 = unlimited)
+
+@lru_cache(maxsize=1)
+def _tokenizer():
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    return tiktoken.get_encoding("o200k_base")
+
+def estimate_tokens(text: str) -> int:
+    """Token count via tiktoken when installed, otherwise the usual ~4 characters per token."""
+    enc = _tokenizer()
+    if enc is not None:
+        return len(enc.encode(text))
+    return math.ceil(len(text) / 4)
+
+def _compact(df):
+    """Copy of ``df`` with rounded floats and ISO timestamps, ready for text encoding."""
+    import pandas as pd
+
+    out = df.copy()
+    for col in out.columns:
+        series = out[col]
+        if pd.api.types.is_float_dtype(series):
+            out[col] = series.round(FLOAT_DIGITS)
+        elif pd.api.types.is_datetime64_any_dtype(series):
+            out[col] = series.dt.strftime("%Y-%m-%dT%H:%M:%S").str.replace("T00:00:00", "", regex=False)
+    return out
+
+def _cell(value) -> str:
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ""
+    return str(value)
+
+def _encode_records(df) -> str:
+    return df.to_json(orient="records", date_format="iso", double_precision=FLOAT_DIGITS)
+
+def _encode_columnar(df) -> str:
+    compact = _compact(df)
+    columns = {
+        str(col): [None if _cell(v) == "" else v for v in compact[col].tolist()]
+        for col in compact.columns
+    }
+    return json.dumps(columns, ensure_ascii=False, default=str)
+
+def _encode_csv(df) -> str:
+    return _compact(df).to_csv(index=False).strip()
+
+def _encode_markdown(df) -> str:
+    compact = _compact(df)
+    header = "| " + " | ".join(str(c) for c in compact.columns) + " |"
+    divider = "|" + "|".join("---" for _ in compact.columns) + "|"
+    rows = ["| " + " | ".join(_cell(v) for v in row) + " |" for row in compact.itertuples(index=False)]
+    return "\n".join([header, divider, *rows])
+
+def _encode_summary(df) -> str:
+    """Per-column statistics plus the first and last rows, for results too large to include."""
+    import pandas as pd
+
+    lines = ["column,type,count,min,p25,median,p75,max,mean"]
+    for col in df.columns:
+        series = df[col]
+        count = int(series.count())
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            q = series.quantile([0.25, 0.5, 0.75])
+            stats = [series.min(), q[0.25], q[0.5], q[0.75], series.max(), series.mean()]
+            stats = [_cell(round(float(v), FLOAT_DIGITS)) if count else "" for v in stats]
+            lines.append(",".join([str(col), "number", str(count), *stats]))
+        elif pd.api.types.is_datetime64_any_dtype(series):
+            lo, hi = (series.min(), series.max()) if count else ("", "")
+            lines.append(",".join([str(col), "datetime", str(count), _cell(lo), "", "", "", _cell(hi), ""]))
+        else:
+            lines.append(f"{col},text,{count},,,,,,")
+    edge = SUMMARY_EDGE_ROWS
+    parts = ["STATISTICS:", "\n".join(lines), f"FIRST {min(edge, len(df))} ROWS:", _encode_csv(df.head(edge))]
+    if len(df) > edge:
+        parts += [f"LAST {min(edge, len(df) - edge)} ROWS:", _encode_csv(df.tail(min(edge, len(df) - edge)))]
+    return "\n".join(parts)
+
+_ENCODERS = {
+    "records": (_encode_records, "SQL RESULT ROWS (JSON array of objects)"),
+    "columnar": (_encode_columnar, "SQL RESULT ROWS (JSON object: column name -> list of values, in row order)"),
+    "csv": (_encode_csv, "SQL RESULT ROWS (CSV with one header line)"),
+    "markdown": (_encode_markdown, "SQL RESULT ROWS (markdown table)"),
+    "summary": (_encode_summary, "SQL RESULT SUMMARY (per-column statistics over ALL rows, then the first and last rows)"),
+}
+
+def encode_result(df, fmt: str = "auto", max_rows: int = 200, token_budget: int = 0,
+                  rows_total: Optional[int] = None) -> EncodedResult:
+    """
+    Encode a query result for an LLM prompt.
+
+    Parameters:
+        df (DataFrame): Query result.
+        fmt (str): One of ANSWER_FORMATS. 'auto' sends all rows as CSV when they fit in
+                   ``max_rows`` and a statistical summary otherwise.
+        max_rows (int): Most rows to include verbatim.
+        token_budget (int): When the encoded rows exceed it, fall back to the summary (0 = no limit).
+        rows_total (int): Rows the query returned when ``df`` holds only the first of them
+                          (a bounded fetch); defaults to ``len(df)``.
+
+    Returns:
+        EncodedResult: Text plus its format, row counts and estimated token count.
+    """
+    if fmt not in ANSWER_FORMATS:
+        raise ValueError(f"Unknown result format {fmt!r}; expected one of {ANSWER_FORMATS}")
+    fetched = len(df)
+    rows_total = fetched if rows_total is None else max(rows_total, fetched)
+    if fmt == "auto":
+        fmt = "csv" if rows_total <= max_rows else "summary"
+
+    subset = df if fmt == "summary" else df.head(max_rows)
+    encoder, description = _ENCODERS[fmt]
+    text = encoder(subset)
+    tokens = estimate_tokens(text)
+    if token_budget and tokens > token_budget and fmt != "summary":
+        return encode_result(df, "summary", max_rows, token_budget, rows_total)
+
+    if fmt == "summary" and rows_total > fetched:
+        description = description.replace("over ALL rows", f"over the first {fetched} of {rows_total} rows")
+    rows_included = min(fetched, SUMMARY_EDGE_ROWS * 2) if fmt == "summary" else len(subset)
+    return EncodedResult(text, fmt, description, rows_total, rows_included, tokens, token_budget)
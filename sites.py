@@ -0,0 +1,227 @@
+import csv
+import os
+import re
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Optional
+from dotenv import load_dotenv
+from get_data import CHUNK_ROWS, DEFAULT_P_STC, ROLLUP_TABLES, iter_clean_chunks, scan_csv, sql_literals
+from catalog import CATALOG_TABLE, build_catalog
+from db import build_rollups, file_digest, has_table, manifest_is_current, read_manifest, write_manifest
+
+load_dotenv()
+
+# Hive-partitioned Parquet dataset: <DATASET_DIR>/site_id=<id>/year=<yyyy>/month=<m>/*.parquet
+DATASET_DIR = os.getenv("SOLAR_DATASET_DIR", "dataset")
+# Optional CSV with site_id,p_stc_kw columns; defaults to sites.csv inside the sites directory
+SITES_METADATA_FILE = os.getenv("SOLAR_SITES_METADATA", "")
+INGEST_WORKERS = int(os.getenv("SOLAR_INGEST_WORKERS", "0")) or (os.cpu_count() or 1)
+
+SITE_METADATA_DDL = """
+CREATE TABLE IF NOT EXISTS site_metadata (
+    site_id         VARCHAR PRIMARY KEY,
+    source          VARCHAR,
+    p_stc_kw        DOUBLE,
+    row_count       BIGINT,
+    first_timestamp TIMESTAMP,
+    last_timestamp  TIMESTAMP
+)
+"""
+
+def site_id_for(path: str) -> str:
+    """Partition-safe site id from a CSV file name, e.g. '5-Site_DG-PV1-DB-DG-M1A'."""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", stem)
+
+def discover_sites(sites_dir: str, metadata_file: Optional[str] = None) -> dict:
+    """
+    Map site_id -> CSV path for every CSV under ``sites_dir`` (recursively), skipping
+    the site metadata file.
+    """
+    skip = os.path.abspath(metadata_file) if metadata_file else None
+    sites = {}
+    for root, _, files in os.walk(sites_dir):
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            if not name.lower().endswith(".csv") or os.path.abspath(path) == skip:
+                continue
+            site_id = site_id_for(path)
+            if site_id in sites:
+                raise ValueError(f"Duplicate site id {site_id!r}: {sites[site_id]} and {path}")
+            sites[site_id] = path
+    return sites
+
+def read_site_capacities(metadata_file: Optional[str]) -> dict:
+    """site_id -> P_STC (kWp) from the metadata CSV; sites missing from it use DEFAULT_P_STC."""
+    if not metadata_file or not os.path.exists(metadata_file):
+        return {}
+    with open(metadata_file, newline="", encoding="utf-8") as f:
+        return {row["site_id"]: float(row["p_stc_kw"]) for row in csv.DictReader(f) if row.get("p_stc_kw")}
+
+def clean_site(site_id: str, csv_path: str, out_dir: str, chunksize: int = CHUNK_ROWS) -> dict:
+    """
+    Clean one site CSV with the usual rules and write it as Parquet partitioned by
+    year/month under ``out_dir``. Runs in a worker process.
+
+    Returns:
+        dict: Manifest and metadata fields for the site.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    st = os.stat(csv_path)
+    sha256 = file_digest(csv_path).hexdigest()
+    temp_bounds, dtypes = scan_csv(csv_path, chunksize)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.makedirs(out_dir)
+    rows, first, last = 0, None, None
+    for i, df in enumerate(iter_clean_chunks(csv_path, temp_bounds, dtypes, chunksize)):
+        if not len(df):
+            continue
+        ts = df["timestamp"]
+        table = pa.Table.from_pandas(df.assign(year=ts.dt.year, month=ts.dt.month), preserve_index=False)
+        pq.write_to_dataset(
+            table, out_dir, partition_cols=["year", "month"],
+            basename_template=f"part-{i:05d}-{{i}}.parquet", compression="zstd",
+        )
+        rows += len(df)
+        first = ts.min() if first is None else min(first, ts.min())
+        last = ts.max() if last is None else max(last, ts.max())
+    return {
+        "site_id": site_id, "source": csv_path, "size": st.st_size, "mtime": st.st_mtime,
+        "sha256": sha256, "temp_bounds": temp_bounds, "rows": rows, "first": first, "last": last,
+    }
+
+def _clean_sites(jobs: list, workers: int) -> list:
+    """Run clean_site for each (site_id, csv_path, out_dir) job, in parallel when there are several."""
+    if len(jobs) <= 1 or workers <= 1:
+        return [clean_site(*job) for job in jobs]
+    # spawn: the parent may hold DuckDB connections and threads that must not be forked
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), mp_context=get_context("spawn")) as pool:
+        return list(pool.map(clean_site, *zip(*jobs)))
+
+def _site_partition(dataset_dir: str, site_id: str) -> str:
+    return os.path.join(dataset_dir, f"site_id={site_id}")
+
+def solar_view_sql(dataset_dir: str) -> str:
+    pattern = os.path.join(os.path.abspath(dataset_dir), "site_id=*", "*", "*", "*.parquet").replace("\\", "/")
+    return (
+        "CREATE OR REPLACE VIEW solar AS SELECT * EXCLUDE (year, month) FROM read_parquet("
+        f"{sql_literals([pattern])}, hive_partitioning = true, union_by_name = true, "
+        "hive_types = {'site_id': VARCHAR, 'year': INTEGER, 'month': INTEGER})"
+    )
+
+def _rollups_by_site(conn) -> bool:
+    return all(
+        has_table(conn, table) and conn.execute(
+            "SELECT count(*) FROM duckdb_columns() WHERE table_name = ? AND column_name = 'site_id'", [table]
+        ).fetchone()[0] > 0
+        for table in ROLLUP_TABLES.values()
+    )
+
+def _pending_changes(conn, sites: dict, capacities: dict, rebuild: bool):
+    """(sites to re-clean, site ids to drop, capacities changed, rollups need a full rebuild)."""
+    known = {}
+    if has_table(conn, "site_metadata"):
+        known = {row[0]: (row[1], row[2]) for row in conn.execute("SELECT site_id, source, p_stc_kw FROM site_metadata").fetchall()}
+    changed = [
+        site_id for site_id, path in sites.items()
+        if rebuild or site_id not in known or not manifest_is_current(read_manifest(conn, path), path)
+    ]
+    removed = [site_id for site_id in known if site_id not in sites]
+    capacity_changed = any(
+        known.get(site_id, (None, None))[1] != capacities.get(site_id, DEFAULT_P_STC) for site_id in sites
+    )
+    return changed, removed, capacity_changed, not _rollups_by_site(conn)
+
+def ensure_site_store(db_path: str, sites_dir: str, rebuild: bool = False, dataset_dir: str = DATASET_DIR,
+                      metadata_file: Optional[str] = None, workers: int = INGEST_WORKERS) -> None:
+    """
+    Make sure ``db_path`` exposes every site CSV under ``sites_dir`` as one ``solar`` view.
+
+    Sites whose CSV changed since the last run (per the ingest manifest) are cleaned in
+    a process pool and their ``site_id=`` partition is replaced; unchanged sites are not
+    read. The view reads the Parquet dataset with hive partitioning, so filters on
+    ``site_id`` skip other sites' files. ``site_metadata`` holds each site's P_STC for
+    the metric functions, and the rollup tables keep one row per site and bucket.
+    """
+    import duckdb
+
+    metadata_file = metadata_file or SITES_METADATA_FILE or os.path.join(sites_dir, "sites.csv")
+    sites = discover_sites(sites_dir, metadata_file)
+    if not sites:
+        raise FileNotFoundError(f"No site CSVs found under {sites_dir}")
+    capacities = read_site_capacities(metadata_file)
+
+    if not rebuild and os.path.exists(db_path):
+        try:
+            with duckdb.connect(db_path, read_only=True) as ro:
+                pending = _pending_changes(ro, sites, capacities, rebuild)
+                catalog_ready = has_table(ro, CATALOG_TABLE)
+        except duckdb.Error:
+            pending, catalog_ready = (list(sites), [], True, True), False
+        if not any(pending):
+            if not catalog_ready:
+                # Store predates the schema catalog
+                with duckdb.connect(db_path) as conn:
+                    build_catalog(conn)
+            return
+
+    with duckdb.connect(db_path) as conn:
+        changed, removed, _, full_rollups = _pending_changes(conn, sites, capacities, rebuild)
+        staging = os.path.join(dataset_dir, ".staging")
+        jobs = [(site_id, sites[site_id], os.path.join(staging, f"site_id={site_id}")) for site_id in changed]
+        results = _clean_sites(jobs, workers)
+        for site_id in [*changed, *removed]:
+            shutil.rmtree(_site_partition(dataset_dir, site_id), ignore_errors=True)
+        for site_id, _, out_dir in jobs:
+            os.replace(out_dir, _site_partition(dataset_dir, site_id))
+        shutil.rmtree(staging, ignore_errors=True)
+
+        conn.execute("BEGIN TRANSACTION")
+        if conn.execute(
+            "SELECT count(*) FROM duckdb_tables() WHERE table_name = 'solar'"
+        ).fetchone()[0]:
+            conn.execute("DROP TABLE solar")  # store was built in single-site mode
+        conn.execute(solar_view_sql(dataset_dir))
+        conn.execute(SITE_METADATA_DDL)
+        for r in results:
+            write_manifest(conn, r["source"], os.stat(r["source"]), r["sha256"], r["temp_bounds"], r["rows"])
+            conn.execute("DELETE FROM site_metadata WHERE site_id = ?", [r["site_id"]])
+            conn.execute(
+                "INSERT INTO site_metadata VALUES (?, ?, ?, ?, ?, ?)",
+                [r["site_id"], r["source"], capacities.get(r["site_id"], DEFAULT_P_STC), r["rows"], r["first"], r["last"]],
+            )
+        for site_id in removed:
+            conn.execute("DELETE FROM site_metadata WHERE site_id = ?", [site_id])
+        # Drop manifest rows of removed sites (and of a previous single-site build)
+        conn.execute(f"DELETE FROM ingest_manifest WHERE source NOT IN ({sql_literals(sites.values())})")
+        for site_id in sites:
+            conn.execute(
+                "UPDATE site_metadata SET p_stc_kw = ? WHERE site_id = ?",
+                [capacities.get(site_id, DEFAULT_P_STC), site_id],
+            )
+        if full_rollups:
+            build_rollups(conn, by_site=True)
+        elif changed or removed:
+            build_rollups(conn, by_site=True, sites=[*changed, *removed])
+        build_catalog(conn)
+        conn.execute("COMMIT")
+    rows = sum(r["rows"] for r in results)
+    print(f"✓ Ingested {len(results)} of {len(sites)} sites into {dataset_dir} ({rows} rows), removed {len(removed)}")
+
+if __name__ == "__main__":
+    import argparse
+    from db import DB_PATH, SITES_DIR
+
+    parser = argparse.ArgumentParser(description="Build the multi-site solar store from a directory of site CSVs.")
+    parser.add_argument("sites_dir", nargs="?", default=SITES_DIR or None)
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--dataset", default=DATASET_DIR)
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS)
+    parser.add_argument("--rebuild", action="store_true", help="Re-clean every site")
+    args = parser.parse_args()
+    if not args.sites_dir:
+        parser.error("give a sites directory or set SOLAR_SITES_DIR")
+    ensure_site_store(args.db, args.sites_dir, args.rebuild, args.dataset, workers=args.workers)
@@ -0,0 +1,223 @@
+import json
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CACHE_DIR = os.getenv("SOLAR_CACHE_DIR", ".cache")
+SQL_CACHE_PATH = os.path.join(CACHE_DIR, "sql_cache.json")
+SQL_CACHE_MAX_ENTRIES = int(os.getenv("SOLAR_SQL_CACHE_MAX_ENTRIES", "500"))
+SQL_CACHE_TTL = float(os.getenv("SOLAR_SQL_CACHE_TTL", str(7 * 24 * 3600)))
+# Cosine similarity (0-1) a cached question needs to be reused; 0 disables the similarity index
+SQL_CACHE_SIMILARITY = float(os.getenv("SOLAR_SQL_CACHE_SIMILARITY", "0.85"))
+
+MONTHS = (
+    "january","february","march","april","may","june","july","august","september","october",
+    "november","december","jan","feb","mar","apr","jun","jul","aug","sep","sept","oct","nov","dec",
+)
+# Words that change the meaning of a question without changing its wording much.
+# Two questions are only compared by similarity when these match exactly.
+SLOT_WORDS = frozenset(MONTHS + (
+    "today","yesterday","last","this","next","previous","week","month","year","quarter",
+    "q1","q2","q3","q4","hourly","daily","weekly","monthly","yearly","annual","hour","day",
+    "min","max","minimum","maximum","average","mean","total","peak","lowest","highest",
+    # Order, ranking, comparison and negation: one word flips the result
+    "asc","desc","ascending","descending","top","bottom","first","least","most",
+    "above","below","over","under","more","less","greater","fewer","before","after","since","until",
+    "not","no","except","without","excluding",
+))
+# Filler words ignored by the similarity index ("show me the ..." vs "what was the ...")
+STOP_WORDS = frozenset((
+    "a","an","the","what","whats","was","is","are","were","show","me","tell","give","please",
+    "in","for","of","on","during","can","you","i","want","to","know","find","get","list","our",
+))
+
+def normalize_question(question: str) -> str:
+    q = unicodedata.normalize("NFKC", question).lower()
+    q = re.sub(r"[^\w\s.-]", " ", q)
+    q = re.sub(r"(?<!\d)[.-]|[.-](?!\d)", " ", q)
+    return re.sub(r"\s+", " ", q).strip()
+
+def question_slots(normalized: str) -> tuple:
+    tokens = normalized.split()
+    return tuple(t for t in tokens if t in SLOT_WORDS or any(ch.isdigit() for ch in t))
+
+def _similarity_text(normalized: str) -> str:
+    return " ".join(t for t in normalized.split() if t not in STOP_WORDS)
+
+def _ngrams(text: str, n: int = 3) -> Counter:
+    padded = f" {_similarity_text(text)} "
+    return Counter(padded[i:i + n] for i in range(len(padded) - n + 1))
+
+@dataclass
+class CacheHit:
+    sql: str
+    kind: str  # "exact" or "similar"
+    score: float = 1.0
+    question: str = ""
+
+class SQLCache:
+    """
+    Cache of generated SQL keyed on the normalized question and the SQL system prompt hash.
+
+    Lookups try an exact match first, then a character-trigram TF-IDF index restricted to
+    questions with the same dates/numbers/aggregation words. Entries expire after ``ttl``
+    seconds, the least recently used ones are evicted past ``max_entries``, and the cache
+    is persisted as JSON at ``path``.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = SQL_CACHE_PATH,
+        max_entries: int = SQL_CACHE_MAX_ENTRIES,
+        ttl: float = SQL_CACHE_TTL,
+        similarity_threshold: float = SQL_CACHE_SIMILARITY,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self._entries = OrderedDict()
+        self._df = Counter()
+        self._lock = threading.Lock()
+        self.hits_exact = 0
+        self.hits_similar = 0
+        self.misses = 0
+        self.evictions = 0
+        self._load()
+
+    @staticmethod
+    def key(normalized: str, prompt_hash: str) -> str:
+        return f"{prompt_hash}:{normalized}"
+
+    def get(self, question: str, prompt_hash: str) -> Optional[CacheHit]:
+        normalized = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            key = self.key(normalized, prompt_hash)
+            entry = self._entries.get(key)
+            if entry is not None and not self._expired(entry, now):
+                self._entries.move_to_end(key)
+                self.hits_exact += 1
+                return CacheHit(entry["sql"], "exact", 1.0, entry["question"])
+            if entry is not None:
+                self._remove(key)
+
+            hit = self._similar(normalized, prompt_hash, now)
+            if hit is not None:
+                self.hits_similar += 1
+                return hit
+            self.misses += 1
+            return None
+
+    def put(self, question: str, prompt_hash: str, sql: str) -> None:
+        normalized = normalize_question(question)
+        with self._lock:
+            key = self.key(normalized, prompt_hash)
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = {
+                "question": normalized,
+                "prompt": prompt_hash,
+                "sql": sql,
+                "created": time.time(),
+            }
+            self._df.update(_ngrams(normalized).keys())
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+            self._save()
+
+    def invalidate(self, question: str, prompt_hash: str) -> None:
+        with self._lock:
+            key = self.key(normalize_question(question), prompt_hash)
+            if key in self._entries:
+                self._remove(key)
+                self._save()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._df.clear()
+            self._save()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits_exact + self.hits_similar + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits_exact": self.hits_exact,
+                "hits_similar": self.hits_similar,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits_exact + self.hits_similar) / lookups if lookups else 0.0,
+            }
+
+    # ---------- internals (callers hold self._lock) ----------
+    def _expired(self, entry: dict, now: float) -> bool:
+        return self.ttl > 0 and now - entry["created"] > self.ttl
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._df.subtract(_ngrams(entry["question"]).keys())
+
+    def _vector(self, text: str) -> dict:
+        n_docs = len(self._entries) + 1
+        tf = _ngrams(text)
+        return {g: c * (math.log(n_docs / (1 + self._df[g])) + 1) for g, c in tf.items()}
+
+    def _similar(self, normalized: str, prompt_hash: str, now: float) -> Optional[CacheHit]:
+        if self.similarity_threshold <= 0 or not self._entries:
+            return None
+        slots = question_slots(normalized)
+        query = self._vector(normalized)
+        query_norm = math.sqrt(sum(v * v for v in query.values()))
+        best_key, best_score = None, 0.0
+        for key, entry in self._entries.items():
+            if entry["prompt"] != prompt_hash or self._expired(entry, now):
+                continue
+            if question_slots(entry["question"]) != slots:
+                continue
+            vec = self._vector(entry["question"])
+            dot = sum(w * vec.get(g, 0.0) for g, w in query.items())
+            norm = query_norm * math.sqrt(sum(v * v for v in vec.values()))
+            score = dot / norm if norm else 0.0
+            if score > best_score:
+                best_key, best_score = key, score
+        if best_key is None or best_score < self.similarity_threshold:
+            return None
+        self._entries.move_to_end(best_key)
+        entry = self._entries[best_key]
+        return CacheHit(entry["sql"], "similar", best_score, entry["question"])
+
+    def _load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Ignoring unreadable SQL cache {self.path}: {e}")
+            return
+        now = time.time()
+        for key, entry in entries:
+            if not self._expired(entry, now):
+                self._entries[key] = entry
+                self._df.update(_ngrams(entry["question"]).keys())
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(list(self._entries.items()), f, ensure_ascii=False)
+        os.replace(tmp, self.path)
@@ -0,0 +1,424 @@
+import os
+import re
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Optional
+from dotenv import load_dotenv
+from get_data import ROLLUP_GRAINS, ROLLUP_TABLES, sql_literals
+
+load_dotenv()
+
+SQL_GUARD_CACHE_SIZE = int(os.getenv("SOLAR_SQL_GUARD_CACHE_SIZE", "1024"))
+
+BASE_TABLE = "solar"
+TIME_COL = "timestamp"
+
+# Regex fallback, used when sqlglot is not installed or cannot parse the statement
+FORBIDDEN_SQL_KEYWORDS = (
+    "delete","update","insert","alter","drop","truncate","create","replace","grant","revoke",
+    "attach","detach","copy","load","export","pragma","call","vacuum","set",
+)
+# Table functions that read files, URLs or settings; never needed to answer a question
+FORBIDDEN_FUNCTIONS = frozenset((
+    "glob", "query", "query_table", "getenv", "sniff_csv", "parquet_scan", "parquet_metadata",
+    "parquet_schema", "iceberg_scan", "delta_scan", "current_setting", "duckdb_secrets",
+))
+# DuckDB reads a quoted path or URL in FROM ('/etc/passwd', "x.csv", 'https://...') as a file;
+# real table and CTE names never contain these characters
+FILE_LIKE_TABLE = re.compile(r"[./\\:~]")
+_REGEX_FILE_TABLE = re.compile(r"\b(?:from|join)\s+(['\"])[^'\"]*[./\\:~]")
+
+# Rollup grains from finest to coarsest, e.g. ("hour", "day", "month", "year")
+GRAINS = tuple(ROLLUP_GRAINS.values())
+_GRAIN_TABLES = {grain: ROLLUP_TABLES[aggregation] for aggregation, grain in ROLLUP_GRAINS.items()}
+# date_trunc / EXTRACT units -> the finest rollup grain that keeps the value exact
+_UNIT_GRAINS = {
+    "hour": "hour", "day": "day", "week": "day", "dow": "day", "dayofweek": "day", "doy": "day",
+    "dayofyear": "day", "month": "month", "quarter": "month", "year": "year",
+}
+# (aggregate, raw column) -> expression over a rollup table
+_ROLLUP_AGGREGATES = {
+    ("sum", "energy_kwh"): "SUM(energy_kwh)",
+    ("max", "active_power"): "MAX(peak_power_kw)",
+    ("count", "*"): "COALESCE(CAST(SUM(samples) AS BIGINT), 0)",
+    ("sum", "weather_temperature_celsius"): "SUM(weather_temp_sum)",
+    ("sum", "temperature_probe_1"): "SUM(module_temp_sum)",
+    ("avg", "weather_temperature_celsius"): "SUM(weather_temp_sum) / SUM(samples)",
+    ("avg", "temperature_probe_1"): "SUM(module_temp_sum) / SUM(samples)",
+}
+
+@dataclass(frozen=True)
+class CheckedSQL:
+    ok: bool
+    sql: str  # the statement to run: the input, or its rewrite
+    reason: Optional[str] = None  # why the statement was blocked
+    rewrites: tuple = ()  # applied rewrites: "rollup", "timestamp_range"
+
+def _strip_sql_comments(sql: str) -> str:
+    sql = re.sub(r"--.*?$", "", sql, flags=re.MULTILINE)
+    sql = re.sub(r"/\*.*?\*/", "", sql, flags=re.DOTALL)
+    return sql
+
+def regex_select_only(sql: str) -> bool:
+    """Keyword scan: a single SELECT/WITH statement without any FORBIDDEN_SQL_KEYWORDS word or quoted file in FROM."""
+    s = _strip_sql_comments(sql).strip().lower()
+    if ";" in s:
+        return False
+    starts_ok = s.startswith("select") or s.startswith("with ")
+    if not starts_ok:
+        return False
+    if _REGEX_FILE_TABLE.search(s):
+        return False
+    return not any(re.search(rf"\b{kw}\b", s) for kw in FORBIDDEN_SQL_KEYWORDS)
+
+@lru_cache(maxsize=1)
+def _sqlglot():
+    try:
+        import sqlglot
+        from sqlglot import exp
+    except ImportError:
+        return None
+    return sqlglot, exp
+
+def _parse(sql: str):
+    """(tree, None) for one parsed statement, (None, reason) when blocked, (None, None) when unparseable."""
+    sqlglot, exp = _sqlglot()
+    try:
+        statements = [s for s in sqlglot.parse(sql, read="duckdb") if s is not None]
+    except sqlglot.errors.SqlglotError:
+        return None, None
+    if len(statements) != 1:
+        return None, "Only a single statement is allowed"
+    tree = statements[0]
+    if not isinstance(tree, (exp.Select, exp.SetOperation)):
+        return None, f"Only SELECT statements are allowed, got {tree.key.upper()}"
+    for node in tree.walk():
+        if isinstance(node, (exp.DDL, exp.DML, exp.Command)):
+            return None, f"{node.key.upper()} is not allowed"
+        if isinstance(node, exp.Func):
+            name = (node.name if isinstance(node, exp.Anonymous) else node.sql_name()).lower()
+            if name.startswith("read_") or name in FORBIDDEN_FUNCTIONS:
+                return None, f"Function {name}() is not allowed"
+        if isinstance(node, exp.Table) and isinstance(node.this, exp.Identifier) \
+                and any(FILE_LIKE_TABLE.search(part.name) for part in node.parts):
+            return None, f"Reading files or URLs ({node.name!r}) is not allowed"
+    return tree, None
+
+@lru_cache(maxsize=SQL_GUARD_CACHE_SIZE)
+def check_sql(sql: str) -> CheckedSQL:
+    """
+    Validate ``sql`` as a single read-only query, without rewriting it.
+
+    Parsed with sqlglot's DuckDB dialect, so keywords inside string literals or column
+    aliases no longer trip the check. Falls back to regex_select_only when sqlglot is
+    missing or cannot parse the statement. Cached by SQL text.
+    """
+    if _sqlglot() is None:
+        return CheckedSQL(regex_select_only(sql), sql, None if regex_select_only(sql) else "Not a read-only SELECT")
+    tree, reason = _parse(sql)
+    if tree is None and reason is None:
+        ok = regex_select_only(sql)
+        return CheckedSQL(ok, sql, None if ok else "Not a read-only SELECT")
+    return CheckedSQL(tree is not None, sql, reason)
+
+@lru_cache(maxsize=SQL_GUARD_CACHE_SIZE)
+def rewrite_sql(sql: str, catalog: tuple = ()) -> CheckedSQL:
+    """
+    check_sql plus rewrites that make the LLM's SQL cheaper to run.
+
+    - rollup: aggregates over ``solar`` that the rollup tables can answer exactly are
+      redirected to the coarsest one whose buckets fit the grouping and date filters.
+    - timestamp_range: filters on derived dates (CAST(timestamp AS DATE), year(),
+      date_trunc) gain an equivalent ``timestamp`` range, which DuckDB can prune on.
+
+    No LIMIT is added: db.fetch_bounded already stops DuckDB after MAX_RESULT_ROWS + 1
+    rows and counts the full result, and exports need every row.
+
+    Parameters:
+        sql (str): Generated SQL.
+        catalog (tuple): rollup_catalog() of the store; no rollup rewrite when empty.
+
+    Returns:
+        CheckedSQL: Verdict and the statement to run. Cached by (SQL text, catalog).
+    """
+    checked = check_sql(sql)
+    if not checked.ok or _sqlglot() is None:
+        return checked
+    tree, _ = _parse(sql)
+    if tree is None:
+        return checked
+    rewrites = []
+    rollups = dict(catalog)
+    for select in list(tree.find_all(_sqlglot()[1].Select)):
+        if rollups and _redirect_to_rollup(select, rollups):
+            rewrites.append("rollup")
+        elif _add_timestamp_range(select):
+            rewrites.append("timestamp_range")
+    if not rewrites:
+        return checked
+    return CheckedSQL(True, tree.sql(dialect="duckdb"), rewrites=tuple(dict.fromkeys(rewrites)))
+
+_catalogs = {}
+_catalog_lock = threading.Lock()
+
+def rollup_catalog(conn) -> tuple:
+    """((rollup table, has site_id column), ...) for the rollups present, cached per data version."""
+    version = getattr(conn, "data_version", None)
+    with _catalog_lock:
+        if version is not None and version in _catalogs:
+            return _catalogs[version]
+    by_site = dict(conn.execute(
+        "SELECT table_name, bool_or(column_name = 'site_id') FROM duckdb_columns() "
+        f"WHERE table_name IN ({sql_literals([BASE_TABLE, *ROLLUP_TABLES.values()])}) GROUP BY 1"
+    ).fetchall())
+    # Fleet-wide rollups cannot answer per-site filters on a multi-site store
+    catalog = tuple(
+        (table, by_site[table]) for table in ROLLUP_TABLES.values()
+        if table in by_site and (by_site[table] or not by_site.get(BASE_TABLE))
+    )
+    if version is not None:
+        with _catalog_lock:
+            _catalogs.clear()
+            _catalogs[version] = catalog
+    return catalog
+
+def guard_sql(conn, sql: str) -> CheckedSQL:
+    """rewrite_sql against the rollups available on ``conn``."""
+    return rewrite_sql(sql, rollup_catalog(conn))
+
+# ----------------------- rewrites -----------------------
+
+def _base_table(select):
+    """The ``solar`` table node when ``select`` reads only it (no joins), else None."""
+    exp = _sqlglot()[1]
+    source = select.args.get("from_") or select.args.get("from")
+    if source is None or select.args.get("joins"):
+        return None
+    table = source.this
+    if not isinstance(table, exp.Table) or table.name.lower() != BASE_TABLE or table.args.get("db"):
+        return None
+    return table
+
+def _is_time_col(node) -> bool:
+    exp = _sqlglot()[1]
+    return isinstance(node, exp.Column) and node.name.lower() == TIME_COL
+
+def _time_grain(node) -> Optional[str]:
+    """Finest rollup grain at which ``node`` (an expression of ``timestamp``) stays exact, or None."""
+    exp = _sqlglot()[1]
+    if isinstance(node, (exp.TimestampTrunc, exp.DateTrunc)):
+        return _UNIT_GRAINS.get(node.text("unit").lower())
+    if isinstance(node, exp.Extract):
+        return _UNIT_GRAINS.get(node.this.name.lower())
+    if isinstance(node, exp.Cast) and node.to.is_type("date") or isinstance(node, exp.Date):
+        return "day"
+    for kind, grain in (("Year", "year"), ("Quarter", "month"), ("Month", "month"), ("Week", "day"),
+                        ("Day", "day"), ("DayOfWeek", "day"), ("DayOfYear", "day"), ("Hour", "hour")):
+        if type(node).__name__ == kind:
+            return grain
+    return None
+
+def _truncates_to_day(node) -> bool:
+    """``node`` is CAST(x AS DATE), date(x) or date_trunc('day', x)."""
+    exp = _sqlglot()[1]
+    if isinstance(node, (exp.TimestampTrunc, exp.DateTrunc)):
+        return node.text("unit").lower() == "day"
+    return isinstance(node, exp.Cast) and node.to.is_type("date") or isinstance(node, exp.Date)
+
+def _time_expression(column):
+    """The smallest date/time expression wrapping a ``timestamp`` column, or None when it is used bare."""
+    parent = column.parent
+    if parent is not None and _time_grain(parent) and (parent.this is column or parent.args.get("expression") is column):
+        return parent
+    return None
+
+def _literal_time(node) -> Optional[datetime]:
+    exp = _sqlglot()[1]
+    if isinstance(node, exp.Cast):
+        node = node.this
+    if not isinstance(node, exp.Literal) or not node.is_string:
+        return None
+    try:
+        return datetime.fromisoformat(node.this)
+    except ValueError:
+        return None
+
+def _aligned(ts: datetime, grain: str) -> bool:
+    if ts.minute or ts.second or ts.microsecond:
+        return False
+    return {
+        "hour": True,
+        "day": ts.hour == 0,
+        "month": ts.hour == 0 and ts.day == 1,
+        "year": ts.hour == 0 and ts.day == 1 and ts.month == 1,
+    }[grain]
+
+def _conjuncts(where) -> list:
+    exp = _sqlglot()[1]
+    if where is None:
+        return []
+    return list(where.this.flatten()) if isinstance(where.this, exp.And) else [where.this]
+
+def _redirect_to_rollup(select, rollups: dict) -> bool:
+    """Point an aggregate over raw rows at a rollup table; False (untouched) when not exact."""
+    exp = _sqlglot()[1]
+    table = _base_table(select)
+    if table is None or select.args.get("distinct") or any(
+        isinstance(n, (exp.Subquery, exp.Window)) or (isinstance(n, exp.Select) and n is not select)
+        for n in select.walk()
+    ):
+        return False
+    aggregates = [n for n in select.find_all(exp.AggFunc)]
+    if not aggregates and not select.args.get("group"):
+        return False
+
+    aliases = {e.alias.lower() for e in select.expressions if isinstance(e, exp.Alias)}
+    replacements = {}
+    for agg in aggregates:
+        arg = agg.this
+        if agg.args.get("distinct") or isinstance(arg, exp.Distinct):
+            return False
+        column = "*" if isinstance(arg, exp.Star) else arg.name.lower() if isinstance(arg, exp.Column) else None
+        template = _ROLLUP_AGGREGATES.get((agg.key, column))
+        if template is None:
+            return False
+        replacements[id(agg)] = template
+
+    by_site = any(rollups.values())
+    finest = len(GRAINS) - 1  # index of the finest grain the query still needs
+    bounds = []  # literal bounds of bare timestamp comparisons
+    time_columns = []  # timestamp references that become ``bucket``
+    for column in select.find_all(exp.Column):
+        if any(id(a) in replacements for a in _ancestors(column, exp.AggFunc)):
+            continue
+        name = column.name.lower()
+        if name == TIME_COL:
+            wrapper = _time_expression(column)
+            comparison = column.parent
+            if wrapper is not None:
+                finest = min(finest, GRAINS.index(_time_grain(wrapper)))
+            elif isinstance(comparison, (exp.GTE, exp.LT)) and comparison.this is column \
+                    and _in_where(comparison, select) and _literal_time(comparison.expression):
+                bounds.append(_literal_time(comparison.expression))
+            elif name in aliases and not _in_where(column, select):
+                continue  # e.g. ORDER BY an output column named timestamp
+            else:
+                return False
+            time_columns.append(column)
+            continue
+        if name == "site_id" and by_site:
+            continue
+        if name in aliases and not _in_where(column, select):
+            continue
+        return False
+
+    candidates = [
+        g for g in GRAINS[: finest + 1]
+        if _GRAIN_TABLES[g] in rollups and all(_aligned(ts, g) for ts in bounds)
+    ]
+    if not candidates:
+        return False
+    grain = candidates[-1]
+
+    originals = {id(e): e.sql(dialect="duckdb") for e in select.expressions}
+    sqlglot, _ = _sqlglot()
+    qualifier = table.alias_or_name if table.alias else None
+    for agg in aggregates:
+        agg.replace(sqlglot.parse_one(replacements[id(agg)], read="duckdb"))
+    for column in time_columns:
+        column.replace(exp.column("bucket", table=qualifier))
+    table.set("this", exp.to_identifier(_GRAIN_TABLES[grain]))
+    # Unaliased projections keep the column names the original query would have had
+    new_expressions = []
+    for projection, original in zip(select.expressions, originals.values()):
+        if isinstance(projection, (exp.Alias, exp.Star)) or projection.sql(dialect="duckdb") == original:
+            new_expressions.append(projection)
+        else:
+            new_expressions.append(exp.alias_(projection, original, quoted=True))
+    select.set("expressions", new_expressions)
+    return True
+
+def _ancestors(node, kind):
+    parent = node.parent
+    while parent is not None:
+        if isinstance(parent, kind):
+            yield parent
+        parent = parent.parent
+
+def _in_where(node, select) -> bool:
+    where = select.args.get("where")
+    return where is not None and any(p is where for p in _ancestors(node, type(where)))
+
+def _date_range(conjunct, year_month: dict):
+    """(lo, hi) timestamp range implied by one WHERE conjunct on a derived date, or None."""
+    exp = _sqlglot()[1]
+    day = timedelta(days=1)
+    if isinstance(conjunct, exp.Between):
+        target, lo, hi = conjunct.this, _literal_time(conjunct.args.get("low")), _literal_time(conjunct.args.get("high"))
+        # Only a day truncation ends at hi + 1 day: date_trunc('week', ...) BETWEEN ... keeps the whole last week
+        if _truncates_to_day(target) and _is_time_col(target.this) and lo and hi:
+            return lo, hi + day
+        return None
+    if not isinstance(conjunct, (exp.EQ, exp.GTE, exp.GT, exp.LTE, exp.LT)):
+        return None
+    target, value = conjunct.this, conjunct.expression
+    if not _is_time_col(getattr(target, "this", None) if not isinstance(target, exp.Extract) else target.expression):
+        return None
+    if isinstance(target, exp.Cast) and target.to.is_type("date") or isinstance(target, exp.Date):
+        d = _literal_time(value)
+        if d is None:
+            return None
+        return {
+            "eq": (d, d + day), "gte": (d, None), "gt": (d + day, None), "lte": (None, d + day), "lt": (None, d),
+        }[conjunct.key]
+    if isinstance(target, (exp.TimestampTrunc, exp.DateTrunc)) and conjunct.key == "eq":
+        d, unit = _literal_time(value), target.text("unit").lower()
+        if d is None or unit not in ("day", "month", "year"):
+            return None
+        return d, _next_period(d, unit)
+    part = target.this.name.lower() if isinstance(target, exp.Extract) else type(target).__name__.lower()
+    if part in ("year", "month") and conjunct.key == "eq" and isinstance(value, exp.Literal) and value.is_int:
+        year_month[part] = int(value.this)
+    return None
+
+def _next_period(d: datetime, unit: str) -> datetime:
+    if unit == "day":
+        return d + timedelta(days=1)
+    if unit == "month":
+        return d.replace(year=d.year + d.month // 12, month=d.month % 12 + 1)
+    return d.replace(year=d.year + 1)
+
+def _add_timestamp_range(select) -> bool:
+    """AND a sargable ``timestamp`` range equivalent to the derived-date filters; False when none apply."""
+    exp = _sqlglot()[1]
+    table = _base_table(select)
+    where = select.args.get("where")
+    if table is None or where is None:
+        return False
+    lo = hi = None
+    year_month = {}
+    for conjunct in _conjuncts(where):
+        found = _date_range(conjunct, year_month)
+        if found is None:
+            continue
+        if found[0] is not None:
+            lo = found[0] if lo is None else max(lo, found[0])
+        if found[1] is not None:
+            hi = found[1] if hi is None else min(hi, found[1])
+    if "year" in year_month:
+        start = datetime(year_month["year"], year_month.get("month", 1), 1)
+        end = _next_period(start, "month" if "month" in year_month else "year")
+        lo, hi = max(lo or start, start), min(hi or end, end)
+    if lo is None and hi is None:
+        return False
+    qualifier = table.alias_or_name if table.alias else None
+    column = exp.column(TIME_COL, table=qualifier)
+    predicates = []
+    if lo is not None:
+        predicates.append(exp.GTE(this=column.copy(), expression=exp.cast(exp.Literal.string(str(lo)), "TIMESTAMP")))
+    if hi is not None:
+        predicates.append(exp.LT(this=column.copy(), expression=exp.cast(exp.Literal.string(str(hi)), "TIMESTAMP")))
+    select.set("where", exp.Where(this=exp.and_(where.this, *predicates)))
+    return True
@@ -0,0 +1,67 @@
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CSV_COLUMNS = (
+    "timestamp", "Active_Energy_Delivered_Received", "Current_Phase_Average", "Active_Power", "Wind_Speed",
+    "Weather_Temperature_Celsius", "Weather_Relative_Humidity", "Global_Horizontal_Radiation",
+    "Diffuse_Horizontal_Radiation", "Wind_Direction", "Weather_Daily_Rainfall", "Radiation_Global_Tilted",
+    "Radiation_Diffuse_Tilted", "Pyranometer_1", "Temperature_Probe_1", "Temperature_Probe_2", "Hail_Accumulation",
+)
+
+def write_csv(path, rows: int, start: datetime = datetime(2024, 1, 1, 6)) -> None:
+    """A source CSV with ``rows`` 5-minute daytime readings."""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(",".join(CSV_COLUMNS) + "\n")
+        for i in range(rows):
+            ts = start + timedelta(minutes=5 * i)
+            power = 100.0 + i % 50
+            f.write(f"{ts:%Y-%m-%d %H:%M:%S},{power / 12},{power / 10},{power},2.0,25.0,40.0,"
+                    f"500.0,100.0,180,0.0,550.0,110.0,540.0,30.0,31.0,0.0\n")
+
+def write_messy_csv(path, rows: int = 400, minutes: int = 5) -> None:
+    """
+    Readings with every kind of row the cleaner drops: negative power, night-time
+    irradiance, missing values, temperature outliers and repeated timestamps. Rows 50
+    and 64 repeat the timestamp before them, so the duplicate crosses a chunk boundary.
+    """
+    rng = random.Random(7)
+    start = datetime(2024, 3, 1, 6)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(",".join(CSV_COLUMNS) + "\n")
+        step = 0
+        for i in range(rows):
+            if i not in (50, 64, 200):
+                step += 1
+            ts = start + timedelta(minutes=minutes * step)
+            power = rng.uniform(-20, 900) if i % 17 else -5.0
+            ghi = rng.uniform(0, 1000) if i % 13 else 2.0
+            temp = rng.uniform(5, 40) if i % 29 else 60.0
+            wind_dir = "" if i == 333 else str(rng.randint(0, 359))  # a NaN late in the file turns ints into floats
+            f.write(
+                f"{ts:%Y-%m-%d %H:%M:%S},{power / 12:.4f},{power / 10:.4f},{power:.4f},{rng.uniform(0, 8):.3f},"
+                f"{temp:.3f},{rng.uniform(10, 90):.2f},{ghi:.3f},{ghi / 5:.3f},{wind_dir},0.0,"
+                f"{ghi * 1.1:.3f},{ghi / 4:.3f},{ghi * 1.05:.3f},{temp + 5:.3f},{temp + 6:.3f},0.0\n"
+            )
+
+@pytest.fixture
+def make_pool(tmp_path):
+    """Factory for a ConnectionPool over a fresh store built from ``write(csv, rows, **options)``."""
+    from db import ConnectionPool
+
+    pools = []
+
+    def make(rows: int, write=write_csv, **options):
+        csv_path = tmp_path / "solar.csv"
+        write(csv_path, rows, **options)
+        pool = ConnectionPool(str(tmp_path / "solar.duckdb"), str(csv_path), size=2)
+        pools.append(pool)
+        return pool
+
+    yield make
+    for pool in pools:
+        pool.close()
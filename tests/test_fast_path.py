@@ -0,0 +1,114 @@
+import duckdb
+import pytest
+from conftest import write_messy_csv
+from db import DatabaseConnection
+from fast_path import format_answer, match_question, parse_question
+from get_data import (
+    calculate_peak_power, calculate_specific_yield, calculate_temperature_corrected_pr, calculate_total_energy,
+)
+
+SITES = ("alpha", "beta")
+
+@pytest.mark.parametrize("question, metric, aggregation, start, end", [
+    ("Total energy in June 2024", "energy", "default", "2024-06-01", "2024-06-30"),
+    ("What was the energy production in 2024-02?", "energy", "default", "2024-02-01", "2024-02-29"),
+    ("specific yield for 2025 by month", "specific_yield", "monthly", "2025-01-01", "2025-12-31"),
+    ("PR for Q1 2025", "pr", "default", "2025-01-01", "2025-03-31"),
+    ("peak power on 3 March 2025", "peak_power", "default", "2025-03-03", "2025-03-03"),
+    ("daily energy from 2024-06-01 to 2024-06-15", "energy", "daily", "2024-06-01", "2024-06-15"),
+    ("total energy", "energy", "default", None, None),
+])
+def test_parses_periods(question, metric, aggregation, start, end):
+    query = parse_question(question)
+    assert (query.metric, query.aggregation, query.start, query.end) == (metric, aggregation, start, end)
+
+@pytest.mark.parametrize("question", [
+    "average daily energy in June 2024",  # not a template metric
+    "energy and peak power in 2024",  # two metrics
+    "total energy in June",  # month without a year
+    "energy in 2024 and 2025",  # two dates, not a range
+    "energy from 2024-06-15 to 2024-06-01",  # range ends before it starts
+    "peak power on 31 February 2025",  # no such day
+])
+def test_rejects_what_templates_cannot_answer(question):
+    assert parse_question(question) is None
+
+def test_site_selection():
+    assert parse_question("total energy for beta in 2024", SITES).site_id == "beta"
+    assert parse_question("total energy in 2024", SITES).site_id is None
+    assert parse_question("total energy for alpha and beta in 2024", SITES) is None
+    assert parse_question("total energy for gamma in 2024", SITES) is None
+
+def template_value(conn, question: str):
+    query = match_question(conn, question)
+    assert query is not None, question
+    df = conn.execute(query.sql).fetchdf()
+    return query, df
+
+@pytest.fixture
+def single_site(make_pool):
+    pool = make_pool(3000, write=write_messy_csv, minutes=20)  # 2024-03-01 to mid April
+    with DatabaseConnection(pool) as conn:
+        yield conn
+
+def test_templates_match_metric_functions(single_site):
+    conn = single_site
+    cases = (
+        ("total energy in March 2024", "energy_kwh", calculate_total_energy(conn, start="2024-03-01", end="2024-03-31")),
+        ("peak power in March 2024", "peak_power_kw", calculate_peak_power(conn, start="2024-03-01", end="2024-03-31")),
+        ("specific yield in 2024", "specific_yield_kwh_kwp", calculate_specific_yield(conn, start="2024-01-01", end="2024-12-31")),
+        ("PR in April 2024", "pr_percent", calculate_temperature_corrected_pr(conn, start="2024-04-01", end="2024-04-30")),
+    )
+    for question, column, expected in cases:
+        _, df = template_value(conn, question)
+        assert df[column].iloc[0] == pytest.approx(expected, abs=0.011), question
+
+def test_monthly_breakdown_and_total(single_site):
+    conn = single_site
+    query, df = template_value(conn, "energy by month in 2024")
+    expected = calculate_total_energy(conn, "monthly", "2024-01-01", "2024-12-31")
+    assert list(df["period"]) == list(expected.index)
+    assert list(df["energy_kwh"]) == pytest.approx(list(expected), abs=0.011)
+    total = calculate_total_energy(conn, start="2024-01-01", end="2024-12-31")
+    assert df["total_energy_kwh"].iloc[0] == pytest.approx(total, abs=0.011)
+    answer = format_answer(query, df)
+    assert f"Total: {total:,.2f} kWh." in answer and "- 2024-03:" in answer
+
+def test_no_readings(single_site):
+    query, df = template_value(single_site, "total energy in 2019")
+    assert len(df) == 0 and format_answer(query, df) == "No readings in 2019."
+
+@pytest.fixture
+def fleet(tmp_path):
+    """Multi-site store: alpha (1000 kWp) from March 2024, beta (500 kWp) with rows starting a month later."""
+    from sites import ensure_site_store
+
+    sites_dir = tmp_path / "sites"
+    sites_dir.mkdir()
+    write_messy_csv(sites_dir / "alpha.csv", 3000, minutes=20)
+    write_messy_csv(sites_dir / "beta.csv", 3000, minutes=10)
+    lines = (sites_dir / "beta.csv").read_text(encoding="utf-8").splitlines(keepends=True)
+    (sites_dir / "beta.csv").write_text(lines[0] + "".join(lines[1:]).replace("2024-03-", "2024-04-"), encoding="utf-8")
+    (sites_dir / "sites.csv").write_text("site_id,p_stc_kw\nalpha,1000\nbeta,500\n", encoding="utf-8")
+    db_path = tmp_path / "fleet.duckdb"
+    ensure_site_store(str(db_path), str(sites_dir), dataset_dir=str(tmp_path / "dataset"), workers=1)
+    with duckdb.connect(str(db_path), read_only=True) as conn:
+        yield conn
+
+def test_site_templates_match_metric_functions(fleet):
+    conn = fleet
+    query, df = template_value(conn, "specific yield for beta in April 2024")
+    assert query.site_id == "beta" and query.p_stc == 500
+    expected = calculate_specific_yield(conn, start="2024-04-01", end="2024-04-30", site_id="beta")
+    assert df["specific_yield_kwh_kwp"].iloc[0] == pytest.approx(expected, abs=0.011)
+    query, df = template_value(conn, "PR in March 2024")
+    expected = calculate_temperature_corrected_pr(conn, start="2024-03-01", end="2024-03-31")
+    assert df["pr_percent"].iloc[0] == pytest.approx(expected, abs=0.011)
+
+def test_fleet_basis_names_the_reporting_sites(fleet):
+    query, df = template_value(fleet, "PR in March 2024")
+    assert query.reporting == (1, 2, 1000.0)
+    assert "capacity-weighted over the 1 of 2 sites with readings, 1,000.0 kWp" in format_answer(query, df)
+    query, df = template_value(fleet, "specific yield in April 2024")
+    assert query.reporting == (2, 2, 1500.0)
+    assert "(fleet-wide P_STC 1,500.0 kWp)" in format_answer(query, df)
@@ -0,0 +1,15 @@
+import pandas as pd
+import pytest
+from conftest import write_messy_csv
+from get_data import preprocess_data
+
+CHUNK_SIZES = (7, 50, 64, 1000)
+
+@pytest.mark.parametrize("chunksize", CHUNK_SIZES)
+def test_chunked_cleaning_matches_in_memory(tmp_path, chunksize):
+    path = tmp_path / "site.csv"
+    write_messy_csv(path)
+    expected = preprocess_data(str(path))
+    assert 0 < len(expected) < 400
+    assert expected["timestamp"].is_unique
+    pd.testing.assert_frame_equal(preprocess_data(str(path), chunksize=chunksize), expected)
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+from conftest import write_messy_csv
+from db import DatabaseConnection
+from get_data import (
+    DEFAULT_P_STC, calculate_peak_power, calculate_specific_yield, calculate_temperature_corrected_pr,
+    calculate_total_energy, preprocess_data,
+)
+
+AGGREGATIONS = ("default", "hourly", "daily", "monthly")
+GAMMA = -0.004
+# pandas frequencies, labelled by period start as the SQL breakdowns are
+FREQS = {"hourly": "h", "daily": "D", "monthly": "MS"}
+
+# Row-by-row pandas reference, as the metric functions computed before they moved to SQL
+def pandas_energy(df, aggregation):
+    if aggregation == "default":
+        return round(df["Energy_kWh"].sum(), 2)
+    return df["Energy_kWh"].resample(FREQS[aggregation]).sum().round(2)
+
+def pandas_pr(df, aggregation, p_stc=DEFAULT_P_STC):
+    denominator = p_stc * (df["Pyranometer_1"] / 1000) * (1 + GAMMA * (df["Temperature_Probe_1"] - 25))
+    if aggregation == "default":
+        return round(df["Energy_kWh"].sum() / denominator.sum() * 100, 2)
+    freq = FREQS[aggregation]
+    return (df["Energy_kWh"].resample(freq).sum() / denominator.resample(freq).sum() * 100).round(2)
+
+def pandas_peak(df, aggregation):
+    if aggregation == "default":
+        return round(df["Active_Power"].max(), 2)
+    return df["Active_Power"].resample(FREQS[aggregation]).max().round(2)
+
+def assert_same(actual, expected):
+    if isinstance(expected, pd.Series):
+        assert list(actual.index) == list(expected.index)
+        np.testing.assert_allclose(actual.to_numpy(float), expected.to_numpy(float), atol=0.011, equal_nan=True)
+    else:
+        assert actual == pytest.approx(expected, abs=0.011)
+
+@pytest.fixture
+def store(make_pool, tmp_path):
+    """(DatabaseConnection on the built store, the same cleaned rows as a timestamp-indexed frame)."""
+    pool = make_pool(3000, write=write_messy_csv, minutes=20)  # about six weeks: two months, many days
+    reference = preprocess_data(str(tmp_path / "solar.csv")).set_index("timestamp").sort_index()
+    with DatabaseConnection(pool) as conn:
+        yield conn, reference
+
+@pytest.mark.parametrize("aggregation", AGGREGATIONS)
+def test_sql_metrics_match_pandas(store, aggregation):
+    conn, df = store
+    assert_same(calculate_total_energy(conn, aggregation), pandas_energy(df, aggregation))
+    expected_yield = pandas_energy(df, aggregation) if aggregation == "default" else df["Energy_kWh"].resample(FREQS[aggregation]).sum()
+    assert_same(calculate_specific_yield(conn, aggregation=aggregation), np.round(expected_yield / DEFAULT_P_STC, 2))
+    assert_same(calculate_temperature_corrected_pr(conn, aggregation=aggregation), pandas_pr(df, aggregation))
+    assert_same(calculate_peak_power(conn, aggregation), pandas_peak(df, aggregation))
+
+@pytest.mark.parametrize("aggregation", AGGREGATIONS)
+def test_dataframe_input_matches_store(store, aggregation):
+    conn, df = store
+    frame = df.reset_index()
+    assert_same(calculate_total_energy(frame, aggregation), calculate_total_energy(conn, aggregation))
+    assert_same(calculate_temperature_corrected_pr(frame, aggregation=aggregation),
+                calculate_temperature_corrected_pr(conn, aggregation=aggregation))
+
+def test_pr_uses_the_given_capacity(store):
+    conn, df = store
+    assert_same(calculate_temperature_corrected_pr(conn, P_STC=500.0), pandas_pr(df, "default", p_stc=500.0))
+
+def test_breakdowns_are_labelled_by_period_start(store):
+    conn, _ = store
+    monthly = calculate_total_energy(conn, "monthly")
+    assert all(ts.day == 1 and ts.hour == 0 for ts in monthly.index)
+    assert monthly.index[0] == pd.Timestamp("2024-03-01")
@@ -0,0 +1,30 @@
+import os
+import pyarrow as pa
+from result_cache import _TOTAL_ROWS_KEY, ResultCache
+
+def make_table(i: int, rows: int = 1000):
+    table = pa.table({"n": pa.array(range(i, i + rows), pa.int64())})
+    return table.replace_schema_metadata({_TOTAL_ROWS_KEY: str(rows * 10).encode()})
+
+def make_cache(tmp_path, entries: int = 4) -> ResultCache:
+    """A cache whose memory holds ``entries`` tables of make_table's size; older ones spill to disk."""
+    return ResultCache(memory_budget=make_table(0).nbytes * entries, disk_dir=str(tmp_path))
+
+def test_spilled_entries_keep_total_rows(tmp_path):
+    cache = make_cache(tmp_path)
+    for i in range(6):
+        cache.put(f"SELECT {i}", "v1", make_table(i))
+    assert cache.spills >= 2 and os.listdir(tmp_path)
+    table = cache.get("select 0", "v1")  # spilled first, read back from Parquet
+    assert cache.hits_disk == 1
+    assert table.equals(make_table(0))
+    assert table.schema.metadata[_TOTAL_ROWS_KEY] == b"10000"
+
+def test_new_data_version_drops_memory_and_disk_entries(tmp_path):
+    cache = make_cache(tmp_path)
+    for i in range(6):
+        cache.put(f"SELECT {i}", "v1", make_table(i))
+    assert cache.get("SELECT 5", "v2") is None
+    assert cache.stats()["entries"] == 0
+    assert os.listdir(tmp_path) == []
+    assert cache.get("SELECT 0", "v1") is None  # gone, not just hidden
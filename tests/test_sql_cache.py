@@ -0,0 +1,22 @@
+from sql_cache import SQLCache
+
+def make_cache() -> SQLCache:
+    return SQLCache(path=None)
+
+def test_exact_match_is_reused():
+    cache = make_cache()
+    cache.put("What was the peak power in June 2024?", "p", "SELECT 1")
+    hit = cache.get("what was the peak power in june 2024", "p")
+    assert hit is not None and hit.kind == "exact"
+
+def test_reworded_question_is_reused():
+    cache = make_cache()
+    cache.put("What was the total energy in June 2024?", "p", "SELECT 1")
+    hit = cache.get("Show me the total energy in June 2024", "p")
+    assert hit is not None and hit.kind == "similar"
+
+def test_sort_direction_blocks_reuse():
+    # Without "ascending"/"descending" as slot words this pair scores 0.89, above the threshold
+    cache = make_cache()
+    cache.put("List daily peak power values for every day of March 2025 sorted ascending", "p", "SELECT 1 ORDER BY 1 ASC")
+    assert cache.get("List daily peak power values for every day of March 2025 sorted descending", "p") is None
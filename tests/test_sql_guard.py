@@ -0,0 +1,47 @@
+from db import MAX_RESULT_ROWS, DatabaseConnection
+from result_cache import cached_fetch
+from sql_guard import check_sql, guard_sql, rewrite_sql
+
+def test_select_is_allowed():
+    assert check_sql("SELECT max(Active_Power) FROM solar").ok
+
+def test_writes_are_blocked():
+    assert not check_sql("DELETE FROM solar").ok
+    assert not check_sql("SELECT 1; DROP TABLE solar").ok
+
+def test_week_between_keeps_the_whole_last_week(make_pool):
+    # date_trunc('week', ...) BETWEEN two Mondays includes every row of the second week
+    sql = ("SELECT count(*) AS n, avg(Active_Power) AS kw FROM solar "
+           "WHERE date_trunc('week', timestamp) BETWEEN '2024-01-08' AND '2024-01-15'")
+    with DatabaseConnection(make_pool(5000)) as conn:
+        checked = guard_sql(conn, sql)
+        assert checked.ok and "2024-01-16" not in checked.sql
+        assert conn.execute(checked.sql).fetchall() == conn.execute(sql).fetchall()
+
+def test_day_between_gets_a_timestamp_range():
+    checked = rewrite_sql("SELECT count(*) FROM solar WHERE CAST(timestamp AS DATE) BETWEEN '2024-01-08' AND '2024-01-15'")
+    assert checked.rewrites == ("timestamp_range",)
+    assert "timestamp < CAST('2024-01-16 00:00:00' AS TIMESTAMP)" in checked.sql
+
+def test_raw_query_over_row_cap_reports_true_total(make_pool):
+    rows = MAX_RESULT_ROWS + 50
+    with DatabaseConnection(make_pool(rows)) as conn:
+        checked = guard_sql(conn, "SELECT * FROM solar")
+        assert checked.ok and "limit" not in checked.sql.lower()
+        bounded = conn.fetch_bounded(checked.sql)
+        fetched = cached_fetch(conn, checked.sql)
+    assert bounded.truncated
+    assert bounded.total_rows == rows
+    assert bounded.table.num_rows == MAX_RESULT_ROWS
+    assert fetched.truncated and fetched.total_rows == rows
+
+def test_file_and_url_reads_are_blocked():
+    for sql in (
+        "SELECT * FROM read_csv('x.csv')",
+        "SELECT * FROM '/etc/passwd'",
+        "SELECT * FROM \"x.csv\"",
+        "SELECT * FROM 'https://example.com/data.parquet'",
+        "SELECT * FROM solar s JOIN '/etc/passwd' p ON true",
+    ):
+        assert not check_sql(sql).ok, sql
+    assert check_sql("WITH d AS (SELECT 1 AS x) SELECT * FROM d, range(3)").ok
@@ -0,0 +1,67 @@
+import duckdb
+import pandas as pd
+import pytest
+from conftest import write_csv
+from db import ensure_store
+from get_data import ROLLUP_TABLES
+
+def snapshot(db_path) -> dict:
+    """Row count, column sums and every rollup table of a built store."""
+    with duckdb.connect(str(db_path), read_only=True) as conn:
+        state = {"solar": conn.execute(
+            "SELECT count(*), count(DISTINCT timestamp), sum(Energy_kWh), sum(Active_Power), "
+            "min(timestamp), max(timestamp) FROM solar"
+        ).fetchone()}
+        for table in ROLLUP_TABLES.values():
+            state[table] = conn.execute(f"SELECT * FROM {table} ORDER BY ALL").fetchdf()
+    return state
+
+def assert_same_store(actual: dict, expected: dict) -> None:
+    (count, distinct, energy, power, first, last), want = actual["solar"], expected["solar"]
+    assert (count, distinct, first, last) == (want[0], want[1], want[4], want[5])
+    assert (energy, power) == pytest.approx((want[2], want[3]), rel=1e-9)
+    for table in ROLLUP_TABLES.values():
+        pd.testing.assert_frame_equal(actual[table], expected[table], check_exact=False, rtol=1e-9)
+
+def split_csv(path, rows: int, prefix_rows: int) -> tuple:
+    """(header + first ``prefix_rows`` lines, the remaining lines) of a write_csv file."""
+    write_csv(path, rows)
+    lines = path.read_text(encoding="utf-8").splitlines(keepends=True)
+    return "".join(lines[:prefix_rows + 1]), lines[prefix_rows + 1:]
+
+def full_build(tmp_path, text: str) -> dict:
+    csv_path, db_path = tmp_path / "full.csv", tmp_path / "full.duckdb"
+    csv_path.write_text(text, encoding="utf-8")
+    ensure_store(str(db_path), str(csv_path))
+    return snapshot(db_path)
+
+def test_append_matches_full_build(tmp_path, capsys):
+    prefix, rest = split_csv(tmp_path / "source.csv", 900, 600)
+    last_stored = prefix.splitlines()[-1]
+    # Re-sent rows: the last stored reading with other values, and a reading repeated within the tail
+    appended = [last_stored.split(",", 1)[0] + "," + rest[0].split(",", 1)[1]]
+    appended += rest[:100] + [rest[50]] + rest[100:]
+    csv_path, db_path = tmp_path / "site.csv", tmp_path / "site.duckdb"
+    csv_path.write_text(prefix, encoding="utf-8")
+    ensure_store(str(db_path), str(csv_path))
+    with open(csv_path, "a", encoding="utf-8") as f:
+        f.writelines(appended)
+    capsys.readouterr()
+    ensure_store(str(db_path), str(csv_path))
+    assert "Appended" in capsys.readouterr().out
+    assert_same_store(snapshot(db_path), full_build(tmp_path, prefix + "".join(appended)))
+
+def test_rewritten_source_falls_back_to_full_build(tmp_path, capsys):
+    prefix, rest = split_csv(tmp_path / "source.csv", 700, 500)
+    csv_path, db_path = tmp_path / "site.csv", tmp_path / "site.duckdb"
+    csv_path.write_text(prefix, encoding="utf-8")
+    ensure_store(str(db_path), str(csv_path))
+    # Change a stored reading and append: the prefix hash no longer matches
+    header, first, *others = prefix.splitlines(keepends=True)
+    first = first.replace(",2.0,", ",3.0,", 1)
+    changed = header + first + "".join(others) + "".join(rest)
+    csv_path.write_text(changed, encoding="utf-8")
+    capsys.readouterr()
+    ensure_store(str(db_path), str(csv_path))
+    assert "Built solar table" in capsys.readouterr().out
+    assert_same_store(snapshot(db_path), full_build(tmp_path, changed))
@@ -0,0 +1,392 @@
+import bisect
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Append every finished trace as one JSON line to this file (disabled when empty)
+TRACE_FILE = os.getenv("SOLAR_TRACE_FILE", "")
+# Serve the registry in Prometheus text format on this port (disabled when 0)
+METRICS_PORT = int(os.getenv("SOLAR_METRICS_PORT", "0"))
+# Collect DuckDB's rows-scanned counter for each query via its profiler
+TRACE_ROWS_SCANNED = os.getenv("SOLAR_TRACE_ROWS_SCANNED", "1") not in ("0", "false", "")
+RECENT_TRACES = 50
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+COUNT_BUCKETS = (1, 10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+
+class Histogram:
+    """Cumulative-bucket histogram, as exposed by Prometheus."""
+
+    def __init__(self, buckets=SECONDS_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimate by linear interpolation inside the bucket holding the q-th observation."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+class Registry:
+    """
+    In-process metrics: histograms and counters keyed by name and label set.
+
+    Collectors registered with ``add_collector`` are called at export time and return
+    ``(name, labels, value)`` gauges, e.g. the connection pool's current state.
+    """
+
+    def __init__(self):
+        self._histograms = {}
+        self._counters = {}
+        self._help = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, text: str) -> None:
+        self._help[name] = text
+
+    def observe(self, name: str, value: float, buckets=SECONDS_BUCKETS, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram(buckets)
+            hist.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def add_collector(self, collector: Callable) -> None:
+        self._collectors.append(collector)
+
+    def summary(self) -> list:
+        """One row per histogram series with count, mean and estimated percentiles (seconds or units)."""
+        with self._lock:
+            items = sorted(self._histograms.items())
+            return [
+                {
+                    "metric": name,
+                    **dict(labels),
+                    "count": hist.count,
+                    "mean": hist.sum / hist.count if hist.count else 0.0,
+                    "p50": hist.quantile(0.5),
+                    "p95": hist.quantile(0.95),
+                    "p99": hist.quantile(0.99),
+                }
+                for (name, labels), hist in items
+            ]
+
+    def counters(self) -> dict:
+        with self._lock:
+            return {_series(name, labels): value for (name, labels), value in sorted(self._counters.items())}
+
+    def prometheus_text(self) -> str:
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+        gauges = []
+        for collector in self._collectors:
+            try:
+                gauges.extend(collector())
+            except Exception:
+                continue
+
+        described = set()
+
+        def header(name, kind):
+            if name not in described:
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+                described.add(name)
+
+        for (name, labels), hist in histograms:
+            header(name, "histogram")
+            cumulative = 0
+            for bound, n in zip((*hist.buckets, "+Inf"), hist.counts):
+                cumulative += n
+                le = bound if bound == "+Inf" else _number(bound)
+                lines.append(f"{_series(name + '_bucket', (*labels, ('le', le)))} {cumulative}")
+            lines.append(f"{_series(name + '_sum', labels)} {_number(hist.sum)}")
+            lines.append(f"{_series(name + '_count', labels)} {hist.count}")
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append(f"{_series(name, labels)} {_number(value)}")
+        for name, labels, value in sorted(gauges, key=lambda g: g[0]):
+            header(name, "gauge")
+            lines.append(f"{_series(name, tuple(sorted(labels.items())))} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+def _series(name: str, labels) -> str:
+    if not labels:
+        return name
+    body = ",".join(f'{k}="{str(v)}"' for k, v in labels)
+    return f"{name}{{{body}}}"
+
+def _number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+REGISTRY = Registry()
+REGISTRY.describe("solar_stage_duration_seconds", "Time spent in each question pipeline stage")
+REGISTRY.describe("solar_rows_returned", "Rows returned by a stage")
+REGISTRY.describe("solar_rows_scanned", "Rows DuckDB scanned for a query")
+REGISTRY.describe("solar_llm_tokens_total", "Prompt and completion tokens by stage")
+REGISTRY.describe("solar_cache_lookups_total", "Cache lookups by stage and outcome")
+REGISTRY.describe("solar_errors_total", "Stages that raised or reported an error")
+REGISTRY.describe("solar_fast_path_total", "Questions answered by a fast_path template (hit) or sent to the LLM (miss)")
+REGISTRY.describe("solar_sql_repairs_total", "Failed queries sent back to sql_agent, by DuckDB error type")
+
+@dataclass
+class Span:
+    name: str
+    start: float = field(default_factory=time.perf_counter)
+    duration: float = 0.0
+    attrs: dict = field(default_factory=dict)
+    parent: Optional[str] = None
+
+    def set(self, **attrs) -> "Span":
+        self.attrs.update({k: v for k, v in attrs.items() if v is not None})
+        return self
+
+    def to_dict(self, origin: float) -> dict:
+        return {
+            "name": self.name,
+            "parent": self.parent,
+            "offset_ms": round((self.start - origin) * 1000, 3),
+            "duration_ms": round(self.duration * 1000, 3),
+            **self.attrs,
+        }
+
+class Trace:
+    """Spans recorded while answering one question."""
+
+    def __init__(self, question: str = ""):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.question = question
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.duration = 0.0
+        self.spans = []
+        self.finished = False
+        self._lock = threading.Lock()
+
+    def add(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def finish(self) -> None:
+        """Close the trace once; later calls are no-ops."""
+        with self._lock:
+            if self.finished:
+                return
+            self.finished = True
+            self.duration = time.perf_counter() - self.start
+        REGISTRY.observe("solar_stage_duration_seconds", self.duration, stage="total")
+        _RECENT.append(self)
+        if TRACE_FILE:
+            _write_trace(self)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start)
+        return {
+            "trace_id": self.trace_id,
+            "question": self.question,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 3),
+            "spans": [s.to_dict(self.start) for s in spans],
+        }
+
+_RECENT = deque(maxlen=RECENT_TRACES)
+_current_trace = contextvars.ContextVar("solar_trace", default=None)
+_current_span = contextvars.ContextVar("solar_span", default=None)
+_file_lock = threading.Lock()
+
+def recent_traces() -> list:
+    """Most recent finished traces, newest first."""
+    return list(reversed(_RECENT))
+
+def _write_trace(trace: Trace) -> None:
+    line = json.dumps(trace.to_dict(), default=str)
+    with _file_lock:
+        with open(TRACE_FILE, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+@contextmanager
+def use_trace(trace: Optional[Trace]):
+    """Make ``trace`` the one spans attach to inside this block (and threads that copy the context)."""
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+@contextmanager
+def span(name: str, **attrs):
+    """
+    Time a block as a pipeline stage.
+
+    The duration always feeds the ``solar_stage_duration_seconds`` histogram; the span
+    itself is kept on the current trace when there is one. Known attributes also feed
+    the row, token and cache metrics when the span ends.
+    """
+    s = start_span(name, **attrs)
+    token = _current_span.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.set(error=type(e).__name__)
+        raise
+    finally:
+        _current_span.reset(token)
+        end_span(s)
+
+def start_span(name: str, **attrs) -> Span:
+    """Open a span without making it current; close it with end_span (e.g. across generator yields)."""
+    parent = _current_span.get()
+    return Span(name, parent=parent.name if parent else None).set(**attrs)
+
+def end_span(s: Span, trace: Optional[Trace] = None) -> None:
+    """Record ``s`` in the registry and on ``trace`` (default: the current trace)."""
+    s.duration = time.perf_counter() - s.start
+    _record(s)
+    trace = trace or _current_trace.get()
+    if trace is not None:
+        trace.add(s)
+
+def annotate(**attrs) -> None:
+    """Set attributes on the innermost open span, if any."""
+    s = _current_span.get()
+    if s is not None:
+        s.set(**attrs)
+
+_startup = Trace("startup")
+
+@contextmanager
+def startup_stage(name: str):
+    """
+    Time one cold-start step (imports, opening the store, building the agents); see
+    startup_report. Only the first run of each step is recorded, so a block that
+    Streamlit re-executes on every rerun is reported once.
+    """
+    name = f"startup.{name}"
+    with _startup._lock:
+        seen = any(s.name == name for s in _startup.spans)
+    if seen:
+        yield None
+        return
+    with use_trace(_startup), span(name) as s:
+        yield s
+
+def startup_report() -> list:
+    """Cold-start steps recorded in this process so far, in the order they started."""
+    with _startup._lock:
+        spans = sorted(_startup.spans, key=lambda s: s.start)
+    return [{"stage": s.name.split(".", 1)[1], "ms": round(s.duration * 1000, 1), **s.attrs} for s in spans]
+
+def _record(s: Span) -> None:
+    REGISTRY.observe("solar_stage_duration_seconds", s.duration, stage=s.name)
+    a = s.attrs
+    if "rows_returned" in a:
+        REGISTRY.observe("solar_rows_returned", a["rows_returned"], COUNT_BUCKETS, stage=s.name)
+    if "rows_scanned" in a:
+        REGISTRY.observe("solar_rows_scanned", a["rows_scanned"], COUNT_BUCKETS, stage=s.name)
+    for kind in ("prompt_tokens", "completion_tokens"):
+        if a.get(kind):
+            REGISTRY.inc("solar_llm_tokens_total", a[kind], stage=s.name, type=kind.split("_")[0])
+    if "cache_hit" in a:
+        REGISTRY.inc("solar_cache_lookups_total", stage=s.name, hit=str(bool(a["cache_hit"])).lower())
+    if "error" in a:
+        REGISTRY.inc("solar_errors_total", stage=s.name)
+
+def usage_tokens(usage) -> dict:
+    """
+    prompt/completion token counts from a pydantic_ai run's ``usage`` (a method on older
+    releases, a property on newer ones; field names changed too).
+    """
+    if callable(usage):
+        usage = usage()
+    prompt = getattr(usage, "input_tokens", None)
+    if prompt is None:
+        prompt = getattr(usage, "request_tokens", None)
+    completion = getattr(usage, "output_tokens", None)
+    if completion is None:
+        completion = getattr(usage, "response_tokens", None)
+    return {"prompt_tokens": prompt or 0, "completion_tokens": completion or 0}
+
+_server = None
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = "127.0.0.1"):
+    """
+    Serve ``/metrics`` (Prometheus text) and ``/traces`` (recent traces as JSON) from a
+    daemon thread. Returns the server, or None when ``port`` is 0. Safe to call repeatedly.
+    """
+    global _server
+    if not port or _server is not None:
+        return _server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.startswith("/metrics"):
+                body, kind = REGISTRY.prometheus_text(), "text/plain; version=0.0.4"
+            elif self.path.startswith("/traces"):
+                body, kind = json.dumps([t.to_dict() for t in recent_traces()], default=str), "application/json"
+            else:
+                self.send_error(404)
+                return
+            data = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", kind)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    try:
+        _server = ThreadingHTTPServer((host, port), Handler)
+    except OSError as e:
+        # e.g. another Streamlit worker already serves the port
+        print(f"⚠️  Metrics endpoint not started on port {port}: {e}")
+        return None
+    threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+    print(f"✓ Metrics on http://{host}:{port}/metrics")
+    return _server